@@ -0,0 +1,284 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+
+from . import metrics
+
+# 전체 배포 및 사용자별 분당 토큰 한도 (버킷 용량 = 1분치)
+ADMISSION_GLOBAL_TPM = int(os.getenv("ADMISSION_GLOBAL_TPM", "1000000"))
+ADMISSION_USER_TPM = int(os.getenv("ADMISSION_USER_TPM", "60000"))
+# 응답 토큰 수를 모를 때 미리 잡아 두는 예상치 (완료 후 실제 사용량으로 정산)
+ADMISSION_EXPECTED_RESPONSE_TOKENS = int(os.getenv("ADMISSION_EXPECTED_RESPONSE_TOKENS", "1024"))
+# 우선순위별 최대 대기 인원
+ADMISSION_MAX_WAITERS = int(os.getenv("ADMISSION_MAX_WAITERS", "100"))
+# 사용자 버킷 보관 최대 개수 (넘으면 가득 찬 버킷부터 정리)
+ADMISSION_MAX_USERS = 10000
+
+# 사용자를 알 수 없는 요청이 함께 쓰는 버킷 (사용자별 한도를 건너뛰지 않음)
+ANONYMOUS_USER_KEY = "anonymous"
+# 서버 내부 작업(첫 단계 미리 만들기 등). 사용자 버킷 없이 전역 예산과 batch 우선순위의 여유분만 사용
+SYSTEM_USER_KEY = "system"
+
+# 우선순위 클래스 (숫자가 작을수록 우선)
+PRIORITY_TUTORING = 0
+PRIORITY_REPORT = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {PRIORITY_TUTORING: "tutoring", PRIORITY_REPORT: "report", PRIORITY_BATCH: "batch"}
+
+# 요청 유형별 우선순위 (목록에 없으면 batch)
+REQUEST_PRIORITIES = {
+    "tutor_ws": PRIORITY_TUTORING,
+    "step_by_step": PRIORITY_TUTORING,
+    "problem_solution": PRIORITY_TUTORING,
+    "direct_solution": PRIORITY_TUTORING,
+    "incorrect_answer_report": PRIORITY_REPORT,
+}
+
+# 우선순위별로 전역 버킷에 남겨 두어야 하는 비율 (낮은 우선순위는 여유가 있을 때만 사용)
+PRIORITY_RESERVE = {PRIORITY_TUTORING: 0.0, PRIORITY_REPORT: 0.2, PRIORITY_BATCH: 0.4}
+# 우선순위별 최대 대기 시간(초). 0이면 대기 없이 바로 거절
+PRIORITY_DEADLINE = {
+    PRIORITY_TUTORING: float(os.getenv("ADMISSION_TUTORING_DEADLINE", "10")),
+    PRIORITY_REPORT: float(os.getenv("ADMISSION_REPORT_DEADLINE", "30")),
+    PRIORITY_BATCH: float(os.getenv("ADMISSION_BATCH_DEADLINE", "0")),
+}
+
+class AdmissionRejected(HTTPException):
+    """토큰 예산을 초과해 요청을 받을 수 없을 때 발생하는 예외 (429 + Retry-After)"""
+
+    def __init__(self, retry_after: float, detail: str):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(status_code=429, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+class TokenBucket:
+    """초당 rate 만큼 채워지고 capacity 까지 쌓이는 토큰 버킷"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at')
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """amount를 꺼낸 뒤에도 reserve 이상 남으려면 몇 초 기다려야 하는지 반환합니다."""
+        needed = amount + reserve - self.tokens
+        if needed <= 0:
+            return 0.0
+        if amount + reserve > self.capacity:
+            # 한 번에 용량보다 큰 요청은 버킷이 가득 찼을 때만 허용 (빚으로 처리)
+            needed = self.capacity - self.tokens
+        return needed / self.rate if self.rate > 0 else float("inf")
+
+# 앞선 대기자가 있어 바로 받지 못할 때 돌려주는 대기 시간 (대기열에 넣고 바로 깨우기 시도)
+QUEUED_BEHIND_WAIT = 0.001
+
+class _Waiter:
+    """예산을 기다리는 요청 하나 (토큰을 차감한 뒤 future에 결과를 넣어 깨움)"""
+
+    __slots__ = ('priority', 'user_key', 'amount', 'future', 'started_at', 'expiry')
+
+    def __init__(self, priority: int, user_key: str, amount: float, future: asyncio.Future):
+        self.priority = priority
+        self.user_key = user_key
+        self.amount = amount
+        self.future = future
+        self.started_at = time.monotonic()
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+class AdmissionController:
+    """LLM 호출 전에 전역/사용자별 토큰 예산과 우선순위로 요청을 받을지 결정하는 클래스
+
+    예산이 없으면 우선순위별 대기열에 넣고, 버킷이 다시 찰 시각(또는 정산으로 토큰이 돌아올 때)에
+    높은 우선순위 대기열부터 앞에서 차례로 깨운다. 나중에 온 튜터링 요청도 먼저 기다리던 리포트/배치 요청보다 먼저 받는다.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(ADMISSION_GLOBAL_TPM)
+        self._users: Dict[str, TokenBucket] = {}
+        self._queues: Dict[int, Deque[_Waiter]] = {p: deque() for p in sorted(PRIORITY_NAMES)}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = float("inf")
+
+    def _user_bucket(self, user_key: str) -> Optional[TokenBucket]:
+        if user_key == SYSTEM_USER_KEY:
+            return None
+        bucket = self._users.get(user_key)
+        if bucket is None:
+            if len(self._users) >= ADMISSION_MAX_USERS:
+                now = time.monotonic()
+                for key, b in list(self._users.items()):
+                    b.refill(now)
+                    if b.tokens >= b.capacity:
+                        del self._users[key]
+            bucket = self._users[user_key] = TokenBucket(ADMISSION_USER_TPM)
+        return bucket
+
+    def _wait_times(self, priority: int, user_key: str, amount: float, now: float):
+        """(전역 버킷 대기 시간, 사용자 버킷 대기 시간, 사용자 버킷)을 반환합니다. 호출 전에 lock을 잡아야 합니다."""
+        self._global.refill(now)
+        global_wait = self._global.wait_time(amount, PRIORITY_RESERVE[priority] * self._global.capacity)
+        user_bucket = self._user_bucket(user_key)
+        user_wait = 0.0
+        if user_bucket is not None:
+            user_bucket.refill(now)
+            user_wait = user_bucket.wait_time(amount)
+        return global_wait, user_wait, user_bucket
+
+    def _take(self, amount: float, user_bucket: Optional[TokenBucket]) -> None:
+        self._global.tokens -= amount
+        if user_bucket is not None:
+            user_bucket.tokens -= amount
+
+    def _try_take(self, priority: int, user_key: str, amount: float) -> float:
+        """예산이 있고 같은 우선순위 이상의 대기자가 없으면 차감하고 0을, 아니면 기다려야 할 시간을 반환합니다."""
+        with self._lock:
+            global_wait, user_wait, user_bucket = self._wait_times(priority, user_key, amount, time.monotonic())
+            wait = max(global_wait, user_wait)
+            if wait > 0:
+                return wait
+            # 먼저 기다리던 같은/높은 우선순위 요청이 있으면 앞지르지 않고 대기열 뒤에 섬
+            if any(self._queues[p] for p in self._queues if p <= priority):
+                return QUEUED_BEHIND_WAIT
+            self._take(amount, user_bucket)
+            return 0.0
+
+    def _wake(self) -> None:
+        """높은 우선순위 대기열부터 예산이 되는 대기자를 받아들이고, 다음에 깨울 시각을 예약합니다."""
+        self._timer = None
+        self._timer_at = float("inf")
+        next_wait = float("inf")
+        admitted = []
+        with self._lock:
+            now = time.monotonic()
+            blocked = False
+            for priority, queue in self._queues.items():
+                if blocked:
+                    break
+                for waiter in list(queue):
+                    if waiter.future.done():
+                        queue.remove(waiter)
+                        continue
+                    global_wait, user_wait, user_bucket = self._wait_times(priority, waiter.user_key, waiter.amount, now)
+                    if global_wait > 0:
+                        # 전역 예산이 모자라면 이 대기자와 그보다 낮은 우선순위는 모두 기다림
+                        next_wait = min(next_wait, global_wait)
+                        blocked = True
+                        break
+                    if user_wait > 0:
+                        # 이 사용자의 한도만 막힌 경우 뒤의 다른 사용자는 계속 확인
+                        next_wait = min(next_wait, user_wait)
+                        continue
+                    self._take(waiter.amount, user_bucket)
+                    queue.remove(waiter)
+                    admitted.append(waiter)
+        for waiter in admitted:
+            if waiter.expiry is not None:
+                waiter.expiry.cancel()
+            waiter.future.set_result(waiter.amount)
+        if next_wait != float("inf"):
+            self._schedule_wake(next_wait)
+
+    def _schedule_wake(self, delay: float) -> None:
+        if self._loop is None:
+            return
+        at = time.monotonic() + delay
+        if self._timer is not None:
+            if self._timer_at <= at:
+                return
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = self._loop.call_later(delay, self._wake)
+
+    def _expire(self, waiter: _Waiter) -> None:
+        """최대 대기 시간이 지나도 받아들여지지 않은 대기자를 거절합니다."""
+        with self._lock:
+            queue = self._queues[waiter.priority]
+            if waiter.future.done() or waiter not in queue:
+                return
+            queue.remove(waiter)
+            global_wait, user_wait, _ = self._wait_times(waiter.priority, waiter.user_key, waiter.amount,
+                                                         time.monotonic())
+        waiter.future.set_exception(
+            AdmissionRejected(max(global_wait, user_wait), "요청이 많아 처리할 수 없습니다. 잠시 후 다시 시도해주세요.")
+        )
+
+    @staticmethod
+    def estimate_tokens(prompt: str, response_tokens: int = ADMISSION_EXPECTED_RESPONSE_TOKENS) -> int:
+        """프롬프트 길이로 이번 호출의 토큰 사용량을 추정합니다 (1 토큰 ≈ 4 문자)."""
+        return len(prompt) // 4 + response_tokens
+
+    async def admit(self, request_type: str, user_key: Optional[object], prompt: str,
+                    response_tokens: int = ADMISSION_EXPECTED_RESPONSE_TOKENS) -> int:
+        """예산 안에서 요청을 받아들이고 차감한 토큰 수를 반환합니다.
+
+        user_key는 서버에서 정한 값(검증된 사용자, 대화 주인, 클라이언트 IP)이어야 하며, 없으면 익명 버킷을 씁니다.
+        예산이 없으면 우선순위별 대기열에서 최대 대기 시간까지 기다리고, 그래도 안 되면 AdmissionRejected를 발생시킵니다.
+        """
+        priority = REQUEST_PRIORITIES.get(request_type, PRIORITY_BATCH)
+        priority_name = PRIORITY_NAMES[priority]
+        user_key = str(user_key) if user_key is not None else ANONYMOUS_USER_KEY
+        amount = self.estimate_tokens(prompt, response_tokens)
+        self._loop = asyncio.get_running_loop()
+
+        wait = self._try_take(priority, user_key, amount)
+        if wait == 0:
+            metrics.ADMISSION_DECISIONS.inc(1.0, priority_name, "admitted")
+            return amount
+
+        deadline = PRIORITY_DEADLINE[priority]
+        queue = self._queues[priority]
+        if wait > deadline or len(queue) >= ADMISSION_MAX_WAITERS:
+            metrics.ADMISSION_DECISIONS.inc(1.0, priority_name, "rejected")
+            raise AdmissionRejected(wait, "요청이 많아 처리할 수 없습니다. 잠시 후 다시 시도해주세요.")
+
+        waiter = _Waiter(priority, user_key, amount, self._loop.create_future())
+        with self._lock:
+            queue.append(waiter)
+        waiter.expiry = self._loop.call_later(deadline, self._expire, waiter)
+        self._schedule_wake(min(wait, deadline))
+        try:
+            await waiter.future
+        except AdmissionRejected:
+            metrics.ADMISSION_DECISIONS.inc(1.0, priority_name, "rejected")
+            raise
+        except asyncio.CancelledError:
+            waiter.expiry.cancel()
+            # 토큰을 차감해 깨운 직후 취소되었으면 돌려줌
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.settle(user_key, amount, 0)
+            raise
+        metrics.ADMISSION_WAIT.observe(time.monotonic() - waiter.started_at, priority_name)
+        metrics.ADMISSION_DECISIONS.inc(1.0, priority_name, "queued")
+        return amount
+
+    def settle(self, user_key: Optional[object], reserved: int, actual: int) -> None:
+        """실제 사용한 토큰 수와 예상치의 차이를 버킷에 반영합니다. 토큰이 돌아오면 대기자를 깨웁니다."""
+        delta = actual - reserved
+        if delta == 0:
+            return
+        user_key = str(user_key) if user_key is not None else ANONYMOUS_USER_KEY
+        with self._lock:
+            self._global.tokens = min(self._global.capacity, self._global.tokens - delta)
+            bucket = self._users.get(user_key)
+            if bucket is not None:
+                bucket.tokens = min(bucket.capacity, bucket.tokens - delta)
+            has_waiters = any(self._queues.values())
+        if delta < 0 and has_waiters and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake)
+
+# 전역 승인 제어 인스턴스
+admission = AdmissionController()
@@ -0,0 +1,316 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 카탈로그 변경 표시를 확인하는 간격(초)
+CATALOG_CHECK_INTERVAL = int(os.getenv("CATALOG_CHECK_INTERVAL", "60"))
+
+PROBLEM_COLUMNS = (
+    "p_id, book_id, p_code, p_name, p_page, num_in_page, "
+    "p_img_url, main_chapt, sub_chapt, con_type, con_id, "
+    "p_type, p_level, p_text, answer, solution, sol_img_url, "
+    "sub_cat, created_date, data"
+)
+
+SIM_PROBLEM_COLUMNS = (
+    "sim_p_id, p_name, p_page, num_in_page, p_img_url, main_chapt, sub_chapt, "
+    "con_type, p_type, p_level, p_text, answer, solution"
+)
+
+# 단원별 목록 응답에 포함되는 컬럼 (기존 SQL의 SELECT 목록과 동일)
+CHAPTER_LIST_FIELDS = (
+    'p_id', 'p_code', 'p_name', 'p_page', 'num_in_page',
+    'p_type', 'p_level', 'p_text', 'answer', 'solution'
+)
+SEARCH_FIELDS = (
+    'p_id', 'p_code', 'p_name', 'p_page', 'num_in_page',
+    'main_chapt', 'sub_chapt', 'p_type', 'p_level', 'p_text', 'answer', 'solution'
+)
+
+CONCEPT_COLUMNS = "con_id, con_type, tb_con, tb_sub_con"
+
+# 스냅샷에 적재하는 테이블 (변경 표시 트리거 대상)
+CATALOG_TABLES = ("problems", "sim_problems", "problem_sim_map", "textbook_concept", "problem_concept_map")
+
+# 카탈로그 테이블이 바뀔 때마다 트리거가 올리는 테이블별 변경 번호
+# (유사문제/개념/매핑 테이블에는 수정 시각 컬럼이 없어 주기 확인은 이 번호만 읽음)
+VERSION_SCHEMA = f"""
+SELECT pg_advisory_xact_lock(hashtext('catalog_version'));
+CREATE TABLE IF NOT EXISTS catalog_version (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO catalog_version (table_name)
+SELECT unnest(ARRAY{list(CATALOG_TABLES)}) ON CONFLICT (table_name) DO NOTHING;
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+""" + "".join(
+    f"CREATE OR REPLACE TRIGGER catalog_version_bump AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table} "
+    f"FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();\n"
+    for table in CATALOG_TABLES
+)
+VERSION_QUERY = "SELECT table_name, version FROM catalog_version ORDER BY table_name"
+# 트리거를 설치할 권한이 없을 때: 테이블별 누적 변경 건수 통계 (테이블을 읽지 않음, TRUNCATE는 감지하지 못함)
+STATS_VERSION_QUERY = """
+SELECT relname, n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables
+WHERE relname = ANY(%s) ORDER BY relname
+"""
+
+# 스냅샷에 적재하는 컬럼 전체의 내용 해시 (테이블 전체를 읽으므로 관리자 강제 재적재 때만 계산)
+CONTENT_HASH_QUERY = f"""
+SELECT
+  (SELECT md5(string_agg(ROW({PROBLEM_COLUMNS})::text, '|' ORDER BY p_id)) FROM problems) AS problems_hash,
+  (SELECT md5(string_agg(ROW({SIM_PROBLEM_COLUMNS})::text, '|' ORDER BY sim_p_id)) FROM sim_problems) AS sim_problems_hash,
+  (SELECT md5(string_agg(p_id || ':' || sim_p_id, ',' ORDER BY p_id, sim_p_id)) FROM problem_sim_map) AS sim_map_hash,
+  (SELECT md5(string_agg(ROW({CONCEPT_COLUMNS})::text, '|' ORDER BY con_id)) FROM textbook_concept) AS concepts_hash,
+  (SELECT md5(string_agg(p_id || ':' || con_id, ',' ORDER BY p_id, con_id)) FROM problem_concept_map) AS concept_map_hash
+"""
+
+def _page_sort_key(problem: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (problem.get('p_page') or 0, str(problem.get('num_in_page') or ''))
+
+class CatalogSnapshot:
+    """문제 카탈로그의 읽기 전용 스냅샷
+
+    한 번 만들어진 스냅샷은 변경하지 않는다. 갱신은 새 스냅샷을 만들어 참조를 교체하는 방식으로 한다.
+    """
+
+    __slots__ = (
+        'version', 'content_hash', 'loaded_at', 'problems', 'by_page_number', 'by_chapter',
+        'concepts', 'concepts_by_problem', 'problems_by_concept',
+        'sim_problems', 'sim_by_problem', 'search_index'
+    )
+
+    def __init__(self, version: Tuple[Any, ...], problems: List[Dict[str, Any]],
+                 sim_problems: List[Dict[str, Any]], sim_map: List[Dict[str, Any]],
+                 concepts: List[Dict[str, Any]], concept_map: List[Dict[str, Any]],
+                 content_hash: Optional[str] = None):
+        self.version = version
+        self.content_hash = content_hash
+        self.loaded_at = datetime.now()
+
+        ordered = sorted(problems, key=_page_sort_key)
+        self.problems: Dict[int, Dict[str, Any]] = {p['p_id']: p for p in ordered}
+
+        self.by_page_number: Dict[Tuple[int, str], int] = {}
+        chapters: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        for p in ordered:
+            self.by_page_number.setdefault((p.get('p_page'), str(p.get('num_in_page'))), p['p_id'])
+            main_chapt = p.get('main_chapt')
+            chapters.setdefault((main_chapt, None), []).append(p['p_id'])
+            if p.get('sub_chapt'):
+                chapters.setdefault((main_chapt, p['sub_chapt']), []).append(p['p_id'])
+        self.by_chapter: Dict[Tuple[str, Optional[str]], Tuple[int, ...]] = {
+            key: tuple(ids) for key, ids in chapters.items()
+        }
+
+        self.concepts: Dict[int, Dict[str, Any]] = {c['con_id']: c for c in concepts}
+        concepts_by_problem: Dict[int, List[int]] = {}
+        problems_by_concept: Dict[int, List[int]] = {}
+        for row in concept_map:
+            if row['con_id'] not in self.concepts:
+                continue
+            concepts_by_problem.setdefault(row['p_id'], []).append(row['con_id'])
+            problems_by_concept.setdefault(row['con_id'], []).append(row['p_id'])
+        concept_order = lambda con_id: (
+            self.concepts[con_id].get('con_type') or '',
+            self.concepts[con_id].get('tb_con') or '',
+            self.concepts[con_id].get('tb_sub_con') or ''
+        )
+        self.concepts_by_problem: Dict[int, Tuple[int, ...]] = {
+            p_id: tuple(sorted(set(ids), key=concept_order)) for p_id, ids in concepts_by_problem.items()
+        }
+        self.problems_by_concept: Dict[int, Tuple[int, ...]] = {
+            con_id: tuple(sorted(set(ids))) for con_id, ids in problems_by_concept.items()
+        }
+
+        self.sim_problems: Dict[int, Dict[str, Any]] = {s['sim_p_id']: s for s in sim_problems}
+        sim_by_problem: Dict[int, List[int]] = {}
+        for row in sim_map:
+            if row['sim_p_id'] in self.sim_problems:
+                sim_by_problem.setdefault(row['p_id'], []).append(row['sim_p_id'])
+        self.sim_by_problem: Dict[int, Tuple[int, ...]] = {
+            p_id: tuple(ids) for p_id, ids in sim_by_problem.items()
+        }
+
+        # ILIKE 검색을 대신하는 소문자 검색 대상 문자열 (p_page, num_in_page 순서)
+        self.search_index: Tuple[Tuple[int, str], ...] = tuple(
+            (p['p_id'], "\x00".join(
+                str(p.get(field) or '') for field in ('p_text', 'p_name', 'main_chapt', 'sub_chapt')
+            ).lower())
+            for p in ordered
+        )
+
+    def get_problem(self, p_id: int) -> Optional[Dict[str, Any]]:
+        problem = self.problems.get(p_id)
+        return dict(problem) if problem else None
+
+    def get_problem_by_page_and_number(self, p_page: int, num_in_page: str) -> Optional[Dict[str, Any]]:
+        try:
+            p_page = int(p_page)
+        except (TypeError, ValueError):
+            return None
+        p_id = self.by_page_number.get((p_page, str(num_in_page)))
+        if p_id is None:
+            return None
+        problem = dict(self.problems[p_id])
+        con_ids = self.concepts_by_problem.get(p_id)
+        concept = self.concepts[con_ids[0]] if con_ids else {}
+        problem['tb_con'] = concept.get('tb_con')
+        problem['tb_sub_con'] = concept.get('tb_sub_con')
+        return problem
+
+    def get_problems_by_chapter(self, main_chapt: str, sub_chapt: Optional[str] = None) -> List[Dict[str, Any]]:
+        p_ids = self.by_chapter.get((main_chapt, sub_chapt or None), ())
+        return [{field: self.problems[p_id].get(field) for field in CHAPTER_LIST_FIELDS} for p_id in p_ids]
+
+    def get_concepts(self, p_id: int) -> List[Dict[str, Any]]:
+        return [dict(self.concepts[con_id]) for con_id in self.concepts_by_problem.get(p_id, ())]
+
+    def get_similar_problems(self, p_id: int) -> List[Dict[str, Any]]:
+        return [dict(self.sim_problems[sim_p_id]) for sim_p_id in self.sim_by_problem.get(p_id, ())]
+
+    def search(self, keyword: str, limit: int = 10) -> List[Dict[str, Any]]:
+        needle = keyword.lower()
+        results = []
+        for p_id, haystack in self.search_index:
+            if needle in haystack:
+                problem = self.problems[p_id]
+                results.append({field: problem.get(field) for field in SEARCH_FIELDS})
+                if len(results) >= limit:
+                    break
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "loaded_at": self.loaded_at.isoformat(),
+            "problems": len(self.problems),
+            "sim_problems": len(self.sim_problems),
+            "concepts": len(self.concepts),
+            "chapters": len(self.by_chapter)
+        }
+        if self.content_hash is not None:
+            stats["content_hash"] = self.content_hash
+        return stats
+
+class CatalogStore:
+    """카탈로그 스냅샷을 로드하고 원자적으로 교체하는 클래스"""
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[CatalogSnapshot], None]] = []
+        self._checked_at = 0.0
+        # 변경 표시 방식: "trigger" | "stats" (첫 적재 때 결정)
+        self._version_source: Optional[str] = None
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """현재 스냅샷을 반환합니다. 아직 로드되지 않았으면 None입니다."""
+        return self._snapshot
+
+    def add_listener(self, listener: Callable[[CatalogSnapshot], None]) -> None:
+        """스냅샷이 교체될 때 호출될 콜백을 등록합니다."""
+        self._listeners.append(listener)
+        if self._snapshot is not None:
+            listener(self._snapshot)
+
+    def _ensure_version_triggers(self) -> None:
+        """변경 번호 테이블과 트리거를 설치합니다. 권한이 없으면 테이블 통계로 변경을 확인합니다."""
+        if self._version_source is not None:
+            return
+        conn = db_manager.new_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(VERSION_SCHEMA)
+            conn.commit()
+            self._version_source = "trigger"
+        except Exception as e:
+            conn.rollback()
+            logger.warning(f"카탈로그 변경 트리거 설치 실패 (테이블 통계로 확인): {e}")
+            self._version_source = "stats"
+        finally:
+            conn.close()
+
+    def fetch_version(self, cursor) -> Tuple[Any, ...]:
+        """카탈로그 테이블의 변경 표시를 반환합니다 (테이블 내용은 읽지 않음)."""
+        if self._version_source == "trigger":
+            cursor.execute(VERSION_QUERY)
+        else:
+            cursor.execute(STATS_VERSION_QUERY, (list(CATALOG_TABLES),))
+        return (self._version_source,) + tuple(tuple(row.values()) for row in cursor.fetchall())
+
+    @staticmethod
+    def fetch_content_hash(cursor) -> str:
+        cursor.execute(CONTENT_HASH_QUERY)
+        return ":".join(str(value) for value in cursor.fetchone().values())
+
+    def load(self, force: bool = False, content_hash: bool = False) -> bool:
+        """DB에서 카탈로그를 읽어 새 스냅샷으로 교체합니다. 교체했으면 True를 반환합니다.
+
+        content_hash=True면 적재한 내용 전체의 해시도 계산합니다 (관리자 재적재에서 워커 간 내용 비교용).
+        """
+        with self._lock:
+            start_time = time.time()
+            self._ensure_version_triggers()
+            # 요청 처리용 공유 연결의 트랜잭션을 건드리지 않도록 적재 전용 연결을 사용하고,
+            # 변경 표시와 테이블들을 같은 시점에서 읽도록 읽기 전용 REPEATABLE READ 트랜잭션 하나로 읽음
+            conn = db_manager.new_connection()
+            try:
+                conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                with conn.cursor() as cursor:
+                    version = self.fetch_version(cursor)
+                    if not force and self._snapshot is not None and self._snapshot.version == version:
+                        self._checked_at = time.monotonic()
+                        return False
+
+                    cursor.execute(f"SELECT {PROBLEM_COLUMNS} FROM problems")
+                    problems = [dict(row) for row in cursor.fetchall()]
+                    cursor.execute(f"SELECT {SIM_PROBLEM_COLUMNS} FROM sim_problems")
+                    sim_problems = [dict(row) for row in cursor.fetchall()]
+                    cursor.execute("SELECT p_id, sim_p_id FROM problem_sim_map ORDER BY p_id, sim_p_id")
+                    sim_map = cursor.fetchall()
+                    cursor.execute(f"SELECT {CONCEPT_COLUMNS} FROM textbook_concept")
+                    concepts = [dict(row) for row in cursor.fetchall()]
+                    cursor.execute("SELECT p_id, con_id FROM problem_concept_map")
+                    concept_map = cursor.fetchall()
+                    digest = self.fetch_content_hash(cursor) if content_hash else None
+            finally:
+                # 읽기 전용 트랜잭션은 연결을 닫으면 롤백됨 (중간에 실패해도 남는 트랜잭션 없음)
+                conn.close()
+
+            snapshot = CatalogSnapshot(version, problems, sim_problems, sim_map, concepts, concept_map, digest)
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+
+        logger.info(f"카탈로그 스냅샷 교체: {snapshot.stats()} ({time.time() - start_time:.2f}초)")
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"카탈로그 리스너 오류: {e}")
+        return True
+
+    def check_version(self) -> bool:
+        """카탈로그 버전이 바뀌었으면 다시 로드합니다."""
+        if self._snapshot is not None and time.monotonic() - self._checked_at < CATALOG_CHECK_INTERVAL:
+            return False
+        try:
+            return self.load()
+        except Exception as e:
+            logger.error(f"카탈로그 버전 확인 오류: {e}")
+            self._checked_at = time.monotonic()
+            return False
+
+# 전역 카탈로그 인스턴스
+catalog = CatalogStore()
@@ -54,3 +54,26 @@ class ConversationReport(BaseModel):
     p_level: str
     full_chat_log: Optional[List[Dict[str, Any]]] = None
     message_time: datetime
+
+class FullChatLogResponse(BaseModel):
+    conversation_id: str
+    full_chat_log: Optional[Any] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+# 오답 리포트 조회 응답 모델 (reports 테이블 한 행)
+class ReportRecord(BaseModel):
+    report_id: int
+    conversation_id: str
+    user_id: int
+    p_id: int
+    created_at: datetime
+    generated_at: Optional[datetime] = None
+    status: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    response_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    report_type: Optional[str] = None
+    language: Optional[str] = None
+    learning_stats: Optional[Dict[str, Any]] = None
+    full_report_content: Optional[str] = None
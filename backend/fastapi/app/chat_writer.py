@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from . import metrics
+from .database import db_manager
+from .services import ChatService
+
+logger = logging.getLogger(__name__)
+
+# 첫 메시지가 들어온 뒤 배치를 모으는 최대 시간(ms)과 배치당 최대 행 수
+CHAT_WRITE_BATCH_MS = float(os.getenv("CHAT_WRITE_BATCH_MS", "10"))
+CHAT_WRITE_BATCH_ROWS = int(os.getenv("CHAT_WRITE_BATCH_ROWS", "200"))
+# false면 모으지 않고 메시지마다 바로 저장 (배치 크기 1)
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "true").lower() == "true"
+# 종료 시 남은 메시지를 저장하며 기다리는 최대 시간(초)
+CHAT_WRITE_SHUTDOWN_TIMEOUT = float(os.getenv("CHAT_WRITE_SHUTDOWN_TIMEOUT", "10"))
+
+class ChatWriteBuffer:
+    """채팅 메시지를 요청 간에 모아서 다중 행 INSERT 한 번으로 저장하는 write-behind 버퍼
+
+    - submit()은 저장이 커밋되면 chat_id로 완료되는 Future를 반환합니다 (저장 확인이 필요하면 await).
+    - 저장은 한 번에 하나의 배치만 진행하므로, DB가 느릴수록 다음 배치가 커져 커밋 수가 줄어듭니다.
+    - 같은 대화를 읽기 전에 wait_for()를 호출하면 아직 저장 중인 메시지가 커밋될 때까지 기다립니다 (read-your-writes).
+    - 배치가 실패하면(잘못된 conversation_id, p_id 등) 한 건씩 다시 저장해 문제가 된 메시지만 실패시킵니다.
+    - 저장은 요청 처리용 공유 연결이 아닌 버퍼 전용 연결에서 합니다.
+    """
+
+    def __init__(self, batch_ms: float = CHAT_WRITE_BATCH_MS,
+                 max_rows: int = CHAT_WRITE_BATCH_ROWS if CHAT_WRITE_BEHIND else 1):
+        self.delay = batch_ms / 1000.0
+        self.max_rows = max(1, max_rows)
+        self._queue: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        # 대화별 아직 커밋되지 않은 메시지의 Future
+        self._pending: Dict[str, Set[asyncio.Future]] = {}
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        # 저장 전용 연결 (한 번에 하나의 배치만 저장하므로 스레드 간에 동시에 쓰이지 않음)
+        self._conn = None
+
+    def submit(self, conversation_id: str, user_id: int, p_id: int, sender_role: str, message: str,
+               message_type: str = "text", created_at: Optional[datetime] = None) -> asyncio.Future:
+        """메시지를 저장 대기열에 넣고, 커밋되면 chat_id로 완료되는 Future를 반환합니다."""
+        if self._closing:
+            raise RuntimeError("채팅 메시지 저장 버퍼가 종료되었습니다.")
+        future = asyncio.get_running_loop().create_future()
+        row = {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "p_id": p_id,
+            "sender_role": sender_role,
+            "message": message,
+            "message_type": message_type,
+            # 메시지 순서는 저장 시각이 아니라 받은 시각 기준
+            "created_at": created_at or datetime.now()
+        }
+        self._queue.append((row, future))
+        pending = self._pending.setdefault(conversation_id, set())
+        pending.add(future)
+        future.add_done_callback(lambda f: self._on_done(conversation_id, f))
+
+        if self._task is None or self._task.done():
+            # 이벤트는 실행 중인 루프에 묶이므로 저장 태스크를 시작할 때 새로 만듦
+            self._wakeup, self._full = asyncio.Event(), asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        if len(self._queue) >= self.max_rows:
+            self._full.set()
+        self._wakeup.set()
+        return future
+
+    async def save(self, conversation_id: str, user_id: int, p_id: int, sender_role: str, message: str,
+                   message_type: str = "text") -> int:
+        """메시지를 저장하고 커밋될 때까지 기다려 chat_id를 반환합니다."""
+        return await self.submit(conversation_id, user_id, p_id, sender_role, message, message_type)
+
+    def _on_done(self, conversation_id: str, future: asyncio.Future) -> None:
+        pending = self._pending.get(conversation_id)
+        if pending is not None:
+            pending.discard(future)
+            if not pending:
+                del self._pending[conversation_id]
+        # 기다리는 쪽이 없어도 "exception was never retrieved" 경고가 나지 않도록 확인 처리
+        if not future.cancelled():
+            future.exception()
+
+    async def wait_for(self, conversation_id: str) -> None:
+        """해당 대화의 저장 대기 중인 메시지가 모두 커밋(또는 실패)될 때까지 기다립니다."""
+        pending = self._pending.get(conversation_id)
+        if pending:
+            await asyncio.gather(*list(pending), return_exceptions=True)
+
+    def pending_count(self) -> int:
+        return len(self._queue)
+
+    async def _run(self) -> None:
+        while self._queue or not self._closing:
+            await self._wakeup.wait()
+            # 첫 메시지 이후 delay 동안, 또는 max_rows가 찰 때까지 더 모음
+            if len(self._queue) < self.max_rows and not self._closing:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self._queue = self._queue[:self.max_rows], self._queue[self.max_rows:]
+            self._full.clear()
+            if not self._queue:
+                self._wakeup.clear()
+            elif len(self._queue) >= self.max_rows:
+                self._full.set()
+            if batch:
+                await self._flush(batch)
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = db_manager.new_connection()
+        return self._conn
+
+    def _write(self, rows: List[Dict[str, Any]]) -> List[Union[int, Exception]]:
+        """배치를 저장하고 행마다 chat_id 또는 예외를 반환합니다 (스레드에서 실행)."""
+        try:
+            conn = self._connection()
+            return ChatService.save_chat_batch(conn, rows)
+        except Exception as e:
+            # 연결 자체가 실패했거나 한 건짜리 배치면 다시 시도해도 같은 결과
+            if len(rows) == 1 or self._conn is None or self._conn.closed:
+                return [e] * len(rows)
+            logger.warning(f"채팅 메시지 일괄 저장 실패, 한 건씩 다시 저장: {len(rows)}건, {e}")
+        results: List[Union[int, Exception]] = []
+        for row in rows:
+            try:
+                results.extend(ChatService.save_chat_batch(self._connection(), [row]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        start_time = time.perf_counter()
+        results = await asyncio.to_thread(self._write, [row for row, _ in batch])
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        if failed:
+            logger.error(f"채팅 메시지 저장 오류: {failed}/{len(batch)}건 실패")
+            metrics.CHAT_WRITE_ROWS.inc(failed, "failed")
+        if failed < len(batch):
+            metrics.CHAT_WRITE_BATCH_SIZE.observe(len(batch))
+            metrics.CHAT_WRITE_FLUSH_DURATION.observe(time.perf_counter() - start_time)
+            metrics.CHAT_WRITE_ROWS.inc(len(batch) - failed, "stored")
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self) -> None:
+        """남은 메시지를 모두 저장하고 버퍼를 닫습니다 (종료 시 호출)."""
+        if self._task is None or self._task.done():
+            return
+        self._closing = True
+        self._wakeup.set()
+        self._full.set()
+        try:
+            await asyncio.wait_for(self._task, CHAT_WRITE_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"종료 시 채팅 메시지 저장 시간 초과: {len(self._queue)}건 저장하지 못함")
+        finally:
+            # 같은 프로세스에서 앱을 다시 시작하면(테스트 등) 새 저장 태스크로 이어서 사용
+            self._closing = False
+            # 시간 초과로 저장 중인 배치가 남아 있으면 연결을 그대로 둠
+            if self._task.done() and self._conn is not None and not self._conn.closed:
+                self._conn.close()
+                self._conn = None
+
+# 전역 채팅 메시지 저장 버퍼
+chat_writer = ChatWriteBuffer()
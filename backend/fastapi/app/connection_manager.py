@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import WebSocket
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 워커당 최대 동시 연결 수와 사용자당 최대 연결 수 (넘으면 가장 오래된 연결을 닫음)
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "5000"))
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "3"))
+# 하트비트 간격(초). 이 시간 동안 보낸 것이 없으면 ping 메시지를 보냄
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))
+# 클라이언트로부터 메시지(pong 포함)가 이 시간(초) 동안 없으면 연결을 닫음
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "600"))
+# 한 메시지 전송 대기 한도(초). 넘으면 느린 클라이언트로 보고 연결을 닫음
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# 연결당 분당 메시지 수와 메시지 최대 길이
+WS_MAX_MESSAGES_PER_MINUTE = int(os.getenv("WS_MAX_MESSAGES_PER_MINUTE", "20"))
+WS_MAX_MESSAGE_CHARS = int(os.getenv("WS_MAX_MESSAGE_CHARS", "4000"))
+
+WS_PING_TEXT = '{"type": "ping"}'
+WS_PONG_TEXT = "pong"
+
+# 종료 코드 (4000번대는 애플리케이션 정의)
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_REPLACED = 4000
+CLOSE_IDLE_TIMEOUT = 4408
+
+class Connection:
+    """웹소켓 연결 하나의 상태 (유휴 연결을 많이 들고 있어도 가볍도록 타이머 태스크 없이 시각만 기록)"""
+
+    __slots__ = ('ws', 'user_id', 'session_id', 'connected_at', 'last_received', 'last_sent',
+                 'generation', 'recent', 'send_lock', 'closed')
+
+    def __init__(self, ws: WebSocket, user_id: str, session_id: str):
+        now = time.monotonic()
+        self.ws = ws
+        self.user_id = user_id
+        self.session_id = session_id
+        self.connected_at = now
+        self.last_received = now
+        self.last_sent = now
+        # 진행 중인 응답 생성 태스크 (연결당 최대 1개)
+        self.generation: Optional[asyncio.Task] = None
+        # 최근 1분 동안 받은 메시지 시각
+        self.recent = deque(maxlen=max(1, WS_MAX_MESSAGES_PER_MINUTE))
+        self.send_lock = asyncio.Lock()
+        self.closed = False
+
+    def touch(self) -> None:
+        self.last_received = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return self.generation is not None and not self.generation.done()
+
+    async def send(self, text: str) -> bool:
+        """메시지를 보냅니다. 연결이 끊겼거나 WS_SEND_TIMEOUT 안에 보내지 못하면 False를 반환합니다."""
+        if self.closed:
+            return False
+        try:
+            async with self.send_lock:
+                await asyncio.wait_for(self.ws.send_text(text), WS_SEND_TIMEOUT)
+            self.last_sent = time.monotonic()
+            return True
+        except asyncio.TimeoutError:
+            metrics.WEBSOCKET_EVENTS.inc(1.0, "send_timeout")
+            await self.close(CLOSE_TRY_AGAIN_LATER)
+            return False
+        except Exception:
+            self.closed = True
+            return False
+
+    async def close(self, code: int) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.ws.close(code=code)
+        except Exception:
+            pass
+
+class ConnectionManager:
+    """튜터 웹소켓 연결을 관리하는 클래스
+
+    - 워커/사용자별 연결 수 제한
+    - 연결당 응답 생성은 하나만 진행하고, 새 메시지가 오면 이전 생성을 취소 (대기열이 쌓이지 않음)
+    - 연결별 타이머 대신 하나의 하트비트 태스크가 주기적으로 ping 전송과 유휴 연결 정리를 담당
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._connections: Dict[int, Connection] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    async def connect(self, ws: WebSocket, user_id: str, session_id: str) -> Optional[Connection]:
+        """연결을 수락하고 등록합니다. 워커 연결 수가 가득 차면 거절하고 None을 반환합니다."""
+        if len(self._connections) >= WS_MAX_CONNECTIONS:
+            metrics.WEBSOCKET_EVENTS.inc(1.0, "rejected")
+            await ws.close(code=CLOSE_TRY_AGAIN_LATER)
+            return None
+        await ws.accept()
+
+        user_connections = sorted((c for c in self._connections.values() if c.user_id == user_id),
+                                  key=lambda c: c.connected_at)
+        for old in user_connections[:max(0, len(user_connections) - WS_MAX_CONNECTIONS_PER_USER + 1)]:
+            metrics.WEBSOCKET_EVENTS.inc(1.0, "replaced")
+            await old.close(CLOSE_REPLACED)
+
+        connection = Connection(ws, user_id, session_id)
+        self._connections[id(connection)] = connection
+        metrics.WEBSOCKET_CONNECTIONS.set(len(self._connections), self.endpoint)
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        return connection
+
+    def disconnect(self, connection: Connection) -> None:
+        """연결을 해제하고 진행 중인 응답 생성을 취소합니다."""
+        connection.closed = True
+        self._cancel_generation(connection)
+        self._connections.pop(id(connection), None)
+        metrics.WEBSOCKET_CONNECTIONS.set(len(self._connections), self.endpoint)
+
+    def allow_message(self, connection: Connection) -> bool:
+        """연결당 분당 메시지 수 제한을 확인하고 받은 메시지를 기록합니다."""
+        now = time.monotonic()
+        recent = connection.recent
+        if len(recent) == recent.maxlen and now - recent[0] < 60:
+            metrics.WEBSOCKET_EVENTS.inc(1.0, "rate_limited")
+            return False
+        recent.append(now)
+        return True
+
+    def _cancel_generation(self, connection: Connection) -> None:
+        if connection.busy:
+            connection.generation.cancel()
+
+    def submit(self, connection: Connection, generate: Callable[..., Awaitable[None]], *args: Any) -> None:
+        """generate(*args)로 응답 생성을 시작합니다. 이전 생성이 아직 진행 중이면 취소합니다 (새 메시지가 이전 메시지를 대체)."""
+        if connection.busy:
+            metrics.WEBSOCKET_EVENTS.inc(1.0, "superseded")
+            self._cancel_generation(connection)
+        connection.generation = asyncio.create_task(self._run_generation(generate, *args))
+
+    async def _run_generation(self, generate: Callable[..., Awaitable[None]], *args: Any) -> None:
+        metrics.WEBSOCKET_GENERATIONS_IN_FLIGHT.inc(1.0, self.endpoint)
+        try:
+            await generate(*args)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"웹소켓 응답 생성 오류: {e}")
+        finally:
+            metrics.WEBSOCKET_GENERATIONS_IN_FLIGHT.dec(1.0, self.endpoint)
+
+    async def _heartbeat_loop(self) -> None:
+        """주기적으로 유휴 연결을 닫고, 최근 보낸 것이 없는 연결에 ping을 보냅니다."""
+        while self._connections:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            pings = []
+            for connection in list(self._connections.values()):
+                if connection.closed:
+                    continue
+                if now - connection.last_received > WS_IDLE_TIMEOUT and not connection.busy:
+                    metrics.WEBSOCKET_EVENTS.inc(1.0, "idle_timeout")
+                    pings.append(connection.close(CLOSE_IDLE_TIMEOUT))
+                elif now - connection.last_sent >= WS_HEARTBEAT_INTERVAL:
+                    pings.append(connection.send(WS_PING_TEXT))
+            if pings:
+                await asyncio.gather(*pings, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": len(self._connections),
+            "users": len({c.user_id for c in self._connections.values()}),
+            "generating": sum(1 for c in self._connections.values() if c.busy)
+        }
+
+# 전역 튜터 웹소켓 연결 관리자
+tutor_connections = ConnectionManager("tutor")
@@ -3,9 +3,13 @@ from psycopg2.extras import RealDictCursor
 from typing import List, Dict, Optional, Any
 import logging
 import os
+import time
+from .metrics import record_db_query
+from .tracing import record_span
+from .logging_config import configure_logging
 
 # 로깅 설정
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # PostgreSQL 설정
@@ -14,6 +18,29 @@ DB_PORT = os.getenv("DB_PORT", "5434")
 DB_NAME = os.getenv("DB_NAME", "test")
 DB_USER = os.getenv("DB_USER", "moon")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "moon1")
+# true면 응답에 그대로 내보내는 JSONB 컬럼(full_chat_log)을 ::text로 읽어 파싱/재인코딩 없이 전달
+RAW_JSONB_PASSTHROUGH = os.getenv("RAW_JSONB_PASSTHROUGH", "false").lower() == "true"
+
+class InstrumentedCursor(RealDictCursor):
+    """쿼리 실행 시간을 메트릭과 요청 trace에 기록하는 커서"""
+
+    def execute(self, query, vars=None):
+        start_time = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            record_db_query(elapsed)
+            record_span("db.query", elapsed)
+
+    def executemany(self, query, vars_list):
+        start_time = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            record_db_query(elapsed)
+            record_span("db.query", elapsed)
 
 class DatabaseManager:
     """PostgreSQL 데이터베이스 연결 및 관리 클래스"""
@@ -21,23 +48,37 @@ class DatabaseManager:
     def __init__(self):
         self.connection = None
     
+    @staticmethod
+    def _connect():
+        try:
+            return psycopg2.connect(
+                host=DB_HOST,
+                port=DB_PORT,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                cursor_factory=InstrumentedCursor
+            )
+        except Exception as e:
+            logger.error(f"데이터베이스 연결 오류: {e}")
+            raise Exception(f"데이터베이스 연결 실패: {e}")
+
     def get_connection(self):
         """데이터베이스 연결을 반환합니다."""
         if self.connection is None or self.connection.closed:
-            try:
-                self.connection = psycopg2.connect(
-                    host=DB_HOST,
-                    port=DB_PORT,
-                    database=DB_NAME,
-                    user=DB_USER,
-                    password=DB_PASSWORD,
-                    cursor_factory=RealDictCursor
-                )
-                logger.info("PostgreSQL 데이터베이스에 연결되었습니다.")
-            except Exception as e:
-                logger.error(f"데이터베이스 연결 오류: {e}")
-                raise Exception(f"데이터베이스 연결 실패: {e}")
+            self.connection = self._connect()
+            logger.info("PostgreSQL 데이터베이스에 연결되었습니다.")
         return self.connection
+
+    def new_connection(self, autocommit: bool = False):
+        """요청 처리용 공유 연결과 별개인 새 연결을 만듭니다 (닫는 것은 호출한 쪽 책임).
+
+        공유 연결은 autocommit이 아니므로 백그라운드 스레드에서 commit/rollback하면 다른 요청의 트랜잭션까지
+        확정하거나 버리게 됩니다. 백그라운드 작업은 이 연결을 사용합니다.
+        """
+        conn = self._connect()
+        conn.autocommit = autocommit
+        return conn
     
     def close_connection(self):
         """데이터베이스 연결을 닫습니다."""
@@ -0,0 +1,86 @@
+import json
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson이 없으면 표준 json으로 동작
+    orjson = None
+
+class RawJSON:
+    """이미 JSON으로 인코딩된 값 (DB에서 ::text로 읽은 JSONB 등). 응답 본문에 다시 인코딩하지 않고 그대로 넣는다."""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+
+    def loads(self) -> Any:
+        """서버에서 내용을 확인해야 할 때만 파싱합니다."""
+        return orjson.loads(self.data) if orjson else json.loads(self.data)
+
+    def as_list(self) -> "RawJSON":
+        """배열은 그대로, 객체 하나는 배열로 감싸고, 그 밖의 값(null 등)은 빈 배열로 바꿉니다."""
+        head = self.data.lstrip()[:1]
+        if head == b"[":
+            return self
+        if head == b"{":
+            return RawJSON(b"[" + self.data + b"]")
+        return RawJSON(b"[]")
+
+class _Splicer:
+    """인코딩 중 만난 RawJSON을 자리표시 문자열로 바꿔 두었다가 원본 바이트로 교체한다."""
+
+    __slots__ = ('fragments', 'token')
+
+    def __init__(self):
+        self.fragments: Dict[bytes, bytes] = {}
+        # 응답 데이터에 같은 문자열이 들어 있어도 겹치지 않도록 호출마다 다른 토큰 사용
+        self.token = uuid.uuid4().hex
+
+    def default(self, value: Any) -> Any:
+        if isinstance(value, RawJSON):
+            placeholder = f"\x00raw:{self.token}:{len(self.fragments)}\x00"
+            self.fragments[json.dumps(placeholder).encode("utf-8")] = value.data
+            return placeholder
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, BaseModel):
+            return value.model_dump()
+        if isinstance(value, (set, frozenset, tuple)):
+            return list(value)
+        # 아래는 orjson이 없을 때만 필요 (orjson은 datetime/UUID를 직접 인코딩)
+        if isinstance(value, (datetime, date, time)):
+            return value.isoformat()
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        raise TypeError(f"JSON으로 변환할 수 없는 타입: {type(value).__name__}")
+
+    def splice(self, body: bytes) -> bytes:
+        for placeholder, data in self.fragments.items():
+            body = body.replace(placeholder, data, 1)
+        return body
+
+def dumps(content: Any) -> bytes:
+    """datetime, UUID, Decimal, RawJSON을 포함한 값을 UTF-8 JSON 바이트로 인코딩합니다."""
+    splicer = _Splicer()
+    if orjson is not None:
+        body = orjson.dumps(content, default=splicer.default, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(content, default=splicer.default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return splicer.splice(body) if splicer.fragments else body
+
+class FastJSONResponse(JSONResponse):
+    """jsonable_encoder를 거치지 않고 한 번에 인코딩하는 JSON 응답
+
+    큰 채팅 로그/리포트 응답에서 중간 dict 복사와 문자열 변환을 줄이기 위해 사용한다.
+    엔드포인트에서 이 응답을 직접 반환하면 response_model 검증도 건너뛰므로 response_model은 문서용이다.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
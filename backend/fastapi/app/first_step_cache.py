@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import record_cache
+from .shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+# 문제당 미리 만들어 두는 첫 단계 응답 수 (요청마다 돌아가며 사용)
+FIRST_STEP_VARIANTS = int(os.getenv("FIRST_STEP_VARIANTS", "2"))
+# 미리 만든 응답 보관 시간(초). 문제나 프롬프트가 바뀌면 키가 달라지므로 오래된 항목은 만료로 정리됨
+FIRST_STEP_TTL = float(os.getenv("FIRST_STEP_TTL", str(7 * 24 * 3600)))
+# 미리 만들기 작업의 동시 LLM 호출 수
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+# 시작 시 인기 문제의 첫 단계를 미리 만들지 여부와 대상 문제 수
+PREWARM_ON_STARTUP = os.getenv("PREWARM_ON_STARTUP", "false").lower() == "true"
+PREWARM_POPULAR_LIMIT = int(os.getenv("PREWARM_POPULAR_LIMIT", "100"))
+
+# 첫 단계 응답 한 개: (문제 p_id, 시작 프롬프트)
+PrewarmJob = Tuple[int, str]
+# 프롬프트를 받아 {"text", "prompt_tokens", "response_tokens"}를 만드는 함수
+OpeningGenerator = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+class FirstStepCache:
+    """단계별 풀이 첫 단계("시작") 응답을 모델별로 미리 만들어 공유 상태에 저장하는 캐시
+
+    시작 요청의 프롬프트는 문제마다 항상 같으므로 프롬프트 해시와 모델 이름을 키로 사용한다.
+    """
+
+    def __init__(self):
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @staticmethod
+    def key(prompt: str, model_name: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:32]
+        return f"first_step:{model_name}:{digest}"
+
+    def get(self, prompt: str, model_name: str) -> Optional[Dict[str, Any]]:
+        """저장된 첫 단계 응답 중 하나를 반환합니다. 없으면 None을 반환합니다."""
+        try:
+            entry = shared_state.get(self.key(prompt, model_name))
+        except Exception as e:
+            logger.error(f"첫 단계 캐시 조회 오류: {e}")
+            entry = None
+        variants = entry.get("variants") if entry else None
+        record_cache("first_step", bool(variants))
+        if not variants:
+            return None
+        return {**random.choice(variants), "model": entry.get("model", model_name)}
+
+    def put(self, prompt: str, model_name: str, variants: List[Dict[str, Any]]) -> None:
+        shared_state.set(self.key(prompt, model_name), {
+            "model": model_name,
+            "created_at": time.time(),
+            "variants": variants
+        }, ttl=FIRST_STEP_TTL)
+
+    def has(self, prompt: str, model_name: str) -> bool:
+        entry = shared_state.get(self.key(prompt, model_name))
+        return bool(entry and entry.get("variants"))
+
+    async def prewarm(self, jobs: Iterable[PrewarmJob], model_name: str, generate: OpeningGenerator,
+                      variants: int = FIRST_STEP_VARIANTS, force: bool = False) -> Dict[str, int]:
+        """각 문제의 첫 단계 응답을 variants개씩 만들어 저장하고 처리 결과 개수를 반환합니다."""
+        if self._running:
+            raise RuntimeError("첫 단계 미리 만들기가 이미 실행 중입니다.")
+        self._running = True
+        stats = {"stored": 0, "skipped": 0, "failed": 0}
+        semaphore = asyncio.Semaphore(PREWARM_CONCURRENCY)
+
+        async def generate_one(prompt: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await generate(prompt)
+
+        async def warm(p_id: int, prompt: str) -> None:
+            try:
+                if not force and await asyncio.to_thread(self.has, prompt, model_name):
+                    stats["skipped"] += 1
+                    return
+                results = await asyncio.gather(*(generate_one(prompt) for _ in range(max(1, variants))),
+                                               return_exceptions=True)
+                openings = [r for r in results if isinstance(r, dict)]
+                if not openings:
+                    stats["failed"] += 1
+                    return
+                await asyncio.to_thread(self.put, prompt, model_name, openings)
+                stats["stored"] += 1
+            except Exception as e:
+                logger.error(f"첫 단계 미리 만들기 오류: p_id={p_id}, {e}")
+                stats["failed"] += 1
+
+        try:
+            start_time = time.time()
+            await asyncio.gather(*(warm(p_id, prompt) for p_id, prompt in jobs))
+            logger.info(f"첫 단계 미리 만들기 완료: 모델={model_name}, {stats}, {time.time() - start_time:.1f}초")
+            return stats
+        finally:
+            self._running = False
+
+# 전역 첫 단계 캐시 인스턴스
+first_step_cache = FirstStepCache()
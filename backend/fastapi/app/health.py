@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 의존성 검사 주기와 검사 하나의 제한 시간(초)
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "15"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "5"))
+# 검사 결과가 이보다 오래되면(검사 루프가 멈춘 경우) 실패로 간주
+HEALTH_STALE_AFTER = HEALTH_CHECK_INTERVAL * 3
+# 이 검사들이 모두 성공해야 준비 완료(/ready 200)로 봄. 나머지는 상태만 보고
+READY_REQUIRED_CHECKS = tuple(c for c in os.getenv("READY_REQUIRED_CHECKS", "database").split(",") if c)
+
+# 검사 함수: 성공하면 추가 정보(dict 또는 None)를 반환하고, 실패하면 예외를 발생시킴
+HealthCheck = Callable[[], Optional[Dict[str, Any]]]
+
+class HealthMonitor:
+    """DB, LLM 제공자, JWKS 등 의존성을 백그라운드에서 주기적으로 검사하고 결과를 캐시하는 클래스
+
+    프로브(/health, /ready)는 캐시된 결과만 읽으므로 요청마다 I/O를 하지 않는다.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._checks: Dict[str, Tuple[HealthCheck, bool]] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, check: HealthCheck, required: Optional[bool] = None) -> None:
+        """검사를 등록합니다. required를 생략하면 READY_REQUIRED_CHECKS에 포함되는지로 정합니다."""
+        self._checks[name] = (check, name in READY_REQUIRED_CHECKS if required is None else required)
+
+    async def run_check(self, name: str) -> Dict[str, Any]:
+        """검사 하나를 스레드에서 실행하고 결과를 캐시합니다."""
+        check, _ = self._checks[name]
+        start_time = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(asyncio.to_thread(check), HEALTH_CHECK_TIMEOUT)
+            result = {"ok": True, **(detail or {})}
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"{HEALTH_CHECK_TIMEOUT}초 안에 응답 없음"}
+        except Exception as e:
+            result = {"ok": False, "error": str(e).strip()}
+        if not result["ok"] and self._results.get(name, {}).get("ok", True):
+            logger.warning(f"의존성 검사 실패 ({name}): {result['error']}")
+        result["latency_ms"] = round((time.perf_counter() - start_time) * 1000, 1)
+        result["checked_at"] = time.time()
+        self._results[name] = result
+        metrics.HEALTH_CHECK_UP.set(1.0 if result["ok"] else 0.0, name)
+        return result
+
+    async def run_all(self) -> None:
+        await asyncio.gather(*(self.run_check(name) for name in self._checks))
+
+    def start(self) -> None:
+        """주기적 검사 루프를 시작합니다 (이미 실행 중이면 무시)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_all()
+            except Exception as e:
+                logger.error(f"의존성 검사 루프 오류: {e}")
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    def _fresh(self, result: Dict[str, Any]) -> bool:
+        return time.time() - result["checked_at"] <= HEALTH_STALE_AFTER
+
+    @property
+    def ready(self) -> bool:
+        """필수 검사가 모두 최근에 성공했는지 반환합니다."""
+        for name, (_, required) in self._checks.items():
+            result = self._results.get(name)
+            if required and not (result and result["ok"] and self._fresh(result)):
+                return False
+        return True
+
+    def uptime(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        checks = {}
+        for name, (_, required) in self._checks.items():
+            result = self._results.get(name)
+            if result is None:
+                checks[name] = {"ok": False, "required": required, "error": "아직 검사하지 않음"}
+                continue
+            checks[name] = {
+                **result,
+                "required": required,
+                "age_seconds": round(now - result["checked_at"], 1),
+                "stale": not self._fresh(result)
+            }
+        return {"ready": self.ready, "checks": checks}
+
+# 전역 의존성 상태 모니터
+health_monitor = HealthMonitor()
@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli가 없으면 gzip만 사용
+    brotli = None
+
+# 이 크기(바이트) 이상인 응답만 압축
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# 이 크기 이상이면 이벤트 루프를 막지 않도록 스레드에서 압축
+COMPRESS_THREAD_THRESHOLD = 64 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+def make_etag(*parts: Any) -> str:
+    """리소스 버전을 나타내는 값들로 약한 ETag를 만듭니다 (압축 여부와 무관하게 같은 값)."""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def _http_date(value: datetime) -> str:
+    # DB의 timezone 없는 시각은 서버 로컬 시각으로 간주
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None,
+                      cache_control: str = "private, no-cache") -> Dict[str, str]:
+    """ETag, Last-Modified, Cache-Control 응답 헤더를 만듭니다. no-cache는 매번 재검증(304)하라는 뜻입니다."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if isinstance(last_modified, datetime):
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None,
+                 cache_control: str = "private, no-cache") -> Optional[Response]:
+    """조건부 요청 헤더가 현재 버전과 일치하면 304 응답을, 아니면 None을 반환합니다."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match가 있으면 If-Modified-Since는 무시 (RFC 9110), ETag는 약한 비교
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        matched = "*" in tags or etag.removeprefix("W/") in tags
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if not if_modified_since or not isinstance(last_modified, datetime):
+            return None
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP 날짜는 초 단위까지만 표현
+        matched = last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+    if not matched:
+        return None
+    return Response(status_code=304, headers=validator_headers(etag, last_modified, cache_control))
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding 헤더에서 br(가능하면) 또는 gzip을 고릅니다."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """클라이언트가 지원하는 방식(br/gzip)으로 큰 텍스트 응답을 압축하는 ASGI 미들웨어
+
+    본문이 한 번에 전송되는 응답만 압축하고, 스트리밍 응답(파일, SSE 등)과 이미 인코딩된 응답은 그대로 보낸다.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                # 스트리밍 응답은 압축하지 않고 그대로 전달
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            content_type = headers.get("content-type", "")
+            compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+            if compressible:
+                headers.add_vary_header("Accept-Encoding")
+            if (compressible and len(body) >= self.minimum_size and "content-encoding" not in headers
+                    and start_message["status"] not in (204, 206, 304)):
+                if len(body) >= COMPRESS_THREAD_THRESHOLD:
+                    body = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
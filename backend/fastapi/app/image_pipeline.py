@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.staticfiles import StaticFiles
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow가 없으면 파생 이미지 없이 원본만 제공
+    Image = None
+
+if Image is not None:
+    try:
+        import pillow_avif  # noqa: F401  (AVIF 플러그인이 있으면 등록)
+    except ImportError:
+        pass
+
+logger = logging.getLogger(__name__)
+
+# 원본 업로드 이미지와 파생 이미지 디렉터리
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/static/uploads")
+IMAGE_DERIVED_DIR = os.getenv("IMAGE_DERIVED_DIR", "/app/static/derived")
+# 파생 이미지 가로 폭 구간 (모바일 1x/2x/태블릿)
+IMAGE_WIDTHS = tuple(int(w) for w in os.getenv("IMAGE_WIDTHS", "320,640,1024").split(",") if w.strip())
+# 선호 순서 (앞쪽이 더 작은 포맷). 현재 Pillow에서 저장할 수 없는 포맷은 건너뜀
+IMAGE_FORMATS = ("avif", "webp")
+IMAGE_QUALITY = {"avif": 50, "webp": 75}
+# 시작 시 백그라운드로 파생 이미지를 만들지 여부
+IMAGE_PIPELINE_ON_STARTUP = os.getenv("IMAGE_PIPELINE_ON_STARTUP", "true").lower() == "true"
+
+SOURCE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+MANIFEST_NAME = "manifest.json"
+
+# 원본(파일명에 해시 없음)과 파생 이미지(파일명에 내용 해시 포함)의 캐시 정책
+ORIGINAL_CACHE_CONTROL = "public, max-age=86400"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+class CachedStaticFiles(StaticFiles):
+    """Cache-Control 헤더를 붙여 주는 StaticFiles (Range 요청과 파일 읽기 스레드 처리는 StaticFiles 그대로)"""
+
+    def __init__(self, *args, cache_control: str = ORIGINAL_CACHE_CONTROL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
+
+def available_formats() -> Tuple[str, ...]:
+    """현재 Pillow로 저장할 수 있는 파생 이미지 포맷을 반환합니다."""
+    if Image is None:
+        return ()
+    Image.init()
+    return tuple(fmt for fmt in IMAGE_FORMATS if fmt.upper() in Image.SAVE)
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ImagePipeline:
+    """업로드된 문제 이미지를 폭 구간별 WebP/AVIF로 미리 변환하고 요청에 맞는 파일을 골라 주는 클래스
+
+    파생 이미지 파일명에는 원본 내용 해시가 들어가므로 /img 아래 경로는 영구 캐시(immutable)할 수 있다.
+    변환 결과는 manifest.json에 기록하고, 원본의 크기/수정 시각이 같으면 다시 변환하지 않는다.
+    manifest에 없는 이전 해시의 파생 이미지는 변환이 끝날 때 지운다.
+    """
+
+    def __init__(self, upload_dir: str = UPLOAD_DIR, derived_dir: str = IMAGE_DERIVED_DIR):
+        self.upload_dir = upload_dir
+        self.derived_dir = derived_dir
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.derived_dir, MANIFEST_NAME)
+
+    def load_manifest(self) -> None:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+        except FileNotFoundError:
+            self._manifest = {}
+        except (OSError, ValueError) as e:
+            logger.error(f"이미지 manifest 로드 오류: {e}")
+            self._manifest = {}
+
+    def _save_manifest(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _sources(self) -> List[str]:
+        sources = []
+        for root, _, files in os.walk(self.upload_dir):
+            for name in files:
+                if name.lower().endswith(SOURCE_EXTENSIONS):
+                    sources.append(os.path.relpath(os.path.join(root, name), self.upload_dir).replace(os.sep, "/"))
+        return sorted(sources)
+
+    def _derive(self, rel_path: str, formats: Tuple[str, ...]) -> Dict[str, Any]:
+        source_path = os.path.join(self.upload_dir, rel_path)
+        stat = os.stat(source_path)
+        content_hash = _file_hash(source_path)
+        stem = os.path.splitext(rel_path)[0]
+        entry = {"hash": content_hash, "size": stat.st_size, "mtime": stat.st_mtime, "variants": {}}
+
+        with Image.open(source_path) as image:
+            image.load()
+            entry["width"] = image.width
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "P") else "RGB")
+            # 원본보다 큰 구간은 만들지 않되, 원본 폭 자체는 가장 큰 구간으로 포함
+            widths = sorted({w for w in IMAGE_WIDTHS if w < image.width} | {min(image.width, max(IMAGE_WIDTHS))})
+            for fmt in formats:
+                variants = {}
+                for width in widths:
+                    derived_rel = f"{stem}.{content_hash}.w{width}.{fmt}"
+                    derived_path = os.path.join(self.derived_dir, derived_rel)
+                    if not os.path.exists(derived_path):
+                        os.makedirs(os.path.dirname(derived_path), exist_ok=True)
+                        height = max(1, round(image.height * width / image.width))
+                        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                        tmp_path = derived_path + ".tmp"
+                        resized.save(tmp_path, format=fmt.upper(), quality=IMAGE_QUALITY[fmt])
+                        os.replace(tmp_path, derived_path)
+                    variants[str(width)] = derived_rel
+                entry["variants"][fmt] = variants
+        return entry
+
+    def build(self, force: bool = False) -> Dict[str, int]:
+        """업로드 디렉터리 전체의 파생 이미지를 만들고 manifest를 갱신합니다 (블로킹, 스레드에서 호출)."""
+        formats = available_formats()
+        if not formats:
+            logger.warning("Pillow가 없거나 WebP/AVIF 저장을 지원하지 않아 이미지 변환을 건너뜁니다.")
+            return {"converted": 0, "unchanged": 0, "failed": 0, "removed": 0}
+        with self._lock:
+            if self._running:
+                raise RuntimeError("이미지 변환이 이미 실행 중입니다.")
+            self._running = True
+        try:
+            start_time = time.time()
+            os.makedirs(self.derived_dir, exist_ok=True)
+            previous = dict(self._manifest)
+            manifest = {}
+            stats = {"converted": 0, "unchanged": 0, "failed": 0}
+            for rel_path in self._sources():
+                try:
+                    stat = os.stat(os.path.join(self.upload_dir, rel_path))
+                    old = previous.get(rel_path)
+                    if (not force and old and old.get("size") == stat.st_size and old.get("mtime") == stat.st_mtime
+                            and set(old.get("variants", {})) >= set(formats)):
+                        manifest[rel_path] = old
+                        stats["unchanged"] += 1
+                        continue
+                    manifest[rel_path] = self._derive(rel_path, formats)
+                    stats["converted"] += 1
+                except Exception as e:
+                    logger.error(f"이미지 변환 오류: {rel_path}, {e}")
+                    stats["failed"] += 1
+            self._save_manifest(manifest)
+            self._manifest = manifest
+            stats["removed"] = self._prune(manifest)
+            logger.info(f"이미지 변환 완료: {stats}, {time.time() - start_time:.1f}초")
+            return stats
+        finally:
+            self._running = False
+
+    def _prune(self, manifest: Dict[str, Dict[str, Any]]) -> int:
+        """manifest가 가리키지 않는 파생 이미지(원본이 바뀌거나 지워진 이전 해시)를 삭제하고 삭제한 파일 수를 반환합니다."""
+        referenced = {MANIFEST_NAME}
+        for entry in manifest.values():
+            for variants in entry.get("variants", {}).values():
+                referenced.update(variants.values())
+        removed = 0
+        for root, _, files in os.walk(self.derived_dir, topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.derived_dir).replace(os.sep, "/") in referenced:
+                    continue
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    logger.error(f"파생 이미지 삭제 오류: {path}, {e}")
+            # 비게 된 하위 디렉터리 정리
+            if root != self.derived_dir and not os.listdir(root):
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+        return removed
+
+    @staticmethod
+    def _accepts(accept: str, fmt: str) -> bool:
+        return MIME_TYPES[fmt] in accept
+
+    def select(self, rel_path: str, width: Optional[int], accept: str) -> Optional[Tuple[str, str, str]]:
+        """요청 폭과 Accept 헤더에 맞는 파생 이미지 (경로, MIME 타입, 내용 해시)를 반환합니다. 없으면 None."""
+        entry = self._manifest.get(rel_path)
+        if not entry:
+            return None
+        for fmt in IMAGE_FORMATS:
+            variants = entry.get("variants", {}).get(fmt)
+            if not variants or not self._accepts(accept, fmt):
+                continue
+            widths = sorted(int(w) for w in variants)
+            # 요청 폭 이상인 가장 작은 구간, 없으면 가장 큰 구간
+            chosen = next((w for w in widths if width is not None and w >= width), widths[-1])
+            return os.path.join(self.derived_dir, variants[str(chosen)]), MIME_TYPES[fmt], entry["hash"]
+        return None
+
+    def original_path(self, rel_path: str) -> Optional[str]:
+        """업로드 디렉터리 밖을 가리키지 않는 원본 파일 경로를 반환합니다."""
+        root = os.path.realpath(self.upload_dir)
+        path = os.path.realpath(os.path.join(root, rel_path))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+# 전역 이미지 파이프라인 인스턴스
+image_pipeline = ImagePipeline()
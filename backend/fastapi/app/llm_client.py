@@ -0,0 +1,325 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from . import metrics
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 재시도 설정 (full jitter 지수 백오프)
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "8"))
+# 요청 하나가 LLM에 쓸 수 있는 최대 시간(초, 재시도 포함)
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# 헤지 요청: 첫 요청이 이 시간(없으면 최근 p95) 안에 끝나지 않으면 같은 요청을 한 번 더 보냄
+LLM_HEDGE_TYPES = {t.strip() for t in os.getenv("LLM_HEDGE_TYPES", "").split(",") if t.strip()}
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "0"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+# LLM 호출(블로킹 스트리밍)을 실행하는 스레드 수. 기본 실행기를 다른 작업과 나눠 쓰지 않도록 별도로 둠
+LLM_MAX_THREADS = int(os.getenv("LLM_MAX_THREADS", "32"))
+# 회로 차단기: 연속 실패 횟수와 차단 유지 시간(초)
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# 가짜 모델 설정 (PROVIDER=fake)
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+
+# 재시도할 수 있는 HTTP 상태 코드 (google.api_core 예외는 .code에 HTTP 상태를 가짐)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_THREADS, thread_name_prefix="llm")
+
+class GenerationCancelled(Exception):
+    """헤지에서 지거나 시간이 초과되어 더 이상 필요 없는 생성을 중단할 때 발생하는 예외"""
+
+class LLMError(HTTPException):
+    """LLM 응답을 만들 수 없을 때 발생하는 예외 (오류 문자열 대신 503 등으로 응답)"""
+
+    def __init__(self, detail: str, status_code: int = 503, retry_after: Optional[float] = None):
+        headers = {"Retry-After": str(max(1, int(retry_after + 0.999)))} if retry_after else None
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
+
+def is_retryable(error: BaseException) -> bool:
+    """일시적인 오류(429, 5xx, 타임아웃, 연결 오류)인지 판단합니다."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError))
+
+class CircuitBreaker:
+    """연속 실패가 쌓이면 일정 시간 호출을 막고, 이후 한 번의 시험 호출로 복구 여부를 확인하는 회로 차단기"""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> float:
+        """호출해도 되면 0을, 막혀 있으면 남은 차단 시간(초)을 반환합니다."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                return remaining
+            if self._probing:
+                return 1.0
+            self._probing = True
+            return 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"LLM 회로 차단기 열림: 연속 실패 {self._failures}회")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+# 여러 LLM 호출이 함께 써야 하는 요청 단위 마감 시각 (time.monotonic 기준)
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """with 블록 안의 모든 LLM 호출이 seconds 안에 끝나도록 마감 시각을 설정합니다."""
+    deadline_at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(min(deadline_at, current) if current is not None else deadline_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+class LLMClient:
+    """재시도, 마감 시간 전파, 헤지 요청, 회로 차단기를 갖춘 LLM 호출 파이프라인"""
+
+    def __init__(self, model: Any, model_name: str):
+        self.model = model
+        self.model_name = model_name
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def _generate_once(self, prompt: str, request_type: str, timeout: float,
+                       generation_config: Optional[Dict[str, Any]] = None,
+                       cancelled: Optional[threading.Event] = None):
+        """스트리밍으로 응답을 한 번 생성하며 첫 토큰까지의 시간과 전체 시간을 기록합니다 (블로킹).
+
+        cancelled가 설정되면 스트림을 더 읽지 않고 GenerationCancelled를 발생시킵니다.
+        """
+        start_time = time.perf_counter()
+        outcome = "error"
+        try:
+            if cancelled is not None and cancelled.is_set():
+                outcome = "cancelled"
+                raise GenerationCancelled("시작 전에 취소됨")
+            with span("llm.generate", model=self.model_name, request_type=request_type) as llm_span:
+                kwargs = {"generation_config": generation_config} if generation_config else {}
+                response = self.model.generate_content(
+                    prompt, stream=True, request_options={"timeout": timeout}, **kwargs
+                )
+                first_chunk = True
+                for _chunk in response:
+                    if cancelled is not None and cancelled.is_set():
+                        outcome = "cancelled"
+                        raise GenerationCancelled("스트리밍 중 취소됨")
+                    if first_chunk:
+                        ttft = time.perf_counter() - start_time
+                        metrics.LLM_TIME_TO_FIRST_TOKEN.observe(ttft, self.model_name, request_type)
+                        if llm_span is not None:
+                            llm_span.attributes["ttft_ms"] = round(ttft * 1000, 1)
+                        first_chunk = False
+            outcome = "success"
+            self._latencies.setdefault(request_type, deque(maxlen=LLM_LATENCY_WINDOW)).append(
+                time.perf_counter() - start_time
+            )
+            return response
+        finally:
+            metrics.LLM_REQUEST_DURATION.observe(time.perf_counter() - start_time, self.model_name, request_type)
+            metrics.LLM_REQUESTS.inc(1.0, self.model_name, request_type, outcome)
+
+    def hedge_delay(self, request_type: str) -> Optional[float]:
+        """헤지 요청을 보낼 기준 시간을 반환합니다 (설정값 또는 최근 지연 시간의 p95)."""
+        if LLM_HEDGE_DELAY > 0:
+            return LLM_HEDGE_DELAY
+        latencies = self._latencies.get(request_type)
+        if not latencies or len(latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def _start(self, prompt: str, request_type: str, timeout: float,
+               generation_config: Optional[Dict[str, Any]], cancelled: threading.Event) -> asyncio.Future:
+        """LLM 전용 스레드에서 생성을 시작합니다 (요청 trace를 이어 쓰도록 컨텍스트를 복사)."""
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(
+            _executor, context.run, self._generate_once, prompt, request_type, timeout, generation_config, cancelled
+        )
+
+    async def _attempt(self, prompt: str, request_type: str, timeout: float, hedge: bool,
+                       generation_config: Optional[Dict[str, Any]] = None):
+        # asyncio 쪽 Future를 취소해도 스레드는 계속 생성하므로, 끝날 때 취소 플래그로 스트림 읽기를 멈춤
+        flags: List[threading.Event] = [threading.Event()]
+        try:
+            return await self._race(prompt, request_type, timeout, hedge, generation_config, flags)
+        finally:
+            for flag in flags:
+                flag.set()
+
+    async def _race(self, prompt: str, request_type: str, timeout: float, hedge: bool,
+                    generation_config: Optional[Dict[str, Any]], flags: List[threading.Event]):
+        primary = self._start(prompt, request_type, timeout, generation_config, flags[0])
+        delay = self.hedge_delay(request_type) if hedge else None
+        if delay is None or delay >= timeout:
+            return await asyncio.wait_for(primary, timeout)
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        # 첫 요청이 느리면 같은 요청을 한 번 더 보내고 먼저 성공한 응답을 사용
+        metrics.LLM_HEDGES.inc(1.0, self.model_name, request_type)
+        flags.append(threading.Event())
+        backup = self._start(prompt, request_type, timeout - delay, generation_config, flags[1])
+        pending = {primary, backup}
+        end_time = time.monotonic() + timeout - delay
+        last_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, end_time - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                last_error = task.exception()
+        for other in pending:
+            other.cancel()
+        raise last_error or asyncio.TimeoutError()
+
+    async def generate(self, prompt: str, request_type: str = "chat", deadline: Optional[float] = None,
+                       hedge: Optional[bool] = None, generation_config: Optional[Dict[str, Any]] = None):
+        """응답을 생성합니다. 일시적 오류는 마감 시간 안에서 재시도하고, 실패하면 LLMError를 발생시킵니다."""
+        if self.model is None:
+            raise LLMError("LLM이 설정되지 않았습니다. API 키를 확인해주세요.")
+        if hedge is None:
+            hedge = request_type in LLM_HEDGE_TYPES
+
+        deadline_at = time.monotonic() + (deadline or LLM_DEADLINE)
+        scoped = _deadline.get()
+        if scoped is not None:
+            deadline_at = min(deadline_at, scoped)
+
+        last_error: Optional[BaseException] = None
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            blocked = self.breaker.allow()
+            if blocked:
+                metrics.LLM_BREAKER_REJECTIONS.inc(1.0, self.model_name, request_type)
+                raise LLMError("AI 서비스가 일시적으로 응답하지 않습니다. 잠시 후 다시 시도해주세요.", retry_after=blocked)
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                response = await self._attempt(prompt, request_type, remaining, hedge, generation_config)
+                self.breaker.record_success()
+                return response
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    # 공급자는 응답했으므로 회로 차단기 입장에서는 성공
+                    self.breaker.record_success()
+                    logger.error(f"LLM 호출 실패 (재시도 불가): {e}")
+                    raise LLMError(f"AI 응답 생성 실패: {e}", status_code=502)
+                self.breaker.record_failure()
+                backoff = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** attempt))
+                if attempt + 1 >= LLM_MAX_ATTEMPTS or time.monotonic() + backoff >= deadline_at:
+                    break
+                metrics.LLM_RETRIES.inc(1.0, self.model_name, request_type)
+                logger.warning(f"LLM 호출 일시 오류, {backoff:.2f}초 후 재시도 ({attempt + 1}/{LLM_MAX_ATTEMPTS}): {e}")
+                await asyncio.sleep(backoff)
+
+        logger.error(f"LLM 호출 실패: {last_error or '마감 시간 초과'}")
+        raise LLMError("AI 응답 생성 시간이 초과되었거나 서비스가 응답하지 않습니다. 잠시 후 다시 시도해주세요.")
+
+class FakeProviderError(Exception):
+    """가짜 모델이 흉내 내는 일시적 공급자 오류"""
+
+    code = 503
+
+class FakeResponse:
+    """google.generativeai 스트리밍 응답과 같은 모양의 가짜 응답 (chunks개 조각을 chunk_delay 간격으로 내보냄)"""
+
+    def __init__(self, text: str, prompt_tokens: int, chunks: int = 1, chunk_delay: float = 0.0):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(total_token_count=prompt_tokens + max(1, len(text) // 4))
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.chunks_served = 0
+
+    def __iter__(self):
+        for i in range(self.chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            self.chunks_served += 1
+            yield self
+
+class FakeModel:
+    """PROVIDER=fake일 때 쓰는 로컬 가짜 모델 (네트워크 호출 없이 지연과 실패를 흉내 냄)"""
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY, failure_rate: float = FAKE_LLM_FAILURE_RATE,
+                 chunks: int = 1):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        # 스트리밍 조각 수. 지연 시간의 절반은 첫 조각까지, 나머지는 조각 사이에 나눠 씀
+        self.chunks = max(1, chunks)
+
+    def count_tokens(self, contents: Any):
+        return SimpleNamespace(total_tokens=max(1, len(str(contents)) // 4))
+
+    def generate_content(self, prompt: str, stream: bool = False, request_options: Optional[dict] = None,
+                         generation_config: Optional[dict] = None):
+        timeout = (request_options or {}).get("timeout")
+        latency = random.uniform(0.5, 1.5) * self.latency
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("가짜 모델 응답 시간 초과")
+        first_chunk = latency / 2 if stream and self.chunks > 1 else latency
+        time.sleep(first_chunk)
+        if random.random() < self.failure_rate:
+            raise FakeProviderError("가짜 모델 일시 오류")
+        chunk_delay = (latency - first_chunk) / (self.chunks - 1) if stream and self.chunks > 1 else 0.0
+        return FakeResponse(f"가짜 응답입니다. (프롬프트 {len(prompt)}자)", len(prompt) // 4,
+                            self.chunks if stream else 1, chunk_delay)
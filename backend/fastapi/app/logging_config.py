@@ -0,0 +1,139 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from .tracing import current_request_id
+
+# 기본 로그 레벨 및 모듈별 레벨 (예: "app.services=WARNING,app.main=DEBUG")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# json | text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# extra=SAMPLED 로 남긴 상세 로그 중 실제로 출력할 비율
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+# 비동기 핸들러 큐 최대 길이 (가득 차면 버림)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# 샘플링 대상 상세 로그 표시: logger.debug("...", value, extra=SAMPLED)
+SAMPLED = {"sampled": True}
+
+# LogRecord 기본 속성 (JSON 출력 시 extra 필드만 골라내기 위해 사용)
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# 큐에 넣기 전에 예외를 문자열로 만들 때 쓰는 기본 포매터
+_EXC_FORMATTER = logging.Formatter()
+
+class JsonFormatter(logging.Formatter):
+    """한 줄짜리 JSON으로 로그를 출력하는 포매터"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != "sampled":
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """sampled 표시가 있는 레코드는 LOG_SAMPLE_RATE 비율만 통과시키는 필터"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False):
+            return random.random() < self.rate
+        return True
+
+class RequestIdFilter(logging.Filter):
+    """현재 요청의 request id를 레코드에 붙이는 필터 (큐에 넣기 전, 요청 컨텍스트에서 실행)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        request_id = current_request_id()
+        if request_id is not None:
+            record.request_id = request_id
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """출력 포매팅(JSON 등)은 리스너 스레드로 미루고, 큐가 가득 차면 로그를 버리는 핸들러"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 인자로 넘긴 객체가 나중에 바뀌기 전에 메시지를 확정 (stdlib QueueHandler와 같음)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        # 예외는 문자열로만 넘겨 traceback(프레임) 참조가 큐에 남지 않게 함
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """"logger=LEVEL,..." 형식의 모듈별 레벨 설정을 파싱합니다."""
+    levels: Dict[str, int] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        level_no = logging.getLevelName(level.strip().upper())
+        if isinstance(level_no, int):
+            levels[name.strip()] = level_no
+    return levels
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging() -> None:
+    """루트 로거에 비동기 큐 핸들러와 샘플링 필터를 설정합니다. 여러 번 호출해도 한 번만 적용됩니다."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """큐에 남은 로그를 모두 출력하고 리스너를 종료합니다."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,120 +1,253 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Header, Request
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, FileResponse, JSONResponse
 from jwt import PyJWKClient, decode
-from fastapi.encoders import jsonable_encoder
 import os
 import json
+import logging
 import time
+import asyncio
+import ipaddress
+import signal
+from contextlib import asynccontextmanager
 from datetime import datetime
 from dotenv import load_dotenv
-import google.generativeai as genai
 from typing import Optional, List, Dict, Any
 
 # 로컬 모듈 import
-from .database import db_manager, DB_HOST, DB_NAME, logger
+from .database import db_manager, DB_HOST, DB_NAME, RAW_JSONB_PASSTHROUGH
+from .logging_config import SAMPLED
 from .services import ProblemService, ChatService, ReportService
 from .prompt_engineering import PromptEngineeringService
-from .chat_service import ChatMessageRequest, ChatResponse, ConversationRequest, ConversationReport
+from .chat_service import ChatMessageRequest, ChatResponse, ConversationRequest, ConversationReport, FullChatLogResponse, ReportRecord
+from .fast_json import FastJSONResponse, RawJSON
+from .http_cache import CompressionMiddleware, make_etag, not_modified, validator_headers
+from .catalog import catalog, CATALOG_CHECK_INTERVAL
+from .problem_sampler import problem_sampler
+from .recommender import recommender
+from . import metrics
+from .tracing import TracingMiddleware, span
+from .profiler import profiler, ProfilerBusyError
+from .shared_state import shared_state
+from .admission import admission, AdmissionRejected, SYSTEM_USER_KEY
+from .llm_client import LLMError, FakeModel
+from .model_router import ModelRouter, classify_step_turn, ROUTE_STEP_ANSWER
+from .quiz_checker import QuizChecker, MAX_ATTEMPTS_PER_STEP
+from .tutor_state import TutorStateExtractor
+from .first_step_cache import first_step_cache, FIRST_STEP_VARIANTS, PREWARM_ON_STARTUP, PREWARM_POPULAR_LIMIT
+from .connection_manager import tutor_connections, Connection, WS_PONG_TEXT, WS_MAX_MESSAGE_CHARS
+from .tutor_log import TutorLog, TUTOR_LOG_SIZE
+from .chat_writer import chat_writer
+from .image_pipeline import (image_pipeline, CachedStaticFiles, UPLOAD_DIR, IMAGE_DERIVED_DIR,
+                             IMAGE_PIPELINE_ON_STARTUP, ORIGINAL_CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL)
+from .startup import startup_state
+from .health import health_monitor
+from .usage_store import usage_store, parse_ts
+
+logger = logging.getLogger(__name__)
 
 # .env 파일 로드
 load_dotenv()
 
 ISSUER = os.getenv("ISSUER", "http://52.79.233.106")
 JWKS_URL = os.getenv("JWKS_URL", f"{ISSUER}/.well-known/jwks.json")
-jwk_client = PyJWKClient(JWKS_URL)
+# JWKS 캐시 시간(초). 모르는 kid가 오면 PyJWKClient가 만료 전이라도 다시 받아옴
+JWKS_CACHE_SECONDS = int(os.getenv("JWKS_CACHE_SECONDS", "3600"))
 
 # Gemini API 설정
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 PROVIDER = os.getenv("PROVIDER", "gemini")
 
-# 토큰 사용량 추적 파일
-USAGE_FILE = "app/api_tot_usage.json"
+# 관리자 전용 엔드포인트 인증 토큰 (없으면 관리자 엔드포인트 비활성화)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# 직접 연결한 주소가 이 대역(nginx가 있는 도커 내부망)일 때만 X-Real-IP를 클라이언트 IP로 사용
+TRUSTED_PROXY_NETS = tuple(
+    ipaddress.ip_network(net.strip())
+    for net in os.getenv("TRUSTED_PROXY_NETS", "127.0.0.0/8,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,::1/128").split(",")
+    if net.strip()
+)
 
-# Gemini API 초기화
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel(GEMINI_MODEL)
-else:
-    model = None
-    print("Warning: GEMINI_API_KEY not found in environment variables")
+# 단계별 풀이 세션 상태 유지 시간(초)
+TUTOR_SESSION_TTL = int(os.getenv("TUTOR_SESSION_TTL", "7200"))
+# 카탈로그에서 만드는 응답(문제, 유사문제)은 사용자와 무관하므로 공유 캐시 허용, 매번 재검증
+CATALOG_CACHE_CONTROL = "public, no-cache"
 
-def load_usage_data():
-    """사용량 데이터를 로드합니다."""
-    try:
-        if os.path.exists(USAGE_FILE):
-            with open(USAGE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"사용량 데이터 로드 오류: {e}")
-    return {"total_requests": 0, "total_tokens": 0, "requests": []}
+# Gemini API 사용 가능 여부 (PROVIDER=fake 이면 네트워크 없이 동작하는 가짜 모델 사용)
+MODEL_CONFIGURED = PROVIDER == "fake" or bool(GEMINI_API_KEY)
+if not MODEL_CONFIGURED:
+    logger.warning("GEMINI_API_KEY not found in environment variables")
 
-def save_usage_data(usage_data):
-    """사용량 데이터를 저장합니다."""
-    try:
-        with open(USAGE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(usage_data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"사용량 데이터 저장 오류: {e}")
+_genai = None
+_model = None
+_jwk_client = None
+
+def _load_genai():
+    """google.generativeai는 import에만 0.5초 이상 걸리므로 처음 필요할 때 불러와 설정합니다."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        _genai = genai
+    return _genai
+
+def create_model(model_name: str):
+    """모델 이름에 해당하는 생성 모델을 만듭니다. API 키가 없으면 None을 반환합니다."""
+    if PROVIDER == "fake":
+        return FakeModel()
+    if GEMINI_API_KEY:
+        return _load_genai().GenerativeModel(model_name)
+    return None
+
+def get_model():
+    """토큰 계산에 쓰는 기본 모델을 처음 사용할 때 만듭니다."""
+    global _model
+    if _model is None and MODEL_CONFIGURED:
+        _model = create_model(GEMINI_MODEL)
+    return _model
+
+def get_jwk_client() -> PyJWKClient:
+    """JWKS 클라이언트를 처음 사용할 때 만듭니다 (키 목록은 첫 검증 또는 시작 예열 때 받아옴)."""
+    global _jwk_client
+    if _jwk_client is None:
+        _jwk_client = PyJWKClient(JWKS_URL, lifespan=JWKS_CACHE_SECONDS)
+    return _jwk_client
+# 요청 분류별 모델/동시 호출 풀 라우터
+model_router = ModelRouter(create_model, GEMINI_MODEL)
+
+def get_usage_totals():
+    """누적 요청 수와 토큰 수를 반환합니다. 공유 상태 백엔드가 있으면 전체 워커 합계를 사용합니다."""
+    if shared_state.shared:
+        return {
+            "total_requests": int(shared_state.get("usage:total_requests", 0)),
+            "total_tokens": int(shared_state.get("usage:total_tokens", 0))
+        }
+    return usage_store.totals()
 
 def count_tokens(text: str) -> int:
     """텍스트의 토큰 수를 계산합니다."""
+    model = get_model()
     if not model:
         return 0
     try:
-        return model.count_tokens(text).total_tokens
+        with span("tokens.count"):
+            return model.count_tokens(text).total_tokens
     except Exception as e:
-        print(f"토큰 계산 오류: {e}")
+        logger.warning(f"토큰 계산 오류: {e}")
         # fallback: 대략적인 계산 (1 토큰 ≈ 4 문자)
         return len(text) // 4
 
-def log_token_usage(prompt_tokens, response_tokens, total_tokens, model_name, request_type="chat"):
-    """토큰 사용량을 로그하고 저장합니다."""
-    timestamp = datetime.now().isoformat()
-    
-    # 사용량 데이터 로드
-    usage_data = load_usage_data()
-    
-    # 새로운 요청 정보
-    request_info = {
-        "timestamp": timestamp,
-        "request_type": request_type,
-        "model": model_name,
-        "prompt_tokens": prompt_tokens,
-        "response_tokens": response_tokens,
-        "total_tokens": total_tokens
-    }
+async def count_tokens_async(*texts: str) -> List[int]:
+    """count_tokens는 Gemini API를 호출하는 블로킹 함수이므로 이벤트 루프 밖의 스레드에서 동시에 계산합니다."""
+    return list(await asyncio.gather(*(asyncio.to_thread(count_tokens, text) for text in texts)))
+
+def log_token_usage(prompt_tokens, response_tokens, total_tokens, model_name, request_type="chat",
+                    user_key=None, cache_hit=False):
+    """토큰 사용량을 로그하고 시계열 사용량 저장소에 기록합니다.
+
+    cache_hit이면 LLM을 호출하지 않고 캐시된 응답을 쓴 경우로, 사용량 버킷에만 기록하고 누적 호출 수에는 넣지 않습니다.
+    """
+    usage_store.record(prompt_tokens, response_tokens, total_tokens, model_name, request_type,
+                       user=user_key, cache_hit=cache_hit)
+    if cache_hit:
+        return
     
-    # 사용량 데이터 업데이트
-    usage_data["total_requests"] += 1
-    usage_data["total_tokens"] += total_tokens
-    usage_data["requests"].append(request_info)
+    metrics.LLM_TOKENS.inc(prompt_tokens, request_type, model_name, "prompt")
+    metrics.LLM_TOKENS.inc(response_tokens, request_type, model_name, "response")
     
-    # 저장
-    save_usage_data(usage_data)
+    # 공유 카운터 업데이트 (원자적 증가)
+    shared_state.incr("usage:total_requests")
+    shared_state.incr("usage:total_tokens", total_tokens)
     
     # 로그 출력
-    print(f"[{timestamp}] API 사용량 - 모델: {model_name}, 프롬프트: {prompt_tokens}, 응답: {response_tokens}, 총: {total_tokens} 토큰")
-    print(f"[{timestamp}] 누적 사용량 - 총 요청: {usage_data['total_requests']}, 총 토큰: {usage_data['total_tokens']}")
+    logger.info("API 사용량 - 모델: %s, 유형: %s, 프롬프트: %s, 응답: %s, 총: %s 토큰",
+                model_name, request_type, prompt_tokens, response_tokens, total_tokens)
 
 def verify_access(token: str):
-    key = jwk_client.get_signing_key_from_jwt(token).key
+    key = get_jwk_client().get_signing_key_from_jwt(token).key
     return decode(token, key, algorithms=["RS256"], issuer=ISSUER)
 
-async def get_gemini_response(prompt: str) -> str:
-    """Gemini API를 사용하여 응답을 생성합니다."""
-    if not model:
-        return "Gemini API가 설정되지 않았습니다. API 키를 확인해주세요."
+def client_ip(request: Request) -> str:
+    """클라이언트 IP를 반환합니다. 신뢰하는 프록시를 거친 요청만 X-Real-IP를 사용합니다."""
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-real-ip", "").strip()
+    if forwarded:
+        try:
+            if any(ipaddress.ip_address(peer) in net for net in TRUSTED_PROXY_NETS):
+                return forwarded
+        except ValueError:
+            pass
+    return peer
+
+def owner_user_key(user_id: Optional[object]) -> Optional[str]:
+    """DB에 저장된 사용자 id(대화 주인 등)로 토큰 예산 키를 만듭니다."""
+    return f"user:{user_id}" if user_id not in (None, "") else None
+
+async def verified_user_key(request: Request) -> Optional[str]:
+    """Authorization 헤더의 토큰을 검증해 subject로 토큰 예산 키를 만듭니다. 토큰이 없거나 잘못되었으면 None."""
+    auth = request.headers.get("authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    try:
+        claims = await asyncio.to_thread(verify_access, auth[len("Bearer "):])
+    except Exception:
+        return None
+    return owner_user_key(claims.get("sub"))
+
+async def request_user_key(request: Request, owner_id: Optional[object] = None) -> str:
+    """토큰 예산과 사용량 집계에 쓸 사용자 키를 서버에서 정합니다.
+
+    검증된 토큰 subject → 대화 주인(owner_id) → 클라이언트 IP 순서로 사용하며, 요청 본문의 user_id는 믿지 않습니다.
+    """
+    return await verified_user_key(request) or owner_user_key(owner_id) or f"ip:{client_ip(request)}"
+
+def require_admin(x_admin_token: Optional[str]):
+    """관리자 토큰을 검증합니다."""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다.")
+
+def load_tutor_session(conversation_id: str) -> Dict[str, Any]:
+    """공유 상태에 저장된 단계별 풀이 세션 상태(current_step, attempts, 현재 미니퀴즈)를 조회합니다."""
+    try:
+        return shared_state.get(f"tutor_session:{conversation_id}") or {}
+    except Exception as e:
+        logger.error(f"풀이 세션 상태 조회 오류: {e}")
+        return {}
+
+def save_tutor_session(conversation_id: str, state: Dict[str, Any]) -> None:
+    """단계별 풀이 세션 상태를 공유 상태에 저장합니다 (어느 워커로 요청이 가도 이어서 진행)."""
+    try:
+        shared_state.set(f"tutor_session:{conversation_id}", state, ttl=TUTOR_SESSION_TTL)
+    except Exception as e:
+        logger.error(f"풀이 세션 상태 저장 오류: {e}")
+
+def build_problem_info(problem_data: Dict[str, Any]) -> Dict[str, Any]:
+    """응답에 포함할 문제 요약 정보를 만듭니다."""
+    return {
+        "p_name": problem_data.get("p_name"),
+        "main_chapt": problem_data.get("main_chapt"),
+        "sub_chapt": problem_data.get("sub_chapt"),
+        "p_level": problem_data.get("p_level"),
+        "p_type": problem_data.get("p_type"),
+        "con_type": problem_data.get("con_type")
+    }
+
+async def get_gemini_response(prompt: str, request_type: str = "chat", user_key: Optional[object] = None,
+                              route: Optional[str] = None) -> str:
+    """Gemini API를 사용하여 응답을 생성합니다.
+
+    토큰 예산을 넘으면 AdmissionRejected(429), 재시도 후에도 응답을 만들지 못하면 LLMError(503)를 발생시킵니다.
+    """
+    if not MODEL_CONFIGURED:
+        raise LLMError("Gemini API가 설정되지 않았습니다. API 키를 확인해주세요.")
     
+    reserved = await admission.admit(request_type, user_key, prompt)
     try:
-        start_time = time.time()
-        
         # 프롬프트 토큰 수 계산
-        prompt_tokens = count_tokens(prompt)
+        (prompt_tokens,) = await count_tokens_async(prompt)
         
         # 응답 생성
-        response = model.generate_content(prompt)
-        end_time = time.time()
+        response, model_name = await model_router.generate(prompt, request_type, route)
         
         # 응답 토큰 수 계산 (usage_metadata 사용)
         if hasattr(response, 'usage_metadata') and response.usage_metadata:
@@ -122,27 +255,268 @@ async def get_gemini_response(prompt: str) -> str:
             response_tokens = total_tokens - prompt_tokens
         else:
             # fallback: 응답 텍스트의 토큰 수 계산
-            response_tokens = count_tokens(response.text)
+            (response_tokens,) = await count_tokens_async(response.text)
             total_tokens = prompt_tokens + response_tokens
         
         # 사용량 로그
-        log_token_usage(prompt_tokens, response_tokens, total_tokens, GEMINI_MODEL)
+        await asyncio.to_thread(log_token_usage, prompt_tokens, response_tokens, total_tokens, model_name,
+                                request_type, user_key)
+        admission.settle(user_key, reserved, total_tokens)
         
         return response.text
-    except Exception as e:
-        print(f"Gemini API 오류: {e}")
-        # API 키 오류인 경우 테스트용 응답 반환
-        if "API key not valid" in str(e) or "API_KEY_INVALID" in str(e):
-            return f"테스트 모드: '{prompt}'에 대한 AI 응답입니다. (실제 API 키가 필요합니다)"
-        return f"AI 응답 생성 중 오류가 발생했습니다: {str(e)}"
+    except Exception:
+        admission.settle(user_key, reserved, 0)
+        raise
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """시작 시 백그라운드 작업과 예열을 시작하고, 종료 시 남은 작업을 정리합니다."""
+    await on_startup()
+    yield
+    await on_shutdown()
 
-app = FastAPI(title="Dasida FastAPI", description="LLM 모델을 위한 FastAPI 서버")
+app = FastAPI(title="Dasida FastAPI", description="LLM 모델을 위한 FastAPI 서버", lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 # 정적 파일 서빙 설정
 import os
 # 도커 환경에서는 /app 디렉토리 내에서 실행되므로 절대 경로 사용
-static_dir = "/app/static/uploads"
-app.mount("/uploads", StaticFiles(directory=static_dir), name="uploads")
+static_dir = UPLOAD_DIR
+app.mount("/uploads", CachedStaticFiles(directory=static_dir, cache_control=ORIGINAL_CACHE_CONTROL), name="uploads")
+# 파일명에 내용 해시가 들어간 파생 이미지는 영구 캐시
+try:
+    os.makedirs(IMAGE_DERIVED_DIR, exist_ok=True)
+except OSError as e:
+    logger.error(f"파생 이미지 디렉터리 생성 오류: {e}")
+app.mount("/img", CachedStaticFiles(directory=IMAGE_DERIVED_DIR, check_dir=False,
+                                    cache_control=IMMUTABLE_CACHE_CONTROL), name="derived_images")
+
+def _on_catalog_swap(snapshot):
+    """카탈로그 스냅샷이 바뀌면 문제 샘플러도 같은 데이터로 다시 만듭니다."""
+    problem_sampler.rebuild(snapshot.problems.values(), fingerprint=snapshot.version, managed=True)
+
+async def _catalog_version_watcher():
+    """주기적으로 카탈로그 버전을 확인하고 바뀌었으면 스냅샷을 교체합니다."""
+    while True:
+        await asyncio.sleep(CATALOG_CHECK_INTERVAL)
+        await asyncio.to_thread(catalog.check_version)
+
+async def _reload_catalog(publish: bool = True):
+    try:
+        await asyncio.to_thread(catalog.load, True)
+        if publish:
+            await asyncio.to_thread(shared_state.publish, "catalog_reload", {"reason": "signal"})
+    except Exception as e:
+        logger.error(f"카탈로그 다시 로드 오류: {e}")
+
+# pub/sub 리스너 스레드에서 작업을 넘길 이벤트 루프 (on_startup에서 설정)
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _on_catalog_reload_message(message):
+    """다른 워커가 카탈로그를 다시 로드하면 이 워커도 따라서 다시 로드합니다.
+
+    pub/sub 리스너 스레드에서 호출되므로 직접 로드하지 않고 이벤트 루프로 넘깁니다 (다시 알리지는 않음).
+    """
+    if _event_loop is None or _event_loop.is_closed():
+        return
+    asyncio.run_coroutine_threadsafe(_reload_catalog(publish=False), _event_loop)
+
+def _on_recommend_invalidate_message(message):
+    """다른 워커에서 리포트가 저장되면 해당 사용자의 추천 프로필 캐시를 비웁니다."""
+    if message and message.get("user_id"):
+        recommender.invalidate_user(message["user_id"])
+
+def _reload_catalog_on_signal():
+    """SIGHUP 수신 시 카탈로그를 강제로 다시 로드합니다."""
+    logger.info("SIGHUP 수신: 카탈로그 다시 로드")
+    asyncio.create_task(_reload_catalog())
+
+def _first_step_jobs(p_ids: List[int]) -> List[tuple]:
+    """문제 ID 목록으로 첫 단계 미리 만들기 작업(p_id, 시작 프롬프트)을 만듭니다."""
+    jobs = []
+    for p_id in p_ids:
+        problem = ProblemService.get_problem_by_id(p_id)
+        # 시작 요청과 같은 프롬프트가 되도록 페이지/번호 조회 결과(교과서 개념 포함)를 사용
+        if problem:
+            problem = ProblemService.get_problem_by_page_and_number(problem.get("p_page"), problem.get("num_in_page"))
+        if problem:
+            jobs.append((p_id, PromptEngineeringService.create_first_step_prompt(problem)))
+    return jobs
+
+async def _generate_first_step(prompt: str) -> Optional[Dict[str, Any]]:
+    """첫 단계 응답 하나를 생성합니다. 예산 부족이나 상태 메타데이터가 없는 응답은 저장하지 않습니다."""
+    try:
+        text = await get_gemini_response(prompt, "first_step_prewarm", user_key=SYSTEM_USER_KEY, route=ROUTE_STEP_ANSWER)
+    except (AdmissionRejected, LLMError) as e:
+        logger.warning(f"첫 단계 미리 만들기 건너뜀: {e.detail}")
+        return None
+    visible, state_data = TutorStateExtractor.extract(text)
+    if state_data is None:
+        return None
+    return {
+        "text": text,
+        "prompt_tokens": await asyncio.to_thread(count_tokens, prompt),
+        "response_tokens": await asyncio.to_thread(count_tokens, visible)
+    }
+
+async def run_first_step_prewarm(limit: int = PREWARM_POPULAR_LIMIT, all_problems: bool = False,
+                                 variants: int = FIRST_STEP_VARIANTS, force: bool = False) -> Dict[str, int]:
+    """인기 문제(또는 전체 문제)의 첫 단계 응답을 미리 만들어 둡니다."""
+    try:
+        snapshot = catalog.snapshot
+        if all_problems and snapshot is not None:
+            p_ids = list(snapshot.problems)
+        else:
+            p_ids = await asyncio.to_thread(ChatService.get_popular_problem_ids, limit)
+        jobs = await asyncio.to_thread(_first_step_jobs, p_ids)
+        return await first_step_cache.prewarm(jobs, model_router.model_for(ROUTE_STEP_ANSWER),
+                                              _generate_first_step, variants, force)
+    except Exception as e:
+        logger.error(f"첫 단계 미리 만들기 오류: {e}")
+        return {}
+
+async def run_image_pipeline(force: bool = False) -> Dict[str, int]:
+    """업로드 이미지의 파생 이미지(폭 구간별 WebP/AVIF)를 스레드에서 만듭니다."""
+    try:
+        return await asyncio.to_thread(image_pipeline.build, force)
+    except Exception as e:
+        logger.error(f"이미지 변환 오류: {e}")
+        return {}
+
+def _check_database() -> Dict[str, Any]:
+    """별도의 autocommit 연결로 DB가 쿼리에 응답하는지 확인합니다 (요청 처리용 공유 연결은 건드리지 않음)."""
+    conn = db_manager.new_connection(autocommit=True)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    finally:
+        conn.close()
+    return {"host": DB_HOST, "name": DB_NAME}
+
+def _check_jwks() -> Dict[str, Any]:
+    """JWKS 키 목록을 받을 수 있는지 확인합니다 (캐시 시간 안에서는 네트워크 요청 없음)."""
+    return {"keys": len(get_jwk_client().get_signing_keys())}
+
+def _check_llm() -> Dict[str, Any]:
+    """LLM 제공자 설정과 모델별 회로 차단기 상태를 확인합니다 (API를 호출하지 않음)."""
+    breakers = model_router.breaker_states()
+    if not MODEL_CONFIGURED:
+        raise RuntimeError("Gemini API 키가 설정되지 않았습니다.")
+    if breakers and all(state == "open" for state in breakers.values()):
+        raise RuntimeError(f"모든 모델의 회로 차단기가 열려 있습니다: {breakers}")
+    return {"provider": PROVIDER, "breakers": breakers}
+
+health_monitor.register("database", _check_database)
+health_monitor.register("llm", _check_llm)
+health_monitor.register("jwks", _check_jwks)
+
+async def _warm_check(name: str, func, *args) -> None:
+    start_time = time.perf_counter()
+    try:
+        await asyncio.to_thread(func, *args)
+        startup_state.record(name, True, time.perf_counter() - start_time)
+    except Exception as e:
+        logger.error(f"시작 예열 실패 ({name}): {e}")
+        startup_state.record(name, False, time.perf_counter() - start_time, str(e))
+
+async def warm_up() -> None:
+    """DB 연결 → 문제 카탈로그, JWKS, LLM SDK를 병렬로 예열하고 의존성 검사 루프를 시작합니다."""
+    async def database_then_catalog():
+        await health_monitor.run_check("database")
+        # 요청 처리용 공유 연결은 쿼리 없이 열어 두기만 함 (commit/rollback을 하지 않으므로 다른 요청에 영향 없음)
+        await _warm_check("db_connection", db_manager.get_connection)
+        # 카탈로그 적재에 실패하면 DB 조회로 동작
+        await _warm_check("catalog", catalog.load, True)
+
+    checks = [database_then_catalog(), health_monitor.run_check("jwks")]
+    if MODEL_CONFIGURED:
+        checks.append(_warm_check("llm_sdk", get_model))
+    await asyncio.gather(*checks)
+    startup_state.finish()
+    logger.info(f"시작 예열 완료: {startup_state.snapshot()}")
+    health_monitor.start()
+    # 무거운 백그라운드 작업은 예열이 끝난 뒤 시작
+    if PREWARM_ON_STARTUP:
+        asyncio.create_task(run_first_step_prewarm())
+    if IMAGE_PIPELINE_ON_STARTUP:
+        asyncio.create_task(run_image_pipeline())
+
+async def on_startup():
+    """시작 시 리스너를 등록하고 예열과 백그라운드 작업을 시작합니다 (예열을 기다리지 않고 바로 요청을 받음)."""
+    global _event_loop
+    _event_loop = asyncio.get_running_loop()
+    catalog.add_listener(_on_catalog_swap)
+    catalog.add_listener(recommender.on_catalog_swap)
+    shared_state.subscribe("catalog_reload", _on_catalog_reload_message)
+    shared_state.subscribe("recommend_invalidate", _on_recommend_invalidate_message)
+    asyncio.create_task(warm_up())
+    asyncio.create_task(_catalog_version_watcher())
+    asyncio.create_task(metrics.monitor_event_loop_lag())
+    usage_store.start()
+    await asyncio.to_thread(image_pipeline.load_manifest)
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload_catalog_on_signal)
+    except (NotImplementedError, RuntimeError, AttributeError):
+        pass
+
+async def on_shutdown():
+    """종료 전에 의존성 검사를 멈추고 저장 버퍼에 남은 채팅 메시지와 사용량을 모두 저장합니다."""
+    health_monitor.stop()
+    await chat_writer.close()
+    await usage_store.close()
+
+@app.post("/admin/catalog/reload")
+async def reload_catalog(x_admin_token: Optional[str] = Header(None)):
+    """문제 카탈로그 스냅샷을 강제로 다시 로드합니다."""
+    require_admin(x_admin_token)
+    try:
+        # 관리자 재적재만 내용 전체 해시를 계산해 응답에 포함 (워커 간 내용 비교용)
+        await asyncio.to_thread(catalog.load, True, True)
+        await asyncio.to_thread(shared_state.publish, "catalog_reload", {"reason": "admin"})
+    except Exception as e:
+        logger.error(f"카탈로그 다시 로드 오류: {e}")
+        raise HTTPException(status_code=500, detail=f"카탈로그 다시 로드 실패: {e}")
+    return {"status": "reloaded", "catalog": catalog.snapshot.stats()}
+
+@app.post("/admin/first-step/prewarm")
+async def prewarm_first_steps(limit: int = PREWARM_POPULAR_LIMIT, all: bool = False,
+                              variants: int = FIRST_STEP_VARIANTS, force: bool = False,
+                              x_admin_token: Optional[str] = Header(None)):
+    """인기 문제(all=true면 전체 문제)의 단계별 풀이 첫 단계 응답을 백그라운드에서 미리 만듭니다."""
+    require_admin(x_admin_token)
+    if first_step_cache.running:
+        raise HTTPException(status_code=409, detail="첫 단계 미리 만들기가 이미 실행 중입니다.")
+    variants = min(max(variants, 1), 5)
+    asyncio.create_task(run_first_step_prewarm(limit, all, variants, force))
+    return {"status": "started", "limit": None if all else limit, "variants": variants}
+
+@app.post("/admin/images/rebuild")
+async def rebuild_images(force: bool = False, x_admin_token: Optional[str] = Header(None)):
+    """업로드 이미지의 파생 이미지를 백그라운드에서 다시 만듭니다 (force=true면 변경 없는 이미지도 다시 변환)."""
+    require_admin(x_admin_token)
+    if image_pipeline.running:
+        raise HTTPException(status_code=409, detail="이미지 변환이 이미 실행 중입니다.")
+    asyncio.create_task(run_image_pipeline(force))
+    return {"status": "started", "force": force}
+
+@app.post("/admin/profile")
+async def profile_worker(seconds: float = 10.0, mode: str = "wall", interval: float = 0.01,
+                         memory: bool = False, format: str = "json",
+                         x_admin_token: Optional[str] = Header(None)):
+    """현재 워커를 seconds 동안 샘플링 프로파일링합니다 (mode: wall | cpu, format: json | collapsed)."""
+    require_admin(x_admin_token)
+    try:
+        result = await profiler.profile(seconds, mode=mode, interval=interval, memory=memory)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "collapsed":
+        return Response(content=result["collapsed"] + "\n", media_type="text/plain; charset=utf-8")
+    return result
 
 @app.get("/")
 async def root():
@@ -150,40 +524,75 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    gemini_status = "configured" if model else "not_configured"
-    usage_data = load_usage_data()
+    """프로세스가 살아 있는지만 반환합니다 (liveness). I/O 없이 항상 같은 비용으로 응답하며, 사용량은 /usage에서 조회합니다."""
+    gemini_status = "configured" if MODEL_CONFIGURED else "not_configured"
     return {
         "status": "healthy", 
         "service": "dasida-fastapi", 
         "gemini": gemini_status,
-        "usage": {
-            "total_requests": usage_data["total_requests"],
-            "total_tokens": usage_data["total_tokens"]
-        }
+        "uptime_seconds": round(health_monitor.uptime(), 1),
+        "websocket_connections": len(tutor_connections)
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """시작 예열이 끝났고 필수 의존성(기본: DB)의 최근 백그라운드 검사가 성공했는지 반환합니다. 준비 전에는 503.
+
+    DB, LLM 제공자, JWKS 상태는 HEALTH_CHECK_INTERVAL마다 갱신된 캐시 값이므로 요청마다 I/O를 하지 않습니다.
+    """
+    health = health_monitor.snapshot()
+    ready = startup_state.finished and health["ready"]
+    body = {"ready": ready, "checks": health["checks"], "startup": startup_state.snapshot()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 형식의 메트릭을 반환합니다."""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/test")
 async def test_endpoint():
     return {"message": "테스트 엔드포인트가 정상 작동합니다!", "timestamp": "2024", "provider": PROVIDER}
 
 @app.get("/usage")
-async def get_usage_stats():
-    """API 사용량 통계를 반환합니다."""
-    usage_data = load_usage_data()
+async def get_usage_stats(start: Optional[str] = None, end: Optional[str] = None, resolution: Optional[str] = None,
+                          group_by: Optional[str] = None, request_type: Optional[str] = None,
+                          model: Optional[str] = None, user: Optional[str] = None, cache: Optional[str] = None,
+                          x_admin_token: Optional[str] = Header(None)):
+    """API 사용량 통계를 반환합니다.
+
+    start/end(ISO 8601 또는 epoch 초, 기본: 최근 24시간) 구간의 사용량을 미리 집계된 분/시간/일 버킷에서 읽어
+    함께 반환합니다. resolution(minute|hour|day)을 주면 버킷별 시계열, group_by(request_type,model,user,cache)를
+    주면 태그별 합계를 반환하고, request_type/model/user/cache(hit|miss)로 거를 수 있습니다.
+    사용자별 사용량(group_by=user 또는 user 필터)은 관리자 토큰이 있어야 조회할 수 있습니다.
+    """
+    group_tags = [name.strip() for name in group_by.split(",") if name.strip()] if group_by else None
+    if user is not None or "user" in (group_tags or ()):
+        require_admin(x_admin_token)
+    try:
+        end_ts = parse_ts(end) if end else time.time()
+        start_ts = parse_ts(start) if start else end_ts - 86400
+        filters = {name: value for name, value in
+                   (("request_type", request_type), ("model", model), ("user", user), ("cache", cache))
+                   if value is not None}
+        usage_range = usage_store.query(start_ts, end_ts, resolution, group_tags, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "total_requests": usage_data["total_requests"],
-        "total_tokens": usage_data["total_tokens"],
-        "recent_requests": usage_data["requests"][-10:] if usage_data["requests"] else []
+        **(await asyncio.to_thread(get_usage_totals)),
+        "recent_requests": usage_store.recent(),
+        "range": usage_range
     }
 
 @app.post("/count-tokens")
-async def count_tokens_endpoint(text: dict):
+async def count_tokens_endpoint(text: dict, http_request: Request):
     """텍스트의 토큰 수를 계산합니다."""
     input_text = text.get("text", "")
     if not input_text:
         return {"error": "텍스트가 필요합니다."}
     
-    token_count = count_tokens(input_text)
+    await admission.admit("count_tokens", await request_user_key(http_request), input_text, response_tokens=0)
+    (token_count,) = await count_tokens_async(input_text)
     return {
         "text": input_text,
         "token_count": token_count,
@@ -200,8 +609,8 @@ async def save_chat_message(request: ChatMessageRequest):
         if not conversation_id:
             conversation_id = ChatService.create_conversation(request.user_id, request.p_id)
         
-        # 메시지 저장
-        chat_id = ChatService.save_chat_message(
+        # 메시지 저장 (다른 요청의 메시지와 함께 묶어서 커밋된 뒤 chat_id 반환)
+        chat_id = await chat_writer.save(
             conversation_id=conversation_id,
             user_id=request.user_id,
             p_id=request.p_id,
@@ -215,7 +624,7 @@ async def save_chat_message(request: ChatMessageRequest):
             # ai_response = await get_gemini_response(request.message)
             
             # AI 응답 저장
-            ai_chat_id = ChatService.save_chat_message(
+            ai_chat_id = await chat_writer.save(
                 conversation_id=conversation_id,
                 user_id=request.user_id,
                 p_id=request.p_id,
@@ -247,9 +656,8 @@ async def save_chat_message(request: ChatMessageRequest):
 async def create_conversation(request: ConversationRequest):
     """새로운 대화 세션을 생성합니다."""
     try:
-        # 1. 요청 바디 파라미터 검증 및 로깅
-        logger.info(f"대화 세션 생성 요청 시작: {request}")
-        logger.info(f"요청 파라미터 - user_id: {request.user_id}, p_id: {request.p_id}")
+        # 1. 요청 바디 파라미터 로깅
+        logger.debug("대화 세션 생성 요청: user_id=%s, p_id=%s", request.user_id, request.p_id)
         
         # 2. 필수 파라미터 검증
         if not request.user_id or request.user_id <= 0:
@@ -261,10 +669,8 @@ async def create_conversation(request: ConversationRequest):
             raise HTTPException(status_code=400, detail=f"유효하지 않은 p_id입니다. p_id는 1,002,001 이상이어야 합니다. (받은 값: {request.p_id})")
         
         # 3. 대화 세션 생성
-        logger.info(f"대화 세션 생성 시작: user_id={request.user_id}, p_id={request.p_id}")
         try:
             conversation_id = ChatService.create_conversation(request.user_id, request.p_id)
-            logger.info(f"대화 세션 생성 완료: {conversation_id}")
         except Exception as e:
             logger.error(f"대화 세션 생성 실패: {e}")
             logger.error(f"오류 타입: {type(e).__name__}")
@@ -278,7 +684,6 @@ async def create_conversation(request: ConversationRequest):
             "p_id": request.p_id,
             "status": "created"
         }
-        logger.info(f"대화 세션 생성 응답: {response_data}")
         return response_data
         
     except HTTPException:
@@ -294,6 +699,7 @@ async def create_conversation(request: ConversationRequest):
 async def get_conversation_messages(conversation_id: str):
     """대화 세션의 모든 메시지를 조회합니다."""
     try:
+        await chat_writer.wait_for(conversation_id)
         messages = ChatService.get_conversation_messages(conversation_id)
         return {
             "conversation_id": conversation_id,
@@ -303,29 +709,36 @@ async def get_conversation_messages(conversation_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"메시지 조회 실패: {str(e)}")
 
-@app.get("/conversation/{conversation_id}/full-chat-log")
+@app.get("/conversation/{conversation_id}/full-chat-log", response_model=FullChatLogResponse, response_class=FastJSONResponse)
 async def get_conversation_full_chat_log(conversation_id: str):
     """대화 세션의 전체 채팅 로그를 조회합니다."""
     try:
+        await chat_writer.wait_for(conversation_id)
         conn = db_manager.get_connection()
         with conn.cursor() as cursor:
+            # 패스스루 모드에서는 JSONB를 텍스트로 읽어 응답 본문에 그대로 넣음
             query = """
-            SELECT full_chat_log, started_at, completed_at
+            SELECT full_chat_log{cast}, started_at, completed_at
             FROM conversations 
             WHERE conversation_id = %s
-            """
+            """.format(cast="::text AS full_chat_log" if RAW_JSONB_PASSTHROUGH else "")
             cursor.execute(query, (conversation_id,))
             result = cursor.fetchone()
             
             if result:
-                return {
+                full_chat_log = result['full_chat_log']
+                if RAW_JSONB_PASSTHROUGH and full_chat_log is not None:
+                    full_chat_log = RawJSON(full_chat_log)
+                return FastJSONResponse({
                     "conversation_id": conversation_id,
-                    "full_chat_log": result['full_chat_log'],
+                    "full_chat_log": full_chat_log,
                     "started_at": result['started_at'],
                     "completed_at": result['completed_at']
-                }
+                })
             else:
                 raise HTTPException(status_code=404, detail="대화 세션을 찾을 수 없습니다.")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"전체 채팅 로그 조회 실패: {str(e)}")
 
@@ -368,7 +781,7 @@ async def complete_conversation(conversation_id: str):
         raise HTTPException(status_code=500, detail=f"대화 세션 완료 실패: {str(e)}")
 
 @app.post("/chat")
-async def chat_with_ai(message: dict):
+async def chat_with_ai(message: dict, http_request: Request):
     """AI와 채팅하는 엔드포인트"""
     # message가 문자열인 경우 JSON으로 파싱
     if isinstance(message, str):
@@ -382,7 +795,7 @@ async def chat_with_ai(message: dict):
         return {"error": "메시지가 필요합니다."}
     
     # Gemini API를 사용하여 응답 생성
-    ai_response = await get_gemini_response(user_message)
+    ai_response = await get_gemini_response(user_message, user_key=await request_user_key(http_request))
     
     return {
         "message": ai_response,
@@ -390,8 +803,72 @@ async def chat_with_ai(message: dict):
         "model": GEMINI_MODEL
     }
 
+def _ws_frame(frame_type: str, **fields: Any) -> str:
+    """튜터 웹소켓으로 보낼 JSON 메시지를 만듭니다."""
+    return json.dumps({"type": frame_type, **fields}, ensure_ascii=False, default=str)
+
+async def _persist_tutor_messages(conversation: Dict[str, Any], entries: List[Dict[str, Any]]) -> None:
+    """한 턴의 메시지(학생 메시지 + 튜터 응답)를 저장 버퍼에 넣고 커밋 결과를 기록합니다."""
+    futures = [chat_writer.submit(
+        conversation["conversation_id"], conversation["user_id"], conversation["p_id"],
+        entry["role"], entry["text"], created_at=datetime.fromtimestamp(entry["created_at"])
+    ) for entry in entries]
+    for result in await asyncio.gather(*futures, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error(f"튜터 웹소켓 메시지 저장 오류: {result}")
+            break
+
+async def _tutor_ws_turn(connection: Connection, conversation: Dict[str, Any], user_message: str,
+                         user_entry: Optional[Dict[str, Any]]) -> None:
+    """튜터 웹소켓 메시지 하나로 단계별 풀이 한 턴을 진행하고 응답을 보냅니다 (새 메시지가 오면 취소될 수 있음)."""
+    conversation_id = conversation["conversation_id"]
+    pending = [user_entry] if user_entry else []
+    try:
+        # 대화 히스토리는 DB 전체 로그 대신 공유 상태의 최근 메시지 로그에서 구성
+        log = await asyncio.to_thread(TutorLog.load, conversation_id) or {"messages": []}
+        if user_entry:
+            log = {**log, "messages": [m for m in log["messages"] if m["id"] < user_entry["id"]]}
+        result = await run_step_by_step_turn(conversation_id, user_message, user_key=owner_user_key(conversation["user_id"]),
+                                             conversation_data={**conversation, "full_chat_log": TutorLog.history(log)})
+        reply = await asyncio.to_thread(TutorLog.append, conversation_id, "dasida", result["solution"])
+        pending.append(reply)
+        await connection.send(_ws_frame(
+            "message", **reply,
+            current_step=result["current_step"],
+            attempts=result["attempts"],
+            problem_info=result["problem_info"],
+            model=result["model"],
+            token_usage=result["token_usage"]
+        ))
+    except HTTPException as e:
+        await connection.send(_ws_frame("error", status=e.status_code, detail=e.detail))
+    except Exception as e:
+        logger.error(f"튜터 웹소켓 풀이 생성 오류: {e}")
+        await connection.send(_ws_frame("error", status=500, detail="풀이 생성에 실패했습니다."))
+    finally:
+        # 응답 생성이 취소되어도 학생 메시지는 저장
+        if pending:
+            asyncio.create_task(_persist_tutor_messages(conversation, pending))
+
+def _parse_ws_message(raw: str) -> Dict[str, Any]:
+    """JSON 메시지는 그대로, 일반 텍스트는 학생 메시지로 해석합니다."""
+    if raw.startswith("{"):
+        try:
+            data = json.loads(raw)
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+    if raw == WS_PONG_TEXT:
+        return {"type": "pong"}
+    return {"type": "message", "text": raw}
+
 @app.websocket("/ws/tutor/{session_id}")
 async def tutor(ws: WebSocket, session_id: str):
+    """conversation_id(session_id)에 묶인 단계별 풀이 웹소켓
+
+    재연결 시 ?last_id=마지막으로 받은 메시지 id&epoch=hello의 epoch 를 보내면 그 이후 메시지만 다시 받습니다.
+    """
     token = ws.query_params.get("token") or ws.headers.get("authorization","").replace("Bearer ","")
     if not token:
         return await ws.close(code=4401)
@@ -400,28 +877,96 @@ async def tutor(ws: WebSocket, session_id: str):
     except Exception:
         return await ws.close(code=4401)
 
-    await ws.accept()
+    conversation_id = session_id
+    conversation = await asyncio.to_thread(ChatService.get_conversation_meta, conversation_id)
+    if not conversation:
+        return await ws.close(code=4404)
+    # 토큰 subject는 users.id (Spring TokenService). 확인할 수 없으면 다른 사람의 대화로 보고 거절
+    subject = str(claims.get('sub', ''))
+    if not subject.isdigit() or subject != str(conversation["user_id"]):
+        return await ws.close(code=4403)
+
+    connection = await tutor_connections.connect(ws, subject, conversation_id)
+    if connection is None:
+        return
     try:
-        await ws.send_text(f"hello user:{claims['sub']} session:{session_id}")
+        log = await asyncio.to_thread(TutorLog.load, conversation_id)
+        if log is None:
+            # 공유 상태에 로그가 없으면 DB의 최근 메시지로 한 번만 채움
+            await chat_writer.wait_for(conversation_id)
+            history = await asyncio.to_thread(ChatService.get_recent_messages, conversation_id, TUTOR_LOG_SIZE)
+            log = await asyncio.to_thread(TutorLog.create, conversation_id, history)
+        session_state = await asyncio.to_thread(load_tutor_session, conversation_id)
+        await connection.send(_ws_frame(
+            "hello",
+            conversation_id=conversation_id,
+            epoch=log["epoch"],
+            last_id=log["seq"],
+            current_step=session_state.get("current_step", 1),
+            attempts=session_state.get("attempts", {}),
+            problem_info=session_state.get("problem_info")
+        ))
+
+        # 재연결: 클라이언트가 보낸 last_id(없으면 서버에 기록된 마지막 확인 id) 이후 메시지를 다시 보냄
+        try:
+            last_id = int(ws.query_params.get("last_id", log.get("acked", 0)))
+        except ValueError:
+            last_id = 0
+        missed, complete = TutorLog.since(log, last_id)
+        epoch = ws.query_params.get("epoch")
+        if not complete or (epoch is not None and epoch != log["epoch"]):
+            # 로그 범위를 벗어났으면 전체 로그를 다시 받도록 알리고 보관 중인 메시지를 모두 보냄
+            missed = log["messages"]
+            await connection.send(_ws_frame("resync", epoch=log["epoch"]))
+        for entry in missed:
+            await connection.send(_ws_frame("message", **entry, replay=True))
+
         while True:
-            msg = await ws.receive_text()
-            # Gemini API를 사용하여 응답 생성
-            ai_response = await get_gemini_response(msg)
-            await ws.send_text(ai_response)
-    except WebSocketDisconnect:
+            raw = await ws.receive_text()
+            connection.touch()
+            data = _parse_ws_message(raw)
+            frame_type = data.get("type")
+            if frame_type == "pong":
+                continue
+            if frame_type == "ack":
+                if isinstance(data.get("id"), int):
+                    await asyncio.to_thread(TutorLog.ack, conversation_id, data["id"])
+                continue
+            if frame_type not in ("message", "start"):
+                await connection.send(_ws_frame("error", status=400, detail=f"알 수 없는 메시지 유형: {frame_type}"))
+                continue
+            user_message = "시작" if frame_type == "start" else str(data.get("text", "")).strip()
+            if not user_message:
+                continue
+            if len(user_message) > WS_MAX_MESSAGE_CHARS:
+                await connection.send(_ws_frame("error", status=413, detail=f"메시지가 너무 깁니다. {WS_MAX_MESSAGE_CHARS}자 이하로 보내주세요."))
+                continue
+            if not tutor_connections.allow_message(connection):
+                await connection.send(_ws_frame("error", status=429, detail="메시지를 너무 빠르게 보내고 있습니다. 잠시 후 다시 시도해주세요."))
+                continue
+            # 시작 요청은 대화 로그에 남기지 않고, 학생 메시지는 id를 붙여 되돌려 줌 (클라이언트 확인용)
+            user_entry = None
+            if user_message != "시작":
+                user_entry = await asyncio.to_thread(TutorLog.append, conversation_id, "user", user_message)
+                await connection.send(_ws_frame("message", **user_entry))
+            # 진행 중인 이전 응답은 취소하고 새 메시지로 다음 턴 진행
+            tutor_connections.submit(connection, _tutor_ws_turn, connection, conversation, user_message, user_entry)
+    except (WebSocketDisconnect, RuntimeError):
         pass
+    finally:
+        tutor_connections.disconnect(connection)
 
 @app.post("/ai/your-new-endpoint/{p_id}")
 async def your_new_endpoint(p_id: int):
     problem = ProblemService.get_problem_by_id(p_id)
     prompt = PromptEngineeringService.create_your_new_prompt(problem)
-    ai_response = await get_gemini_response(prompt)
+    ai_response = await get_gemini_response(prompt, "your_new_endpoint")
     return {"response": ai_response}
 
 # ===== 프론트엔드용 프롬프팅 엔지니어링 엔드포인트 =====
 
 @app.post("/ai/problem-solution")
-async def get_problem_solution(request: dict):
+async def get_problem_solution(request: dict, http_request: Request):
     """프론트엔드에서 페이지와 문제번호를 받아 AI 풀이를 생성합니다."""
     # request가 문자열인 경우 JSON으로 파싱
     if isinstance(request, str):
@@ -455,27 +1000,22 @@ async def get_problem_solution(request: dict):
             prompt = PromptEngineeringService.create_step_by_step_prompt(problem_data)
         
         # AI 응답 생성
-        ai_response = await get_gemini_response(prompt)
+        request_type = "direct_solution" if solution_type == "direct" else "problem_solution"
+        ai_response = await get_gemini_response(prompt, request_type, user_key=await request_user_key(http_request))
+        prompt_tokens, response_tokens = await count_tokens_async(prompt, ai_response)
         
         return {
             "page_number": page_number,
             "problem_number": problem_number,
             "solution_type": solution_type,
-            "problem_info": {
-                "p_name": problem_data.get("p_name"),
-                "main_chapt": problem_data.get("main_chapt"),
-                "sub_chapt": problem_data.get("sub_chapt"),
-                "p_level": problem_data.get("p_level"),
-                "p_type": problem_data.get("p_type"),
-                "con_type": problem_data.get("con_type")
-            },
+            "problem_info": build_problem_info(problem_data),
             "solution": ai_response,
             "provider": PROVIDER,
-            "model": GEMINI_MODEL,
+            "model": model_router.model_for(model_router.route_for_request_type(request_type)),
             "token_usage": {
-                "prompt_tokens": count_tokens(prompt),
-                "response_tokens": count_tokens(ai_response),
-                "total_tokens": count_tokens(prompt) + count_tokens(ai_response)
+                "prompt_tokens": prompt_tokens,
+                "response_tokens": response_tokens,
+                "total_tokens": prompt_tokens + response_tokens
             }
         }
     except HTTPException:
@@ -484,75 +1024,116 @@ async def get_problem_solution(request: dict):
         logger.error(f"문제 풀이 생성 오류: {e}")
         raise HTTPException(status_code=500, detail=f"문제 풀이 생성 실패: {e}")
 
-@app.post("/ai/step-by-step-solution")
-async def get_step_by_step_solution(request: dict):
-    """대화형 단계별 풀이를 위한 전용 엔드포인트"""
-    try:
-        # request가 문자열인 경우 JSON으로 파싱
-        if isinstance(request, str):
-            try:
-                request = json.loads(request)
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=400, detail="잘못된 JSON 형식입니다.")
-        
-        # 요청 데이터 추출
-        conversation_id = request.get("conversation_id")
-        user_message = request.get("user_message", "")
-        current_step = request.get("current_step", 1)
-        attempts = request.get("attempts", {})
-        
-        # 첫 번째 시작인 경우 (user_message가 '시작'이거나 conversation_id가 없는 경우)
-        if user_message == "시작" or not conversation_id:
-            page_number = request.get("page_number")
-            problem_number = request.get("problem_number")
-            
-            if not page_number or not problem_number:
-                raise HTTPException(status_code=400, detail="페이지 번호와 문제 번호가 필요합니다.")
-            
-            # 문제 데이터 조회
-            problem_data = ProblemService.get_problem_by_page_and_number(page_number, problem_number)
-            if not problem_data:
-                raise HTTPException(status_code=404, detail=f"{page_number}페이지 {problem_number}번 문제를 찾을 수 없습니다.")
-            
-            # 첫 번째 단계 프롬프트 생성
-            prompt = PromptEngineeringService.create_step_by_step_prompt(problem_data)
-            
-            # 대화 컨텍스트 추가
-            conversation_context = f"""
-현재 대화 상태:
-- conversation_id: {conversation_id}
-- current_step: 1
-- attempts: {{}}
-- user_message: "시작"
+def _load_start_problem(page_number: Optional[int], problem_number: Optional[str],
+                        p_id: Optional[int]) -> Dict[str, Any]:
+    """시작 턴의 문제 데이터를 페이지/번호(없으면 대화 세션의 p_id)로 조회합니다."""
+    if (not page_number or not problem_number) and p_id:
+        problem = ProblemService.get_problem_by_id(p_id)
+        if problem:
+            page_number, problem_number = problem.get("p_page"), problem.get("num_in_page")
+    if not page_number or not problem_number:
+        raise HTTPException(status_code=400, detail="페이지 번호와 문제 번호가 필요합니다.")
+    problem_data = ProblemService.get_problem_by_page_and_number(page_number, problem_number)
+    if not problem_data:
+        raise HTTPException(status_code=404, detail=f"{page_number}페이지 {problem_number}번 문제를 찾을 수 없습니다.")
+    return problem_data
 
-첫 번째 단계를 시작하세요. 위의 프롬프트 규칙을 따라 첫 번째 단계만 제시하세요.
-"""
-            
-            full_prompt = prompt + "\n\n" + conversation_context
-            
-        else:
-            # 기존 대화 세션에서 대화 계속
-            # 대화 히스토리 조회
-            conversation_data = ChatService.get_conversation_report(conversation_id)
+async def run_step_by_step_turn(conversation_id: Optional[str], user_message: str, user_key: Optional[str] = None,
+                                current_step: Optional[int] = None, attempts: Optional[Dict[str, Any]] = None,
+                                page_number: Optional[int] = None, problem_number: Optional[str] = None,
+                                conversation_data: Optional[Dict[str, Any]] = None,
+                                fallback_user_key: Optional[str] = None) -> Dict[str, Any]:
+    """단계별 풀이 한 턴을 진행합니다 (HTTP 엔드포인트와 튜터 웹소켓이 함께 사용).
+
+    current_step/attempts가 None이면 서버에 저장된 세션 상태를 사용합니다.
+    토큰 예산 키는 user_key(검증된 사용자) → 대화 주인 → fallback_user_key(클라이언트 IP) 순서로 정합니다.
+    conversation_data(user_id, p_id, full_chat_log)를 넘기면 대화 세션을 DB에서 다시 조회하지 않습니다.
+    """
+    # 이어지는 대화는 서버에 저장된 세션 상태(현재 미니퀴즈 정답 포함)를 불러옴
+    session_state = {}
+    if conversation_id and user_message != "시작":
+        session_state = await asyncio.to_thread(load_tutor_session, conversation_id)
+    # 클라이언트가 상태를 보내지 않으면 세션 상태로 이어서 진행
+    if current_step is None:
+        current_step = session_state.get("current_step", 1)
+    if attempts is None:
+        attempts = session_state.get("attempts", {})
+    quiz = session_state.get("quiz")
+    quiz_result = None
+    cached_opening = None
+    
+    # 첫 번째 시작인 경우 (user_message가 '시작'이거나 conversation_id가 없는 경우)
+    if user_message == "시작" or not conversation_id:
+        # 문제 데이터 조회
+        with span("problem.lookup"):
+            problem_data = _load_start_problem(page_number, problem_number,
+                                               conversation_data.get("p_id") if conversation_data else None)
+        
+        # 첫 번째 단계 프롬프트 생성 (문제마다 같은 프롬프트이므로 미리 만든 응답이 있으면 사용)
+        with span("prompt.build"):
+            full_prompt = PromptEngineeringService.create_first_step_prompt(problem_data)
+        route = ROUTE_STEP_ANSWER
+        with span("first_step.lookup"):
+            cached_opening = await asyncio.to_thread(first_step_cache.get, full_prompt, model_router.model_for(route))
+        
+    else:
+        # 단계 응답 / 추가 질문 / 범위 외 요청에 따라 모델을 나눔
+        route = classify_step_turn(user_message)
+        
+        # 보기 번호, O/X, 숫자 답처럼 단순한 답은 LLM 호출 없이 서버에서 채점
+        if route == ROUTE_STEP_ANSWER and quiz:
+            quiz_result = QuizChecker.grade(quiz, user_message)
+            metrics.QUIZ_LOCAL_GRADES.inc(1.0, quiz["type"], {True: "correct", False: "wrong"}.get(quiz_result, "deferred"))
+        if quiz_result is False and session_state.get("problem_info") is not None:
+            step_key = str(current_step)
+            attempt = int(attempts.get(step_key, 0)) + 1
+            attempts = {**attempts, step_key: attempt}
+            feedback = QuizChecker.wrong_answer_feedback(quiz, attempt)
+            # 정답을 공개한 뒤에는 같은 퀴즈를 다시 채점하지 않음
+            await asyncio.to_thread(save_tutor_session, conversation_id, {
+                **session_state,
+                "current_step": current_step,
+                "attempts": attempts,
+                "quiz": quiz if attempt < MAX_ATTEMPTS_PER_STEP else None
+            })
+            return {
+                "conversation_id": conversation_id,
+                "solution": feedback,
+                "current_step": current_step,
+                "attempts": attempts,
+                "problem_info": session_state["problem_info"],
+                "provider": PROVIDER,
+                "model": "local",
+                "token_usage": {"prompt_tokens": 0, "response_tokens": 0, "total_tokens": 0}
+            }
+        
+        # 기존 대화 세션에서 대화 계속
+        # 대화 히스토리 조회
+        if conversation_data is None:
+            with span("conversation.load"):
+                await chat_writer.wait_for(conversation_id)
+                conversation_data = ChatService.get_conversation_report(conversation_id)
             if not conversation_data:
                 raise HTTPException(status_code=404, detail=f"대화 세션 {conversation_id}를 찾을 수 없습니다.")
-            
-            # 문제 데이터 조회
-            p_id = conversation_data.get("p_id")
-            if not p_id:
-                raise HTTPException(status_code=400, detail="대화 세션에서 p_id를 찾을 수 없습니다.")
-            
+        user_key = user_key or owner_user_key(conversation_data.get("user_id"))
+        
+        # 문제 데이터 조회
+        p_id = conversation_data.get("p_id")
+        if not p_id:
+            raise HTTPException(status_code=400, detail="대화 세션에서 p_id를 찾을 수 없습니다.")
+        
+        with span("problem.lookup"):
             problem_data = ProblemService.get_problem_by_id(p_id)
-            if not problem_data:
-                raise HTTPException(status_code=404, detail="문제 데이터를 찾을 수 없습니다.")
-            
-            # 대화 히스토리 구성
-            chat_history = conversation_data.get("full_chat_log", [])
-            if isinstance(chat_history, dict):
-                chat_history = [chat_history]
-            
-            # 대화 컨텍스트 구성
-            conversation_context = f"""
+        if not problem_data:
+            raise HTTPException(status_code=404, detail="문제 데이터를 찾을 수 없습니다.")
+        
+        # 대화 히스토리 구성
+        chat_history = conversation_data.get("full_chat_log") or []
+        if isinstance(chat_history, dict):
+            chat_history = [chat_history]
+        
+        # 대화 컨텍스트 구성
+        conversation_context = f"""
 현재 대화 상태:
 - conversation_id: {conversation_id}
 - current_step: {current_step}
@@ -561,62 +1142,103 @@ async def get_step_by_step_solution(request: dict):
 
 대화 히스토리:
 """
-            
-            for msg in chat_history[-5:]:  # 최근 5개 메시지만 포함
-                role = msg.get("sender_role", "user")
-                content = msg.get("message", "")
-                if role == "user":
-                    conversation_context += f"학생: {content}\n"
-                else:
-                    conversation_context += f"튜터: {content}\n"
-            
-            conversation_context += f"\n학생의 새로운 응답: {user_message}\n"
-            conversation_context += "\n위의 프롬프트 규칙에 따라 다음 단계를 진행하거나 피드백을 제공하세요."
-            
-            # 프롬프트 생성
-            prompt = PromptEngineeringService.create_step_by_step_prompt(problem_data)
-            full_prompt = prompt + "\n\n" + conversation_context
         
-        # AI 응답 생성
-        ai_response = await get_gemini_response(full_prompt)
+        for msg in chat_history[-5:]:  # 최근 5개 메시지만 포함
+            role = msg.get("sender_role", "user")
+            content = msg.get("message", "")
+            if role == "user":
+                conversation_context += f"학생: {content}\n"
+            else:
+                conversation_context += f"튜터: {content}\n"
         
-        # 응답에서 상태 정보 추출 (숨김 메타데이터)
-        import re
-        state_match = re.search(r'<STATE>(.*?)</STATE>', ai_response, re.DOTALL)
-        current_step_response = current_step
-        attempts_response = attempts
+        conversation_context += f"\n학생의 새로운 응답: {user_message}\n"
+        if quiz_result is True:
+            conversation_context += "(서버 채점 결과: 정답. 다시 채점하지 말고 정답 피드백 후 다음 단계로 진행하세요.)\n"
+        conversation_context += "\n위의 프롬프트 규칙에 따라 다음 단계를 진행하거나 피드백을 제공하세요."
         
-        if state_match:
-            try:
-                state_data = json.loads(state_match.group(1))
-                current_step_response = state_data.get("current_step", current_step)
-                attempts_response = state_data.get("attempts", attempts)
-                # 상태 정보를 응답에서 제거
-                ai_response = re.sub(r'<STATE>.*?</STATE>', '', ai_response, flags=re.DOTALL).strip()
-            except json.JSONDecodeError:
-                pass
-        
-        return {
-            "conversation_id": conversation_id,
-            "solution": ai_response,
+        # 프롬프트 생성
+        with span("prompt.build"):
+            prompt = PromptEngineeringService.create_step_by_step_prompt(problem_data)
+        full_prompt = prompt + "\n\n" + conversation_context
+    
+    user_key = user_key or fallback_user_key
+    
+    # AI 응답 생성
+    if cached_opening:
+        ai_response = cached_opening["text"]
+    else:
+        ai_response = await get_gemini_response(full_prompt, "step_by_step", user_key=user_key, route=route)
+    
+    # 응답에서 상태 정보 추출 (숨김 메타데이터는 화면 표시용 텍스트에서 제거)
+    current_step_response = current_step
+    attempts_response = attempts
+    next_quiz = None
+    with span("state.parse"):
+        ai_response, state_data = TutorStateExtractor.extract(ai_response)
+        if state_data is not None:
+            current_step_response = state_data.get("current_step", current_step)
+            attempts_response = state_data.get("attempts", attempts)
+            # 다음 턴에 서버에서 채점할 미니퀴즈 정답 (클라이언트에는 보내지 않음)
+            next_quiz = QuizChecker.quiz_from_state(state_data, ai_response)
+        elif quiz_result is not True:
+            # 상태 메타데이터가 없으면(응답이 잘리는 등) 아직 풀지 않은 미니퀴즈를 그대로 유지
+            next_quiz = quiz
+    
+    problem_info = build_problem_info(problem_data)
+    if conversation_id:
+        await asyncio.to_thread(save_tutor_session, conversation_id, {
             "current_step": current_step_response,
             "attempts": attempts_response,
-            "problem_info": {
-                "p_name": problem_data.get("p_name"),
-                "main_chapt": problem_data.get("main_chapt"),
-                "sub_chapt": problem_data.get("sub_chapt"),
-                "p_level": problem_data.get("p_level"),
-                "p_type": problem_data.get("p_type"),
-                "con_type": problem_data.get("con_type")
-            },
-            "provider": PROVIDER,
-            "model": GEMINI_MODEL,
-            "token_usage": {
-                "prompt_tokens": count_tokens(full_prompt),
-                "response_tokens": count_tokens(ai_response),
-                "total_tokens": count_tokens(full_prompt) + count_tokens(ai_response)
-            }
+            "quiz": next_quiz,
+            "problem_info": problem_info
+        })
+    
+    if cached_opening:
+        prompt_tokens, response_tokens = cached_opening["prompt_tokens"], cached_opening["response_tokens"]
+        await asyncio.to_thread(log_token_usage, prompt_tokens, response_tokens, prompt_tokens + response_tokens,
+                                cached_opening["model"], "step_by_step", user_key, cache_hit=True)
+    else:
+        prompt_tokens, response_tokens = await count_tokens_async(full_prompt, ai_response)
+    
+    return {
+        "conversation_id": conversation_id,
+        "solution": ai_response,
+        "current_step": current_step_response,
+        "attempts": attempts_response,
+        "problem_info": problem_info,
+        "provider": PROVIDER,
+        "model": cached_opening["model"] if cached_opening else model_router.model_for(route),
+        "token_usage": {
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "total_tokens": prompt_tokens + response_tokens
         }
+    }
+
+@app.post("/ai/step-by-step-solution")
+async def get_step_by_step_solution(request: dict, http_request: Request):
+    """대화형 단계별 풀이를 위한 전용 엔드포인트"""
+    try:
+        # request가 문자열인 경우 JSON으로 파싱
+        if isinstance(request, str):
+            try:
+                request = json.loads(request)
+            except json.JSONDecodeError:
+                raise HTTPException(status_code=400, detail="잘못된 JSON 형식입니다.")
+        
+        # 요청 데이터 추출
+        conversation_id = request.get("conversation_id")
+        user_message = request.get("user_message", "")
+        is_start = user_message == "시작" or not conversation_id
+        return await run_step_by_step_turn(
+            conversation_id, user_message,
+            user_key=await verified_user_key(http_request),
+            fallback_user_key=f"ip:{client_ip(http_request)}",
+            current_step=request.get("current_step", 1 if is_start else None),
+            attempts=request.get("attempts", {} if is_start else None),
+            page_number=request.get("page_number"),
+            problem_number=request.get("problem_number")
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -624,19 +1246,29 @@ async def get_step_by_step_solution(request: dict):
         raise HTTPException(status_code=500, detail=f"대화형 단계별 풀이 생성 실패: {e}")
 
 @app.post("/ai/direct-solution")
-async def get_direct_solution(request: dict):
+async def get_direct_solution(request: dict, http_request: Request):
     """직접 풀이를 위한 전용 엔드포인트"""
-    return await get_problem_solution({**request, "solution_type": "direct"})
+    return await get_problem_solution({**request, "solution_type": "direct"}, http_request)
 
 @app.get("/problems/search")
-async def search_problem_by_page_and_number(page: int, number: str):
+async def search_problem_by_page_and_number(page: int, number: str, request: Request):
     """페이지 번호와 문제 번호로 문제를 검색합니다."""
     try:
+        # 카탈로그 스냅샷 버전이 같으면 결과도 같으므로 조회 없이 304
+        snapshot = catalog.snapshot
+        etag = make_etag("problem", snapshot.version, page, number) if snapshot is not None else None
+        if etag:
+            cached = not_modified(request, etag, snapshot.loaded_at, CATALOG_CACHE_CONTROL)
+            if cached:
+                return cached
+        
         problem_data = ProblemService.get_problem_by_page_and_number(page, number)
         
         if not problem_data:
             raise HTTPException(status_code=404, detail=f"{page}페이지 {number}번 문제를 찾을 수 없습니다.")
         
+        if etag:
+            return FastJSONResponse(problem_data, headers=validator_headers(etag, snapshot.loaded_at, CATALOG_CACHE_CONTROL))
         return problem_data
     except HTTPException:
         raise
@@ -644,36 +1276,61 @@ async def search_problem_by_page_and_number(page: int, number: str):
         logger.error(f"문제 검색 오류: {e}")
         raise HTTPException(status_code=500, detail=f"문제 검색 실패: {e}")
 
+@app.get("/problems/practice-set")
+async def get_practice_set(limit: int = 10, main_chapt: Optional[str] = None, sub_chapt: Optional[str] = None,
+                           p_level: Optional[str] = None, user_id: Optional[int] = None, stratified: bool = True):
+    """연습 문제 세트를 무작위로 구성합니다. user_id가 있으면 이미 풀어본 문제는 제외합니다."""
+    if limit <= 0 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit은 1~100 사이여야 합니다.")
+    try:
+        problems = ProblemService.get_practice_set(
+            limit=limit, main_chapt=main_chapt, sub_chapt=sub_chapt,
+            p_level=p_level, user_id=user_id, stratified=stratified
+        )
+        return {
+            "problems": problems,
+            "count": len(problems)
+        }
+    except Exception as e:
+        logger.error(f"연습 문제 세트 구성 오류: {e}")
+        raise HTTPException(status_code=500, detail=f"연습 문제 세트 구성 실패: {e}")
+
 # 풀이, 유사문제, 교과서 개념
-@app.get("/conversations/{conversation_id}/report")
-async def get_conversation_report(conversation_id: str):
+@app.get("/conversations/{conversation_id}/report", response_model=ConversationReport, response_class=FastJSONResponse)
+async def get_conversation_report(conversation_id: str, request: Request):
     """대화 세션의 상세 정보를 조회합니다."""
     try:
-        conversation_data = ChatService.get_conversation_report(conversation_id)
+        # 마지막 메시지/완료 시각이 그대로면 본문 조회 없이 304
+        await chat_writer.wait_for(conversation_id)
+        version = ChatService.get_conversation_version(conversation_id)
+        if not version:
+            raise HTTPException(status_code=404, detail=f"대화 세션 {conversation_id}를 찾을 수 없습니다.")
+        last_modified = version.get('completed_at') or version.get('message_time') or version.get('started_at')
+        etag = make_etag("conversation", conversation_id, version.get('message_time'), version.get('completed_at'))
+        cached = not_modified(request, etag, last_modified)
+        if cached:
+            return cached
+        
+        conversation_data = ChatService.get_conversation_report(conversation_id, raw_chat_log=RAW_JSONB_PASSTHROUGH)
         
         if not conversation_data:
             raise HTTPException(status_code=404, detail=f"대화 세션 {conversation_id}를 찾을 수 없습니다.")
         
-        # datetime 객체를 문자열로 변환
-        if conversation_data.get('started_at'):
-            conversation_data['started_at'] = conversation_data['started_at'].isoformat()
-        if conversation_data.get('completed_at'):
-            conversation_data['completed_at'] = conversation_data['completed_at'].isoformat()
-        if conversation_data.get('message_time'):
-            conversation_data['message_time'] = conversation_data['message_time'].isoformat()
-        
         # full_chat_log가 리스트인 경우 그대로 유지, 딕셔너리인 경우 리스트로 변환
-        if conversation_data.get('full_chat_log'):
+        if isinstance(conversation_data.get('full_chat_log'), RawJSON):
+            conversation_data['full_chat_log'] = conversation_data['full_chat_log'].as_list()
+        elif conversation_data.get('full_chat_log'):
             if isinstance(conversation_data['full_chat_log'], dict):
-                # 딕셔너리인 경우 그대로 사용
-                conversation_data['full_chat_log'] = ['full_chat_log']
+                # 딕셔너리 하나인 경우 리스트로 감쌈
+                conversation_data['full_chat_log'] = [conversation_data['full_chat_log']]
             elif not isinstance(conversation_data['full_chat_log'], list):
                 # 리스트도 딕셔너리도 아닌 경우 빈 리스트로 설정
                 conversation_data['full_chat_log'] = []
         else:
             conversation_data['full_chat_log'] = []
         
-        return jsonable_encoder(conversation_data)
+        # datetime은 인코더가 ISO 형식으로 직접 변환
+        return FastJSONResponse(conversation_data, headers=validator_headers(etag, last_modified))
     except HTTPException:
         raise
     except Exception as e:
@@ -686,8 +1343,7 @@ async def get_conversation_report(conversation_id: str):
 async def test_basic_data(conversation_id: str):
     """기본 데이터 조회만 테스트합니다."""
     try:
-        logger.info(f"=== 기본 데이터 테스트 시작 ===")
-        logger.info(f"conversation_id: {conversation_id}")
+        logger.debug("기본 데이터 테스트 시작: conversation_id=%s", conversation_id)
         
         # 기본 데이터 조회
         basic_data = ChatService.get_basic_conversation_data(conversation_id)
@@ -696,10 +1352,9 @@ async def test_basic_data(conversation_id: str):
             logger.error(f"기본 데이터를 찾을 수 없음: {conversation_id}")
             raise HTTPException(status_code=404, detail=f"대화 세션 {conversation_id}의 데이터를 찾을 수 없습니다.")
         
-        logger.info(f"기본 데이터 조회 성공:")
-        logger.info(f"  - conversation_info: {basic_data.get('conversation_info', {})}")
-        logger.info(f"  - problem_info: {basic_data.get('problem_info', {})}")
-        logger.info(f"  - chat_messages 개수: {len(basic_data.get('chat_messages', []))}")
+        logger.debug("기본 데이터 조회 성공: conversation_info=%s, problem_info=%s, chat_messages=%d",
+                     basic_data.get('conversation_info', {}), basic_data.get('problem_info', {}),
+                     len(basic_data.get('chat_messages', [])), extra=SAMPLED)
         
         # 테스트 결과 반환
         test_result = {
@@ -728,7 +1383,7 @@ async def test_basic_data(conversation_id: str):
             "textbook_concepts_sample": basic_data.get('textbook_concepts', [])[:3] if basic_data.get('textbook_concepts') and len(basic_data.get('textbook_concepts', [])) > 3 else basic_data.get('textbook_concepts', [])
         }
         
-        logger.info(f"=== 기본 데이터 테스트 완료 ===")
+        logger.debug("기본 데이터 테스트 완료: conversation_id=%s", conversation_id)
         
         return test_result
         
@@ -742,25 +1397,20 @@ async def test_basic_data(conversation_id: str):
 async def incorrect_problem_report_data(conversation_id: str):
     """오답 리포트 생성을 위한 데이터 입력 부분만 테스트합니다."""
     try:
-        logger.info(f"=== 데이터 입력 테스트 시작 ===")
-        logger.info(f"conversation_id: {conversation_id}")
+        logger.debug("데이터 입력 테스트 시작: conversation_id=%s", conversation_id)
         
         # 1. 기본 데이터 조회
-        logger.info("1. 기본 데이터 조회 시작...")
         basic_data = ChatService.get_basic_conversation_data(conversation_id)
         
         if not basic_data:
             logger.error(f"기본 데이터를 찾을 수 없음: {conversation_id}")
             raise HTTPException(status_code=404, detail=f"대화 세션 {conversation_id}의 데이터를 찾을 수 없습니다.")
         
-        logger.info(f"기본 데이터 조회 성공:")
-        logger.info(f"  - conversation_info: {basic_data.get('conversation_info', {})}")
-        logger.info(f"  - problem_info: {basic_data.get('problem_info', {})}")
-        logger.info(f"  - problem_info: {basic_data.get('problem_info', {})}")
-        logger.info(f"  - chat_messages 개수: {len(basic_data.get('chat_messages', []))}")
+        logger.debug("기본 데이터 조회 성공: conversation_info=%s, problem_info=%s, chat_messages=%d",
+                     basic_data.get('conversation_info', {}), basic_data.get('problem_info', {}),
+                     len(basic_data.get('chat_messages', [])), extra=SAMPLED)
         
         # 2. 학생 답안 분석 프롬프트 생성 (실제 AI 호출 없이)
-        logger.info("2. 학생 답안 분석 프롬프트 생성...")
         problem_data = basic_data['problem_info']
         chat_messages = basic_data['chat_messages']
         
@@ -768,12 +1418,9 @@ async def incorrect_problem_report_data(conversation_id: str):
             problem_data, chat_messages
         )
         
-        logger.info(f"학생 답안 분석 프롬프트 생성 완료:")
-        logger.info(f"  - 프롬프트 길이: {len(analysis_prompt)} 문자")
-        logger.info(f"  - 프롬프트 미리보기 (처음 500자): {analysis_prompt[:500]}...")
+        logger.debug("학생 답안 분석 프롬프트: 길이=%d, %.500s", len(analysis_prompt), analysis_prompt, extra=SAMPLED)
         
         # 3. 오답 리포트 프롬프트 생성 (실제 AI 호출 없이)
-        logger.info("3. 오답 리포트 프롬프트 생성...")
         
         # 교과서 개념 정보 활용
         textbook_concepts = basic_data.get('textbook_concepts', [])
@@ -788,9 +1435,7 @@ async def incorrect_problem_report_data(conversation_id: str):
                 'con_description': primary_concept.get('con_description', 'N/A'),
                 'all_concepts': textbook_concepts  # 모든 관련 개념 정보 포함
             }
-            logger.info(f"교과서 개념 정보 활용:")
-            logger.info(f"  - 주요 개념: {primary_concept.get('con_type')} - {primary_concept.get('tb_con')} - {primary_concept.get('tb_sub_con')}")
-            logger.info(f"  - 총 개념 수: {len(textbook_concepts)}")
+            logger.debug("교과서 개념 정보 활용: 주요 개념=%s, 총 개념 수=%d", primary_concept, len(textbook_concepts))
         else:
             # 기존 방식으로 fallback
             textbook_concept = {
@@ -801,7 +1446,7 @@ async def incorrect_problem_report_data(conversation_id: str):
                 'con_description': 'N/A',
                 'all_concepts': []
             }
-            logger.info("교과서 개념 정보 없음 - 기존 방식 사용")
+            logger.debug("교과서 개념 정보 없음 - 기존 방식 사용")
         
         conversation_log = {
             'full_chat_log': chat_messages,
@@ -812,18 +1457,13 @@ async def incorrect_problem_report_data(conversation_id: str):
             problem_data, textbook_concept, conversation_log
         )
         
-        logger.info(f"오답 리포트 프롬프트 생성 완료:")
-        logger.info(f"  - 프롬프트 길이: {len(report_prompt)} 문자")
-        logger.info(f"  - 프롬프트 미리보기 (처음 500자): {report_prompt[:500]}...")
+        logger.debug("오답 리포트 프롬프트: 길이=%d, %.500s", len(report_prompt), report_prompt, extra=SAMPLED)
         
         # 4. 토큰 사용량 계산
-        analysis_tokens = count_tokens(analysis_prompt)
-        report_tokens = count_tokens(report_prompt)
+        analysis_tokens, report_tokens = await count_tokens_async(analysis_prompt, report_prompt)
         
-        logger.info(f"4. 토큰 사용량 계산 완료:")
-        logger.info(f"  - 분석 프롬프트 토큰: {analysis_tokens}")
-        logger.info(f"  - 리포트 프롬프트 토큰: {report_tokens}")
-        logger.info(f"  - 총 프롬프트 토큰: {analysis_tokens + report_tokens}")
+        logger.debug("토큰 사용량: 분석 프롬프트=%d, 리포트 프롬프트=%d, 총=%d",
+                     analysis_tokens, report_tokens, analysis_tokens + report_tokens)
         
         # 5. 테스트 결과 반환
         test_result = {
@@ -864,7 +1504,7 @@ async def incorrect_problem_report_data(conversation_id: str):
             "textbook_concept_used": textbook_concept
         }
         
-        logger.info(f"=== 데이터 입력 테스트 완료 ===")
+        logger.debug("데이터 입력 테스트 완료: conversation_id=%s", conversation_id)
         
         return test_result
         
@@ -878,8 +1518,7 @@ async def incorrect_problem_report_data(conversation_id: str):
 async def test_basic_data(conversation_id: str):
     """기본 데이터 조회만 테스트합니다."""
     try:
-        logger.info(f"=== 기본 데이터 테스트 시작 ===")
-        logger.info(f"conversation_id: {conversation_id}")
+        logger.debug("기본 데이터 테스트 시작: conversation_id=%s", conversation_id)
         
         # 기본 데이터 조회
         basic_data = ChatService.get_basic_conversation_data(conversation_id)
@@ -888,10 +1527,9 @@ async def test_basic_data(conversation_id: str):
             logger.error(f"기본 데이터를 찾을 수 없음: {conversation_id}")
             raise HTTPException(status_code=404, detail=f"대화 세션 {conversation_id}의 데이터를 찾을 수 없습니다.")
         
-        logger.info(f"기본 데이터 조회 성공:")
-        logger.info(f"  - conversation_info: {basic_data.get('conversation_info', {})}")
-        logger.info(f"  - problem_info: {basic_data.get('problem_info', {})}")
-        logger.info(f"  - chat_messages 개수: {len(basic_data.get('chat_messages', []))}")
+        logger.debug("기본 데이터 조회 성공: conversation_info=%s, problem_info=%s, chat_messages=%d",
+                     basic_data.get('conversation_info', {}), basic_data.get('problem_info', {}),
+                     len(basic_data.get('chat_messages', [])), extra=SAMPLED)
         
         # 테스트 결과 반환
         test_result = {
@@ -920,7 +1558,7 @@ async def test_basic_data(conversation_id: str):
             "textbook_concepts_sample": basic_data.get('textbook_concepts', [])[:3] if basic_data.get('textbook_concepts') and len(basic_data.get('textbook_concepts', [])) > 3 else basic_data.get('textbook_concepts', [])
         }
         
-        logger.info(f"=== 기본 데이터 테스트 완료 ===")
+        logger.debug("기본 데이터 테스트 완료: conversation_id=%s", conversation_id)
         
         return test_result
         
@@ -932,27 +1570,22 @@ async def test_basic_data(conversation_id: str):
 
 # 오답 리포트 생성 API
 @app.post("/incorrect-answer-report/{conversation_id}")
-async def generate_incorrect_answer_report(conversation_id: str):
+async def generate_incorrect_answer_report(conversation_id: str, http_request: Request):
     """오답 리포트를 생성합니다."""
     try:
-        logger.info(f"=== 오답 리포트 생성 시작 ===")
-        logger.info(f"conversation_id: {conversation_id}")
+        logger.debug("오답 리포트 생성 시작: conversation_id=%s", conversation_id)
         
         # 1. 기본 데이터 조회
-        logger.info("1. 기본 데이터 조회 시작...")
+        await chat_writer.wait_for(conversation_id)
         basic_data = ChatService.get_basic_conversation_data(conversation_id)
         
         if not basic_data:
             logger.error(f"기본 데이터를 찾을 수 없음: {conversation_id}")
             raise HTTPException(status_code=404, detail=f"대화 세션 {conversation_id}의 데이터를 찾을 수 없습니다.")
         
-        logger.info(f"기본 데이터 조회 성공:")
-        logger.info(f"  - conversation_info: {basic_data.get('conversation_info', {})}")
-        logger.info(f"  - problem_info: {basic_data.get('problem_info', {})}")
-        logger.info(f"  - chat_messages 개수: {len(basic_data.get('chat_messages', []))}")
+        logger.debug("기본 데이터 조회 성공: %s", basic_data, extra=SAMPLED)
         
         # 2. 오답 리포트 프롬프트 생성 및 LLM 호출
-        logger.info("2. 오답 리포트 프롬프트 생성 및 LLM 호출...")
         problem_data = basic_data['problem_info']
         chat_messages = basic_data['chat_messages']
         
@@ -969,9 +1602,7 @@ async def generate_incorrect_answer_report(conversation_id: str):
                 'con_description': primary_concept.get('con_description', 'N/A'),
                 'all_concepts': textbook_concepts  # 모든 관련 개념 정보 포함
             }
-            logger.info(f"교과서 개념 정보 활용:")
-            logger.info(f"  - 주요 개념: {primary_concept.get('con_type')} - {primary_concept.get('tb_con')} - {primary_concept.get('tb_sub_con')}")
-            logger.info(f"  - 총 개념 수: {len(textbook_concepts)}")
+            logger.debug("교과서 개념 정보 활용: 주요 개념=%s, 총 개념 수=%d", primary_concept, len(textbook_concepts))
         else:
             # 기존 방식으로 fallback
             textbook_concept = {
@@ -982,7 +1613,7 @@ async def generate_incorrect_answer_report(conversation_id: str):
                 'con_description': 'N/A',
                 'all_concepts': []
             }
-            logger.info("교과서 개념 정보 없음 - 기존 방식 사용")
+            logger.debug("교과서 개념 정보 없음 - 기존 방식 사용")
         
         conversation_log = {
             'full_chat_log': chat_messages,
@@ -993,28 +1624,26 @@ async def generate_incorrect_answer_report(conversation_id: str):
             problem_data, textbook_concept, conversation_log
         )
         
-        logger.info(f"오답 리포트 프롬프트 생성 완료:")
-        logger.info(f"  - 프롬프트 길이: {len(report_prompt)} 문자")
+        logger.debug("오답 리포트 프롬프트: %.500s", report_prompt, extra=SAMPLED)
         
-        # LLM 호출
-        report_response = model.generate_content(report_prompt)
+        # LLM 호출 (토큰 예산 확인 후)
+        user_id = await request_user_key(http_request, basic_data['conversation_info'].get('user_id'))
+        reserved = await admission.admit("incorrect_answer_report", user_id, report_prompt)
+        try:
+            report_response, report_model = await model_router.generate(report_prompt, "incorrect_answer_report")
+        except Exception:
+            admission.settle(user_id, reserved, 0)
+            raise
         report_content = report_response.text
         
-        logger.info(f"오답 리포트 LLM 응답 완료:")
-        logger.info(f"  - 응답 길이: {len(report_content)} 문자")
-        
         # 3. 토큰 사용량 계산 및 로깅
-        report_tokens = count_tokens(report_prompt)
-        report_response_tokens = count_tokens(report_content)
+        report_tokens, report_response_tokens = await count_tokens_async(report_prompt, report_content)
         total_tokens = report_tokens + report_response_tokens
         
         # 토큰 사용량 로깅
-        log_token_usage(report_tokens, report_response_tokens, total_tokens, GEMINI_MODEL, "incorrect_answer_report")
-        
-        logger.info(f"3. 토큰 사용량 계산 완료:")
-        logger.info(f"  - 리포트 프롬프트 토큰: {report_tokens}")
-        logger.info(f"  - 리포트 응답 토큰: {report_response_tokens}")
-        logger.info(f"  - 총 토큰: {total_tokens}")
+        await asyncio.to_thread(log_token_usage, report_tokens, report_response_tokens, total_tokens, report_model,
+                                "incorrect_answer_report", user_id)
+        admission.settle(user_id, reserved, total_tokens)
         
         # 4. 결과 반환
         result = {
@@ -1047,7 +1676,8 @@ async def generate_incorrect_answer_report(conversation_id: str):
             }
         }
         
-        logger.info(f"=== 오답 리포트 생성 완료 ===")
+        logger.info("오답 리포트 생성 완료: conversation_id=%s, 프롬프트 %d자, 응답 %d자",
+                    conversation_id, len(report_prompt), len(report_content))
         
         return result
         
@@ -1062,8 +1692,7 @@ async def generate_incorrect_answer_report(conversation_id: str):
 async def save_report(request: dict):
     """reports 테이블에 리포트 데이터를 저장합니다."""
     try:
-        logger.info(f"=== reports 테이블 저장 시작 ===")
-        logger.info(f"요청 데이터: {request}")
+        logger.debug("reports 테이블 저장 요청: %s", request, extra=SAMPLED)
         
         # 필수 필드 검증
         required_fields = ['conversation_id', 'user_id', 'p_id', 'full_report_content']
@@ -1104,7 +1733,11 @@ async def save_report(request: dict):
             report_id = result['report_id']
             conn.commit()
             
-            logger.info(f"reports 테이블 저장 성공: report_id={report_id}")
+            logger.info("reports 테이블 저장 성공: report_id=%s", report_id)
+            
+            # 새 리포트로 오답 성향이 바뀌었으므로 추천 프로필 캐시 무효화
+            recommender.invalidate_user(request['user_id'])
+            await asyncio.to_thread(shared_state.publish, "recommend_invalidate", {"user_id": request['user_id']})
             
             return {
                 "status": "success",
@@ -1119,12 +1752,17 @@ async def save_report(request: dict):
         raise HTTPException(status_code=500, detail=f"리포트 저장 실패: {e}")
 
 # reports 테이블 조회 API
-@app.get("/reports/{conversation_id}")
-async def get_report_by_conversation(conversation_id: str):
+@app.get("/reports/{conversation_id}", response_model=ReportRecord, response_class=FastJSONResponse)
+async def get_report_by_conversation(conversation_id: str, request: Request):
     """conversation_id로 reports 테이블에서 리포트 데이터를 조회합니다."""
     try:
-        logger.info(f"=== reports 테이블 조회 시작 ===")
-        logger.info(f"conversation_id: {conversation_id}")
+        # 리포트 행은 저장 후 바뀌지 않으므로 최신 report_id/생성 시각이 같으면 본문 조회 없이 304
+        version = ReportService.get_latest_report_version(conversation_id)
+        if version:
+            cached = not_modified(request, make_etag("report", version['report_id'], version['created_at']),
+                                  version['created_at'])
+            if cached:
+                return cached
         
         conn = db_manager.get_connection()
         with conn.cursor() as cursor:
@@ -1135,25 +1773,17 @@ async def get_report_by_conversation(conversation_id: str):
             LIMIT 1
             """
             
-            logger.info(f"쿼리 실행: {query}")
-            logger.info(f"파라미터: {conversation_id}")
-            
             cursor.execute(query, (conversation_id,))
             result = cursor.fetchone()
             
-            logger.info(f"쿼리 결과: {result}")
+            logger.debug("reports 조회 결과: %s", result, extra=SAMPLED)
             
             if result:
-                # datetime 객체를 문자열로 변환
-                if result.get('created_at'):
-                    result['created_at'] = result['created_at'].isoformat()
-                if result.get('generated_at'):
-                    result['generated_at'] = result['generated_at'].isoformat()
-                
-                logger.info(f"reports 테이블 조회 성공: report_id={result['report_id']}")
-                return result
+                logger.debug("reports 테이블 조회 성공: report_id=%s", result['report_id'])
+                etag = make_etag("report", result['report_id'], result['created_at'])
+                return FastJSONResponse(result, headers=validator_headers(etag, result['created_at']))
             else:
-                logger.info(f"conversation_id {conversation_id}에 해당하는 리포트가 없습니다")
+                logger.debug("conversation_id %s에 해당하는 리포트가 없습니다", conversation_id)
                 raise HTTPException(status_code=404, detail=f"conversation_id {conversation_id}에 해당하는 리포트를 찾을 수 없습니다")
             
     except HTTPException:
@@ -1162,61 +1792,90 @@ async def get_report_by_conversation(conversation_id: str):
         logger.error(f"reports 테이블 조회 오류: {e}")
         raise HTTPException(status_code=500, detail=f"리포트 조회 실패: {e}")
 
+# 문제 이미지 API
+@app.get("/images/{path:path}")
+async def get_problem_image(path: str, request: Request, w: Optional[int] = None):
+    """문제 이미지를 요청 폭(w)과 브라우저가 지원하는 포맷(AVIF/WebP)에 맞춰 제공합니다. 변환본이 없으면 원본을 제공합니다."""
+    selected = image_pipeline.select(path, w, request.headers.get("accept", ""))
+    if selected:
+        file_path, media_type, content_hash = selected
+        etag = make_etag("image", content_hash, os.path.basename(file_path))
+    else:
+        file_path = await asyncio.to_thread(image_pipeline.original_path, path)
+        if file_path is None:
+            raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다")
+        media_type = None
+        stat = await asyncio.to_thread(os.stat, file_path)
+        etag = make_etag("image", path, stat.st_size, stat.st_mtime)
+    # 같은 URL이라도 Accept에 따라 포맷이 달라지므로 Vary: Accept
+    headers = {**validator_headers(etag, cache_control=ORIGINAL_CACHE_CONTROL), "Vary": "Accept"}
+    cached = not_modified(request, etag, cache_control=ORIGINAL_CACHE_CONTROL)
+    if cached is not None:
+        cached.headers["Vary"] = "Accept"
+        return cached
+    # FileResponse가 Range 요청과 스레드에서의 파일 읽기를 처리
+    return FileResponse(file_path, media_type=media_type, headers=headers)
+
 # 유사문제 추천 API
 @app.get("/similar-problems/{p_id}")
-async def get_similar_problem(p_id: int):
+async def get_similar_problem(p_id: int, request: Request):
     """p_id에 해당하는 문제의 유사문제를 추천합니다."""
     try:
-        logger.info(f"=== 유사문제 추천 시작 ===")
-        logger.info(f"p_id: {p_id}")
-        
-        conn = db_manager.get_connection()
-        with conn.cursor() as cursor:
-            # problem_sim_map 테이블을 통해 유사문제 조회
-            query = """
-            SELECT 
-                s.sim_p_id,
-                s.p_name,
-                s.p_page,
-                s.num_in_page,
-                s.p_img_url,
-                s.main_chapt,
-                s.sub_chapt,
-                s.con_type,
-                s.p_type,
-                s.p_level,
-                s.p_text,
-                s.answer,
-                s.solution
-            FROM problem_sim_map m
-            JOIN sim_problems s ON s.sim_p_id = m.sim_p_id
-            WHERE m.p_id = %s
-            LIMIT 1
-            """
-            
-            logger.info(f"쿼리 실행: {query}")
-            logger.info(f"파라미터: {p_id}")
-            
-            cursor.execute(query, (p_id,))
-            result = cursor.fetchone()
-            
-            logger.info(f"쿼리 결과: {result}")
-            
-            if result:
-                # datetime 객체를 문자열로 변환
-                if result.get('created_date'):
-                    result['created_date'] = result['created_date'].isoformat()
-                if result.get('data'):
-                    result['data'] = result['data'].isoformat()
-                
-                logger.info(f"유사문제 추천 성공: sim_p_id={result['sim_p_id']}")
-                return result
-            else:
-                logger.info(f"p_id {p_id}에 해당하는 유사문제가 없습니다")
-                raise HTTPException(status_code=404, detail=f"p_id {p_id}에 해당하는 유사문제를 찾을 수 없습니다")
-            
+        # 사용자와 무관한 추천이므로 카탈로그 스냅샷 버전이 같으면 결과도 같음
+        snapshot = catalog.snapshot
+        etag = make_etag("similar", snapshot.version, p_id) if snapshot is not None else None
+        if etag:
+            cached = not_modified(request, etag, snapshot.loaded_at, CATALOG_CACHE_CONTROL)
+            if cached:
+                return cached
+
+        # 카탈로그가 로드되어 있으면 순위가 가장 높은 유사문제, 아니면 매핑된 첫 유사문제
+        ranked = await asyncio.to_thread(recommender.recommend, p_id, k=1)
+        if ranked:
+            result = ranked[0]
+            result.pop('score', None)
+            result.pop('reasons', None)
+        else:
+            similar_problems = ProblemService.get_similar_problems(p_id)
+            result = similar_problems[0] if similar_problems else None
+
+        logger.debug("유사문제 조회 결과: %s", result, extra=SAMPLED)
+
+        if result:
+            # datetime 객체를 문자열로 변환
+            if result.get('created_date'):
+                result['created_date'] = result['created_date'].isoformat()
+            if result.get('data'):
+                result['data'] = result['data'].isoformat()
+
+            logger.debug("유사문제 추천 성공: p_id=%s, sim_p_id=%s", p_id, result['sim_p_id'])
+            if etag:
+                return FastJSONResponse(result, headers=validator_headers(etag, snapshot.loaded_at, CATALOG_CACHE_CONTROL))
+            return result
+        else:
+            logger.debug("p_id %s에 해당하는 유사문제가 없습니다", p_id)
+            raise HTTPException(status_code=404, detail=f"p_id {p_id}에 해당하는 유사문제를 찾을 수 없습니다")
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"유사문제 추천 오류: {e}")
         raise HTTPException(status_code=500, detail=f"유사문제 추천 실패: {e}")
+
+@app.get("/similar-problems/{p_id}/ranked")
+async def get_ranked_similar_problems(p_id: int, k: int = 5, user_id: Optional[int] = None):
+    """p_id와 유사한 문제를 개념 겹침, 난이도 차이, 사용자 오답 성향으로 순위를 매겨 반환합니다."""
+    if k <= 0 or k > 50:
+        raise HTTPException(status_code=400, detail="k는 1~50 사이여야 합니다.")
+    if catalog.snapshot is None:
+        raise HTTPException(status_code=503, detail="문제 카탈로그가 아직 로드되지 않았습니다.")
+    try:
+        recommendations = await asyncio.to_thread(recommender.recommend, p_id, k, user_id)
+        return {
+            "p_id": p_id,
+            "recommendations": recommendations,
+            "count": len(recommendations)
+        }
+    except Exception as e:
+        logger.error(f"유사문제 순위 추천 오류: {e}")
+        raise HTTPException(status_code=500, detail=f"유사문제 순위 추천 실패: {e}")
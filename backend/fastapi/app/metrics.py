@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Prometheus 텍스트 노출 형식의 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric(ABC):
+    """레이블별 값을 보관하는 메트릭 기본 클래스"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Prometheus 텍스트 형식의 줄 목록을 반환합니다."""
+
+class Counter(_Metric):
+    """단조 증가 카운터"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+class Gauge(_Metric):
+    """임의로 증감하는 게이지"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        self._values[labelvalues] = value
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, *labelvalues: str) -> None:
+        self.inc(-amount, *labelvalues)
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    """고정 버킷 히스토그램 (관측 시에는 버킷 하나만 증가시키고 누적은 출력 시 계산)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 레이블 값 → [버킷별 개수..., +Inf 개수, 합계]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [0.0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labelvalues, state in sorted(self._values.items()):
+            cumulative = 0.0
+            for upper, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(upper) + '"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {_format_value(cumulative)}"
+                )
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+class Registry:
+    """메트릭 목록을 보관하고 텍스트 형식으로 출력하는 클래스"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# 전역 레지스트리 및 메트릭 정의
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+HTTP_REQUESTS_IN_PROGRESS = registry.gauge(
+    "http_requests_in_progress", "HTTP requests currently being served"
+)
+DB_QUERY_DURATION = registry.histogram(
+    "db_query_duration_seconds", "Duration of individual DB statements"
+)
+DB_QUERIES_PER_REQUEST = registry.histogram(
+    "db_queries_per_request", "Number of DB statements executed per HTTP request", ("route",), COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = registry.histogram(
+    "db_time_per_request_seconds", "Total DB time spent per HTTP request", ("route",)
+)
+LLM_TIME_TO_FIRST_TOKEN = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed LLM chunk", ("model", "request_type"), LLM_BUCKETS
+)
+LLM_REQUEST_DURATION = registry.histogram(
+    "llm_request_duration_seconds", "Total LLM generation time", ("model", "request_type"), LLM_BUCKETS
+)
+LLM_REQUESTS = registry.counter(
+    "llm_requests_total", "LLM calls by outcome", ("model", "request_type", "outcome")
+)
+LLM_RETRIES = registry.counter(
+    "llm_retries_total", "LLM calls retried after a transient error", ("model", "request_type")
+)
+LLM_HEDGES = registry.counter(
+    "llm_hedged_requests_total", "Hedged second LLM requests sent after the latency threshold", ("model", "request_type")
+)
+LLM_BREAKER_REJECTIONS = registry.counter(
+    "llm_breaker_rejections_total", "LLM calls rejected while the circuit breaker was open", ("model", "request_type")
+)
+MODEL_ROUTES = registry.counter(
+    "llm_model_routes_total", "LLM calls by routing class and selected model", ("route", "model")
+)
+QUIZ_LOCAL_GRADES = registry.counter(
+    "quiz_local_grades_total", "Mini-quiz replies graded locally by quiz type and result (deferred = sent to LLM)", ("quiz_type", "result")
+)
+TUTOR_STATE_PARSES = registry.counter(
+    "tutor_state_parses_total", "Hidden tutor state metadata parse results by marker format", ("format", "result")
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "LLM tokens consumed", ("request_type", "model", "kind")
+)
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit/miss)", ("cache", "result")
+)
+WEBSOCKET_CONNECTIONS = registry.gauge(
+    "websocket_connections", "Open websocket connections", ("endpoint",)
+)
+WEBSOCKET_GENERATIONS_IN_FLIGHT = registry.gauge(
+    "websocket_generations_in_flight", "Websocket replies currently being generated", ("endpoint",)
+)
+WEBSOCKET_EVENTS = registry.counter(
+    "websocket_events_total", "Websocket connection manager events (superseded, rate_limited, idle_timeout, ...)", ("event",)
+)
+CHAT_WRITE_BATCH_SIZE = registry.histogram(
+    "chat_write_batch_rows", "Chat messages written per write-behind batch",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+CHAT_WRITE_FLUSH_DURATION = registry.histogram(
+    "chat_write_flush_seconds", "Time to insert and commit one write-behind batch"
+)
+CHAT_WRITE_ROWS = registry.counter(
+    "chat_write_rows_total", "Chat messages handled by the write-behind buffer by result", ("result",)
+)
+ADMISSION_DECISIONS = registry.counter(
+    "llm_admission_decisions_total", "LLM admission decisions by priority class", ("priority", "outcome")
+)
+ADMISSION_WAIT = registry.histogram(
+    "llm_admission_wait_seconds", "Time queued LLM requests waited for token budget", ("priority",)
+)
+HEALTH_CHECK_UP = registry.gauge(
+    "health_check_up", "Last background dependency check result (1 = ok)", ("check",)
+)
+EVENT_LOOP_LAG = registry.gauge(
+    "event_loop_lag_seconds", "Most recent event loop scheduling lag"
+)
+EVENT_LOOP_LAG_HISTOGRAM = registry.histogram(
+    "event_loop_lag_observed_seconds", "Event loop scheduling lag samples",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+def record_cache(cache: str, hit: bool) -> None:
+    """캐시 조회 결과를 기록합니다."""
+    CACHE_REQUESTS.inc(1.0, cache, "hit" if hit else "miss")
+
+# 요청 단위 DB 통계 ([쿼리 수, 누적 시간])
+_db_stats: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("db_stats", default=None)
+
+def record_db_query(elapsed: float) -> None:
+    """DB 쿼리 한 건의 실행 시간을 기록합니다."""
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = _db_stats.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+class MetricsMiddleware:
+    """라우트별 지연 시간과 요청당 DB 사용량을 기록하는 ASGI 미들웨어"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _db_stats.set(stats)
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        start_time = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            _db_stats.reset(token)
+            # 경로 파라미터 대신 라우트 템플릿으로 집계해 레이블 수가 늘어나지 않도록 함
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(elapsed, scope["method"], route_path, str(status["code"]))
+            DB_QUERIES_PER_REQUEST.observe(stats[0], route_path)
+            DB_TIME_PER_REQUEST.observe(stats[1], route_path)
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """이벤트 루프가 예정보다 늦게 깨어난 시간을 주기적으로 기록합니다."""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import re
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from . import metrics
+from .llm_client import LLMClient
+
+# 요청 분류
+ROUTE_STEP_ANSWER = "step_answer"      # 단계 진행 (학생의 단계 응답)
+ROUTE_FOLLOW_UP = "follow_up"          # 직전 단계에 대한 추가 질문 (1~2문장 답변)
+ROUTE_OUT_OF_SCOPE = "out_of_scope"    # 범위 외 요청 (한 줄 안내)
+ROUTE_FULL_SOLUTION = "full_solution"  # 전체 풀이 생성
+ROUTE_REPORT = "report"                # 오답 리포트
+ROUTE_GENERAL = "general"              # 그 밖의 호출 (/chat 등)
+
+LIGHT_MODEL = "gemini-2.5-flash-lite"
+
+# 분류별 모델 (MODEL_<분류> 환경 변수로 변경, 없으면 기본 모델 GEMINI_MODEL)
+ROUTE_MODELS = {
+    ROUTE_STEP_ANSWER: os.getenv("MODEL_STEP_ANSWER"),
+    ROUTE_FOLLOW_UP: os.getenv("MODEL_FOLLOW_UP", LIGHT_MODEL),
+    ROUTE_OUT_OF_SCOPE: os.getenv("MODEL_OUT_OF_SCOPE", LIGHT_MODEL),
+    ROUTE_FULL_SOLUTION: os.getenv("MODEL_FULL_SOLUTION"),
+    ROUTE_REPORT: os.getenv("MODEL_REPORT"),
+    ROUTE_GENERAL: os.getenv("MODEL_GENERAL"),
+}
+
+# 분류별 동시 호출 수 (CONCURRENCY_<분류> 환경 변수로 변경). 긴 리포트가 짧은 응답의 자리를 차지하지 않도록 분리
+ROUTE_CONCURRENCY = {
+    ROUTE_STEP_ANSWER: int(os.getenv("CONCURRENCY_STEP_ANSWER", "32")),
+    ROUTE_FOLLOW_UP: int(os.getenv("CONCURRENCY_FOLLOW_UP", "32")),
+    ROUTE_OUT_OF_SCOPE: int(os.getenv("CONCURRENCY_OUT_OF_SCOPE", "8")),
+    ROUTE_FULL_SOLUTION: int(os.getenv("CONCURRENCY_FULL_SOLUTION", "16")),
+    ROUTE_REPORT: int(os.getenv("CONCURRENCY_REPORT", "4")),
+    ROUTE_GENERAL: int(os.getenv("CONCURRENCY_GENERAL", "8")),
+}
+
+# 분류별 생성 설정. 단계별 풀이 경로(단계 응답/추가 질문/범위 외)는 응답 끝에 숨김 상태 메타데이터를 써야 하므로
+# max_output_tokens로 자르지 않음 (잘리면 미니퀴즈와 단계 상태가 사라짐). 짧은 답변은 가벼운 모델과 프롬프트 규칙으로 유도
+ROUTE_GENERATION_CONFIG: Dict[str, Optional[Dict[str, Any]]] = {}
+
+# request_type → 분류 (단계별 풀이는 학생 메시지로 다시 분류)
+REQUEST_TYPE_ROUTES = {
+    "step_by_step": ROUTE_STEP_ANSWER,
+    "tutor_ws": ROUTE_STEP_ANSWER,
+    "problem_solution": ROUTE_FULL_SOLUTION,
+    "direct_solution": ROUTE_FULL_SOLUTION,
+    "incorrect_answer_report": ROUTE_REPORT,
+}
+
+# 프롬프트의 "모드 판별 규칙"을 따르는 추가 질문 판별 패턴
+_STEP_BUTTON = re.compile(r"^\s*\[\d+단계\]")
+_FIXED_BUTTONS = ("문제가 이해가 안 돼", "다른 풀이 방법 보고 싶어")
+_FOLLOW_UP_WORDS = re.compile(r"왜|이유|근거|어떻게|다른 방법|여기서|이 식|단계에서|이해가 안|모르겠|헷갈|맞아\?|뭐야|무슨 뜻")
+# 단계 응답으로 볼 수 있는 표현 (숫자, 식, 보기 번호, 진행 요청)
+_ANSWER_LIKE = re.compile(r"[0-9①②③④⑤=+\-*/×÷√^]|다음|정답|시작|계속|네|응|아니")
+# 수학과 무관한 요청 키워드
+_OFF_TOPIC_WORDS = re.compile(r"게임|노래|날씨|연애|유튜브|웹툰|아이돌|영화|드라마|숙제 대신|다른 과목|영어|과학")
+
+def classify_step_turn(user_message: str) -> str:
+    """단계별 풀이 대화에서 학생 메시지를 단계 응답 / 추가 질문 / 범위 외로 분류합니다."""
+    message = (user_message or "").strip()
+    if not message or message == "시작":
+        return ROUTE_STEP_ANSWER
+    # 버튼 클릭은 무조건 추가 질문
+    if _STEP_BUTTON.match(message) or message in _FIXED_BUTTONS:
+        return ROUTE_FOLLOW_UP
+    # 직전 풀이를 참조하는 질문은 답이 섞여 있어도 추가 질문 우선
+    if _FOLLOW_UP_WORDS.search(message):
+        return ROUTE_FOLLOW_UP
+    if _ANSWER_LIKE.search(message):
+        return ROUTE_STEP_ANSWER
+    if _OFF_TOPIC_WORDS.search(message):
+        return ROUTE_OUT_OF_SCOPE
+    return ROUTE_STEP_ANSWER
+
+class ModelRouter:
+    """요청 분류별로 모델과 동시 호출 풀을 나눠 LLM 호출을 보내는 라우터"""
+
+    def __init__(self, model_factory: Callable[[str], Any], default_model: str):
+        self._model_factory = model_factory
+        self.default_model = default_model
+        self._clients: Dict[str, LLMClient] = {}
+        self._semaphores = {route: asyncio.Semaphore(limit) for route, limit in ROUTE_CONCURRENCY.items()}
+
+    @staticmethod
+    def route_for_request_type(request_type: str) -> str:
+        return REQUEST_TYPE_ROUTES.get(request_type, ROUTE_GENERAL)
+
+    def model_for(self, route: str) -> str:
+        return ROUTE_MODELS.get(route) or self.default_model
+
+    def client_for(self, route: str) -> LLMClient:
+        """분류에 해당하는 모델의 LLM 클라이언트를 반환합니다 (모델별로 회로 차단기와 지연 통계를 따로 가짐)."""
+        model_name = self.model_for(route)
+        client = self._clients.get(model_name)
+        if client is None:
+            client = self._clients[model_name] = LLMClient(self._model_factory(model_name), model_name)
+        return client
+
+    def breaker_states(self) -> Dict[str, str]:
+        """지금까지 사용한 모델별 회로 차단기 상태(closed, open, half_open)를 반환합니다."""
+        return {model_name: client.breaker.state for model_name, client in self._clients.items()}
+
+    @asynccontextmanager
+    async def slot(self, route: str) -> AsyncIterator[None]:
+        """분류별 동시 호출 풀에서 자리를 얻습니다."""
+        async with self._semaphores.get(route, self._semaphores[ROUTE_GENERAL]):
+            yield
+
+    async def generate(self, prompt: str, request_type: str, route: Optional[str] = None):
+        """분류에 맞는 모델과 동시 호출 풀로 응답을 생성하고 (응답, 모델 이름)을 반환합니다."""
+        route = route or self.route_for_request_type(request_type)
+        client = self.client_for(route)
+        metrics.MODEL_ROUTES.inc(1.0, route, client.model_name)
+        async with self.slot(route):
+            response = await client.generate(prompt, request_type, generation_config=ROUTE_GENERATION_CONFIG.get(route))
+        return response, client.model_name
@@ -0,0 +1,192 @@
+import logging
+import os
+import random
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple, Iterable, Set, Any
+from .database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 카탈로그 변경 여부를 다시 확인하기까지의 간격(초)
+SAMPLER_REFRESH_INTERVAL = int(os.getenv("SAMPLER_REFRESH_INTERVAL", "300"))
+
+# (p_level, main_chapt, sub_chapt) - None은 해당 조건을 사용하지 않음을 의미
+PoolKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+class ProblemSampler:
+    """난이도/단원별 문제 ID 배열을 메모리에 유지하고 무작위 표본을 추출하는 클래스
+
+    ORDER BY RANDOM()은 조건에 맞는 전체 행을 정렬하므로, 대신 p_id 배열을 미리 만들어 두고
+    요청마다 limit 개수만큼만 뽑는다. 배열은 카탈로그가 바뀌었을 때만 다시 만든다.
+    """
+
+    def __init__(self):
+        self._pools: Dict[PoolKey, array] = {}
+        self._levels: Tuple[str, ...] = ()
+        self._fingerprint: Optional[Tuple[Any, ...]] = None
+        self._checked_at = 0.0
+        self._managed = False
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    @staticmethod
+    def _pool_keys(p_level: Optional[str], main_chapt: Optional[str], sub_chapt: Optional[str]) -> List[PoolKey]:
+        """한 문제가 속하는 모든 풀의 키 목록을 반환합니다."""
+        keys: List[PoolKey] = [(None, None, None), (p_level, None, None)]
+        if main_chapt:
+            keys.append((None, main_chapt, None))
+            keys.append((p_level, main_chapt, None))
+            if sub_chapt:
+                keys.append((None, main_chapt, sub_chapt))
+                keys.append((p_level, main_chapt, sub_chapt))
+        return keys
+
+    def rebuild(self, rows: Iterable[Dict[str, Any]], fingerprint: Optional[Tuple[Any, ...]] = None,
+                managed: bool = False) -> None:
+        """(p_id, p_level, main_chapt, sub_chapt) 행 목록으로 ID 배열을 다시 만듭니다.
+
+        managed가 참이면 카탈로그 스냅샷이 갱신을 책임지므로 이후 자체적인 DB 확인을 하지 않습니다.
+        """
+        pools: Dict[PoolKey, array] = {}
+        levels = set()
+        for row in rows:
+            p_level = row.get('p_level')
+            if p_level is not None:
+                levels.add(p_level)
+            for key in self._pool_keys(p_level, row.get('main_chapt'), row.get('sub_chapt')):
+                pool = pools.get(key)
+                if pool is None:
+                    pool = pools[key] = array('q')
+                pool.append(row['p_id'])
+
+        # 참조 교체만으로 새 배열을 적용하므로 읽는 쪽은 잠금이 필요 없음
+        self._pools = pools
+        self._levels = tuple(sorted(levels))
+        self._fingerprint = fingerprint
+        self._checked_at = time.monotonic()
+        self._managed = managed
+        logger.info(f"문제 샘플러 갱신: 문제 {len(pools.get((None, None, None), ()))}개, 난이도 {len(levels)}종")
+
+    def refresh(self, force: bool = False) -> None:
+        """카탈로그가 변경되었으면 ID 배열을 다시 로드합니다."""
+        if self._managed and not force:
+            return
+        if not force and self._pools and time.monotonic() - self._checked_at < SAMPLER_REFRESH_INTERVAL:
+            return
+
+        with self._lock:
+            if not force and self._pools and time.monotonic() - self._checked_at < SAMPLER_REFRESH_INTERVAL:
+                return
+            conn = None
+            try:
+                # 공유 요청 연결에 트랜잭션을 열어 두지 않도록 전용 autocommit 연결에서 읽음
+                conn = db_manager.new_connection(autocommit=True)
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                    SELECT COUNT(*) AS cnt, MAX(p_id) AS max_p_id, MAX(created_date) AS max_created
+                    FROM problems
+                    """)
+                    row = cursor.fetchone()
+                    fingerprint = (row['cnt'], row['max_p_id'], row['max_created'])
+
+                    if not force and fingerprint == self._fingerprint:
+                        self._checked_at = time.monotonic()
+                        return
+
+                    cursor.execute("SELECT p_id, p_level, main_chapt, sub_chapt FROM problems")
+                    rows = cursor.fetchall()
+                self.rebuild(rows, fingerprint)
+            except Exception as e:
+                # 갱신 실패 시 기존 배열을 그대로 사용
+                logger.error(f"문제 샘플러 갱신 오류: {e}")
+                self._checked_at = time.monotonic()
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    @property
+    def levels(self) -> Tuple[str, ...]:
+        return self._levels
+
+    def pool_size(self, p_level: Optional[str] = None, main_chapt: Optional[str] = None,
+                  sub_chapt: Optional[str] = None) -> int:
+        """조건에 맞는 문제 수를 반환합니다."""
+        return len(self._pools.get((p_level, main_chapt, sub_chapt if main_chapt else None), ()))
+
+    def _draw(self, pool: array, k: int, exclude: Set[int]) -> List[int]:
+        """풀에서 제외 대상을 뺀 k개의 ID를 중복 없이 추출합니다."""
+        n = len(pool)
+        if k <= 0 or n == 0:
+            return []
+        if not exclude:
+            return self._rng.sample(pool, min(k, n))
+
+        # 제외 대상이 적으면 무작위 인덱스를 뽑아 거절하는 방식으로 O(k)에 가깝게 처리
+        picked: List[int] = []
+        seen: Set[int] = set()
+        max_tries = 4 * k + 32
+        for _ in range(max_tries):
+            if len(picked) >= k or len(seen) >= n:
+                break
+            idx = self._rng.randrange(n)
+            if idx in seen:
+                continue
+            seen.add(idx)
+            p_id = pool[idx]
+            if p_id not in exclude:
+                picked.append(p_id)
+
+        if len(picked) < k:
+            # 제외 대상이 풀의 대부분을 차지하는 경우에만 전체를 걸러서 뽑음
+            chosen = set(picked)
+            remaining = [p_id for p_id in pool if p_id not in exclude and p_id not in chosen]
+            picked.extend(self._rng.sample(remaining, min(k - len(picked), len(remaining))))
+        return picked
+
+    def sample(self, limit: int = 10, p_level: Optional[str] = None, main_chapt: Optional[str] = None,
+               sub_chapt: Optional[str] = None, exclude: Optional[Iterable[int]] = None) -> List[int]:
+        """조건에 맞는 문제 ID를 무작위로 limit개 추출합니다."""
+        self.refresh()
+        pool = self._pools.get((p_level, main_chapt, sub_chapt if main_chapt else None))
+        if not pool:
+            return []
+        return self._draw(pool, limit, set(exclude or ()))
+
+    def stratified_sample(self, limit: int = 10, main_chapt: Optional[str] = None,
+                          sub_chapt: Optional[str] = None, exclude: Optional[Iterable[int]] = None,
+                          levels: Optional[List[str]] = None) -> List[int]:
+        """난이도별로 고르게 나누어 문제 ID를 추출합니다.
+
+        각 난이도에 limit을 균등 배분하고, 문제가 부족한 난이도의 몫은 나머지 난이도에서 채운다.
+        """
+        self.refresh()
+        sub_chapt = sub_chapt if main_chapt else None
+        exclude_set = set(exclude or ())
+        levels = [
+            level for level in (levels or self._levels)
+            if self._pools.get((level, main_chapt, sub_chapt))
+        ]
+        if not levels or limit <= 0:
+            return []
+
+        result: List[int] = []
+        base, extra = divmod(limit, len(levels))
+        shortfall = 0
+        for i, level in enumerate(levels):
+            quota = base + (1 if i < extra else 0)
+            picked = self._draw(self._pools[(level, main_chapt, sub_chapt)], quota, exclude_set)
+            shortfall += quota - len(picked)
+            result.extend(picked)
+
+        if shortfall > 0:
+            # 부족분은 전체 풀에서 이미 뽑은 문제를 제외하고 보충
+            pool = self._pools.get((None, main_chapt, sub_chapt), array('q'))
+            result.extend(self._draw(pool, shortfall, exclude_set | set(result)))
+
+        self._rng.shuffle(result)
+        return result
+
+# 전역 문제 샘플러 인스턴스
+problem_sampler = ProblemSampler()
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# 한 번에 프로파일링할 수 있는 최대 시간(초)
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# 샘플링 간격 하한(초)
+PROFILE_MIN_INTERVAL = 0.001
+# tracemalloc 스냅샷에 남길 호출 스택 깊이
+TRACEMALLOC_FRAMES = 25
+
+class ProfilerBusyError(RuntimeError):
+    """이미 다른 프로파일이 실행 중일 때 발생하는 예외"""
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def _collapse(frames: List[Any]) -> str:
+    """바깥쪽 프레임부터 ';'로 이어 붙인 collapsed stack 한 줄을 만듭니다."""
+    return ";".join(_frame_label(f).replace(";", ":") for f in frames)
+
+def _walk(frame) -> List[Any]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+class SamplingProfiler:
+    """실행 중인 워커를 정해진 시간 동안 샘플링하는 프로파일러
+
+    비활성 상태에서는 스레드, 시그널 핸들러, tracemalloc 모두 사용하지 않는다.
+    - wall: 별도 스레드가 주기적으로 모든 스레드의 스택과 asyncio 태스크 스택을 수집
+    - cpu: ITIMER_PROF 시그널로 CPU 시간 기준 메인 스레드(이벤트 루프) 스택을 수집
+    결과는 flamegraph.pl / speedscope에서 읽을 수 있는 collapsed stack 형식이다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @staticmethod
+    def cpu_mode_available() -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def _sample_wall(self, stacks: Counter, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        own_ident = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stacks[f"thread:{names.get(ident, ident)};{_collapse(_walk(frame))}"] += 1
+        if loop is None or loop.is_closed():
+            return
+        try:
+            tasks = asyncio.all_tasks(loop)
+        except RuntimeError:
+            return
+        for task in tasks:
+            task_frames = task.get_stack()
+            if task_frames:
+                stacks[f"task:{task.get_name()};{_collapse(task_frames)}"] += 1
+
+    def _run_wall(self, seconds: float, interval: float, loop: Optional[asyncio.AbstractEventLoop],
+                  stacks: Counter) -> int:
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self._sample_wall(stacks, loop)
+            samples += 1
+            time.sleep(interval)
+        return samples
+
+    async def _run_cpu(self, seconds: float, interval: float, stacks: Counter) -> int:
+        samples = [0]
+
+        def handler(signum, frame):
+            samples[0] += 1
+            stacks[f"thread:MainThread;{_collapse(_walk(frame))}"] += 1
+
+        previous = signal.signal(signal.SIGPROF, handler)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, previous)
+        return samples[0]
+
+    @staticmethod
+    def _memory_diff(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, top: int) -> List[Dict[str, Any]]:
+        diff = []
+        for stat in after.compare_to(before, "traceback")[:top]:
+            frame = stat.traceback[-1] if len(stat.traceback) else None
+            diff.append({
+                "location": f"{frame.filename}:{frame.lineno}" if frame else "unknown",
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "count_diff": stat.count_diff,
+                "size_kb": round(stat.size / 1024, 1),
+                "traceback": [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+            })
+        return diff
+
+    async def profile(self, seconds: float, mode: str = "wall", interval: float = 0.01,
+                      memory: bool = False, memory_top: int = 20) -> Dict[str, Any]:
+        """seconds 동안 프로파일을 수집해 collapsed stack과 메모리 증가분을 반환합니다."""
+        if mode not in ("wall", "cpu"):
+            raise ValueError(f"지원하지 않는 mode: {mode}")
+        if mode == "cpu" and not self.cpu_mode_available():
+            raise ValueError("cpu 모드는 메인 스레드에서 실행되는 이벤트 루프에서만 사용할 수 있습니다.")
+        seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+        interval = max(interval, PROFILE_MIN_INTERVAL)
+
+        with self._lock:
+            if self._running:
+                raise ProfilerBusyError("이미 프로파일이 실행 중입니다.")
+            self._running = True
+
+        started_tracemalloc = False
+        before = None
+        try:
+            if memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    started_tracemalloc = True
+                before = tracemalloc.take_snapshot()
+
+            stacks: Counter = Counter()
+            start_time = time.perf_counter()
+            if mode == "wall":
+                loop = asyncio.get_running_loop()
+                samples = await asyncio.to_thread(self._run_wall, seconds, interval, loop, stacks)
+            else:
+                samples = await self._run_cpu(seconds, interval, stacks)
+            elapsed = time.perf_counter() - start_time
+
+            memory_diff = None
+            if before is not None:
+                after = tracemalloc.take_snapshot()
+                memory_diff = self._memory_diff(before, after, memory_top)
+
+            collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+            return {
+                "mode": mode,
+                "seconds": round(elapsed, 3),
+                "interval": interval,
+                "samples": samples,
+                "collapsed": collapsed,
+                "memory_diff": memory_diff
+            }
+        finally:
+            if started_tracemalloc:
+                tracemalloc.stop()
+            self._running = False
+
+# 전역 프로파일러 인스턴스
+profiler = SamplingProfiler()
@@ -35,6 +35,9 @@ class PromptEngineeringService:
 - `attempts[current_step]` (int) : 현재 단계 오답 누적 횟수
 - `max_attempts_per_step` (int) : 단계당 최대 시도 횟수(기본 **3**)
 - `followup_mode` (bool) : 추가 질문 응답 중이면 true (단계 유지)
+- `quiz_type` (str) : 이번 응답에서 낸 미니퀴즈 유형 — 객관식 `"choice"`, 맞다/아니다 `"ox"`, 빈칸/식 입력 `"blank"`, 퀴즈가 없으면 `"none"`
+- `expected_answer` (str | list[str]) : 이번 미니퀴즈의 정답 — 객관식은 번호(`"2"`), 맞다/아니다는 `"O"` 또는 `"X"`, 빈칸은 정답 값/식(여러 형태 허용 시 목록)
+- `hint` (str) : 두 번째 오답 때 보여줄 힌트 1문장 (정답은 밝히지 않음)
 
 **정확 카운트 규칙(중요)**
 
@@ -46,7 +49,8 @@ class PromptEngineeringService:
 **중요: 메타데이터는 반드시 응답 끝에 숨김 처리되어야 함**
 - 실제 채팅에서는 메타데이터가 표시되지 않아야 함
 - 내부 처리용으로만 사용
-- 형식: 응답 끝에 `<!-- {{"current_step":2, "attempts":{{"2":1}}, "steps_total":4}} -->` 형태로 포함
+- 형식: 응답 끝에 `<!-- {{"current_step":2, "attempts":{{"2":1}}, "steps_total":4, "quiz_type":"choice", "expected_answer":"2", "hint":"'1만큼 큰'은 +1이야."}} -->` 형태로 포함
+- 미니퀴즈를 낼 때마다 `quiz_type`, `expected_answer`, `hint`를 새 퀴즈 기준으로 갱신한다. (서버가 단순한 답은 직접 채점함)
 ---
 ## 2) 모드 라우팅
 
@@ -202,10 +206,10 @@ class PromptEngineeringService:
 
 빈칸 채우기: __ + __  (직접 입력해도 돼: x+7)
 
-<STATE>{{{{"current_step":2, "attempts":{{{{"2":0}}}}, "steps_total":4}}}}</STATE>
+<!-- {{"current_step":2, "attempts":{{"2":0}}, "steps_total":4, "quiz_type":"blank", "expected_answer":"x+7", "hint":"상수는 '7'이야."}} -->
 ```
 
-학생 화면에는 `<STATE>...</STATE>` 부분이 보이지 않는다.
+학생 화면에는 `<!-- ... -->` 부분이 보이지 않는다.
 
 ### (학생이 "x-7" 입력 → 1회 오답)
 
@@ -310,6 +314,19 @@ class PromptEngineeringService:
 """
         return prompt
 
+    @staticmethod
+    def create_first_step_prompt(problem_data: Dict[str, Any]) -> str:
+        """단계별 풀이 첫 단계("시작") 프롬프트를 생성합니다. 같은 문제에는 항상 같은 프롬프트가 만들어집니다."""
+        return PromptEngineeringService.create_step_by_step_prompt(problem_data) + """
+
+현재 대화 상태:
+- current_step: 1
+- attempts: {}
+- user_message: "시작"
+
+첫 번째 단계를 시작하세요. 위의 프롬프트 규칙을 따라 첫 번째 단계만 제시하세요.
+"""
+
     @staticmethod
     def create_direct_solution_prompt(problem_data: Dict[str, Any]) -> str:
         """직접적인 풀이를 위한 프롬프트를 생성합니다."""
@@ -0,0 +1,164 @@
+import re
+from fractions import Fraction
+from typing import Any, Dict, List, Optional
+
+# 미니퀴즈 유형 (LLM이 숨김 상태에 quiz_type으로 내보냄)
+QUIZ_CHOICE = "choice"  # 객관식 ①~④
+QUIZ_OX = "ox"          # 맞다/아니다 (O/X)
+QUIZ_BLANK = "blank"    # 빈칸/식 입력
+QUIZ_TYPES = (QUIZ_CHOICE, QUIZ_OX, QUIZ_BLANK)
+
+# 단계당 최대 시도 횟수 (프롬프트의 max_attempts_per_step 기본값)
+MAX_ATTEMPTS_PER_STEP = 3
+
+_CIRCLED = {"①": "1", "②": "2", "③": "3", "④": "4", "⑤": "5"}
+# "②", "2", "2번", "(2)", "2)" 처럼 보기 번호만 있는 답
+_CHOICE_PATTERN = re.compile(r"^\(?([①②③④⑤]|[1-5])\)?\s*(번|번이요|번이야|번요)?[.!]?$")
+_OX_TRUE = {"o", "ㅇ", "맞다", "맞아", "맞아요", "맞습니다", "참", "true"}
+_OX_FALSE = {"x", "ㄴ", "아니다", "아니야", "아니요", "아니에요", "틀리다", "틀려", "거짓", "false"}
+# 숫자 한 개로 볼 수 있는 답 (정수, 소수, 분수)
+_NUMBER_PATTERN = re.compile(r"^[+-]?(\d+(\.\d+)?|\d+/\d+)$")
+_LATEX_REPLACEMENTS = (
+    (r"\left", ""), (r"\right", ""), (r"\cdot", "*"), (r"\times", "*"), (r"\div", "/"),
+    ("×", "*"), ("÷", "/"), ("−", "-"), (r"\leq", "≤"), (r"\geq", "≥"), (r"\le", "≤"), (r"\ge", "≥"),
+)
+_CHOICE_LINE = re.compile(r"[①②③④⑤]")
+_FRAC_PATTERN = re.compile(r"\\[dt]?frac\{([^{}]*)\}\{([^{}]*)\}")
+
+class QuizChecker:
+    """단계별 풀이 미니퀴즈 중 LLM 없이 채점할 수 있는 답(보기 번호, O/X, 숫자)을 서버에서 채점하는 클래스
+
+    채점할 수 없는 답(설명형 답, 식의 동치 판단이 필요한 답, 추가 질문 등)은 None을 반환해 LLM에 맡긴다.
+    """
+
+    @staticmethod
+    def quiz_from_state(state_data: Dict[str, Any], response_text: str = "") -> Optional[Dict[str, Any]]:
+        """LLM 숨김 상태에서 현재 미니퀴즈의 채점 정보를 꺼냅니다. 채점 정보가 없으면 None을 반환합니다.
+
+        객관식이면 오답 시 같은 질문을 다시 보여줄 수 있도록 응답에서 보기 줄을 함께 저장한다.
+        """
+        quiz_type = str(state_data.get("quiz_type") or "").lower()
+        expected = state_data.get("expected_answer")
+        if quiz_type not in QUIZ_TYPES or expected in (None, "", []):
+            return None
+        quiz = {
+            "type": quiz_type,
+            "expected": [str(e) for e in expected] if isinstance(expected, list) else [str(expected)],
+        }
+        if state_data.get("hint"):
+            quiz["hint"] = str(state_data["hint"])
+        if quiz_type == QUIZ_CHOICE:
+            choice_lines = [line.strip() for line in response_text.splitlines() if _CHOICE_LINE.search(line)]
+            if choice_lines:
+                quiz["choices"] = "\n".join(choice_lines)
+        return quiz
+
+    @staticmethod
+    def normalize_choice(answer: str) -> Optional[str]:
+        match = _CHOICE_PATTERN.match(answer.strip())
+        if not match:
+            return None
+        return _CIRCLED.get(match.group(1), match.group(1))
+
+    @staticmethod
+    def normalize_ox(answer: str) -> Optional[str]:
+        value = answer.strip().rstrip(".!").lower()
+        if value in _OX_TRUE:
+            return "O"
+        if value in _OX_FALSE:
+            return "X"
+        return None
+
+    @staticmethod
+    def normalize_expression(answer: str) -> str:
+        """공백, $ 기호, LaTeX 명령을 정리해 비교 가능한 식 문자열로 만듭니다."""
+        value = answer.strip().replace("$", "")
+        value = _FRAC_PATTERN.sub(r"(\1)/(\2)", value)
+        for old, new in _LATEX_REPLACEMENTS:
+            value = value.replace(old, new)
+        value = re.sub(r"\s+", "", value).replace("{", "").replace("}", "")
+        # 숫자 하나만 괄호로 감싼 분수는 괄호를 벗김 ((1)/(3) → 1/3)
+        value = re.sub(r"\((\d+)\)", r"\1", value)
+        return value.lower()
+
+    @staticmethod
+    def to_number(value: str) -> Optional[Fraction]:
+        if not _NUMBER_PATTERN.match(value):
+            return None
+        try:
+            return Fraction(value)
+        except (ValueError, ZeroDivisionError):
+            return None
+
+    @staticmethod
+    def grade(quiz: Optional[Dict[str, Any]], answer: str) -> Optional[bool]:
+        """학생 답을 채점해 정답이면 True, 오답이면 False, 서버에서 판단할 수 없으면 None을 반환합니다."""
+        if not quiz or not answer or not answer.strip():
+            return None
+        expected: List[str] = quiz.get("expected", [])
+        quiz_type = quiz.get("type")
+
+        if quiz_type == QUIZ_CHOICE:
+            given = QuizChecker.normalize_choice(answer)
+            accepted = {QuizChecker.normalize_choice(e) for e in expected}
+            accepted.discard(None)
+            if given is None or not accepted:
+                return None
+            return given in accepted
+
+        if quiz_type == QUIZ_OX:
+            given = QuizChecker.normalize_ox(answer)
+            accepted = {QuizChecker.normalize_ox(e) for e in expected}
+            accepted.discard(None)
+            if given is None or not accepted:
+                return None
+            return given in accepted
+
+        if quiz_type == QUIZ_BLANK:
+            given = QuizChecker.normalize_expression(answer)
+            normalized = [QuizChecker.normalize_expression(e) for e in expected]
+            if given in normalized:
+                return True
+            given_number = QuizChecker.to_number(given)
+            expected_numbers = [QuizChecker.to_number(e) for e in normalized]
+            if given_number is not None and all(n is not None for n in expected_numbers):
+                return given_number in expected_numbers
+            # 식이 다르게 적힌 경우(x+7 ↔ 7+x 등)는 동치 판단이 필요하므로 LLM에 맡김
+            return None
+
+        return None
+
+    @staticmethod
+    def display_answer(quiz: Dict[str, Any]) -> str:
+        expected = quiz["expected"][0]
+        if quiz["type"] == QUIZ_CHOICE:
+            number = QuizChecker.normalize_choice(expected)
+            circled = {v: k for k, v in _CIRCLED.items()}
+            return circled.get(number, expected)
+        if quiz["type"] == QUIZ_OX:
+            return QuizChecker.normalize_ox(expected) or expected
+        return expected
+
+    @staticmethod
+    def wrong_answer_feedback(quiz: Dict[str, Any], attempt: int) -> str:
+        """프롬프트의 오답 피드백 규칙(a=1, 2, 3 이상)에 맞는 고정 문구 피드백을 만듭니다."""
+        if attempt >= MAX_ATTEMPTS_PER_STEP:
+            return (
+                "오답이야. 그래도 괜찮아. 내가 설명해줄게.\n"
+                f"정답은 {QuizChecker.display_answer(quiz)}이야.\n"
+                "다음 단계로 갈까? (네/아니오)"
+            )
+
+        lines = ["아쉽지만 오답이야."]
+        if attempt == 2 and quiz.get("hint"):
+            lines.append(f"힌트: {quiz['hint']}")
+        if quiz["type"] == QUIZ_CHOICE:
+            lines.append("같은 질문이야. 번호만 다시 골라줘(①~④)!")
+            if quiz.get("choices"):
+                lines.append("")
+                lines.append(quiz["choices"])
+        elif quiz["type"] == QUIZ_OX:
+            lines.append("같은 질문이야. O 또는 X로 다시 답해줘!")
+        else:
+            lines.append("같은 질문이야. 다시 입력해줘!")
+        return "\n".join(lines)
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .catalog import catalog, CatalogSnapshot
+from .metrics import record_cache
+
+# 문제당 미리 계산해 두는 후보 수
+CANDIDATE_LIMIT = int(os.getenv("RECOMMEND_CANDIDATE_LIMIT", "50"))
+# 사용자별 오답 성향/풀이 이력 캐시 유지 시간(초)
+USER_PROFILE_TTL = int(os.getenv("RECOMMEND_USER_PROFILE_TTL", "120"))
+USER_PROFILE_MAX = 10000
+
+# 점수 가중치
+W_CONCEPT = 0.5
+W_LEVEL = 0.2
+W_DIRECT = 0.2
+W_ERROR = 0.1
+
+# 난이도 순서 (알 수 없는 난이도는 같을 때만 가깝다고 판단)
+LEVEL_ORDER = {'하': 1, '중하': 2, '중': 3, '중상': 4, '상': 5, '최상': 6}
+
+class Candidate:
+    """한 문제에 대한 유사문제 후보와 요청과 무관한 특징값"""
+
+    __slots__ = ('sim_p_id', 'concept_overlap', 'level_proximity', 'direct', 'areas')
+
+    def __init__(self, sim_p_id: int, concept_overlap: float, level_proximity: float,
+                 direct: bool, areas: Tuple[str, ...]):
+        self.sim_p_id = sim_p_id
+        self.concept_overlap = concept_overlap
+        self.level_proximity = level_proximity
+        self.direct = direct
+        self.areas = areas
+
+def level_proximity(level_a: Optional[str], level_b: Optional[str]) -> float:
+    """두 난이도가 얼마나 가까운지 0~1 사이 값으로 반환합니다."""
+    if level_a == level_b:
+        return 1.0
+    rank_a, rank_b = LEVEL_ORDER.get(level_a), LEVEL_ORDER.get(level_b)
+    if rank_a is None or rank_b is None:
+        return 0.0
+    span = max(LEVEL_ORDER.values()) - min(LEVEL_ORDER.values())
+    return 1.0 - abs(rank_a - rank_b) / span
+
+class SimilarProblemRecommender:
+    """유사문제를 여러 개 골라 순위를 매기는 추천 엔진
+
+    요청과 무관한 부분(후보 목록, 개념 겹침, 난이도 차이)은 문제별로 한 번만 계산해 캐시하고,
+    요청마다 하는 일은 사용자 오답 성향 반영과 정렬뿐이다.
+    """
+
+    def __init__(self):
+        self._version: Optional[Tuple[Any, ...]] = None
+        self._sim_concepts: Dict[int, Set[int]] = {}
+        self._candidates: Dict[int, List[Candidate]] = {}
+        self._user_profiles: Dict[int, Tuple[float, Set[int], Counter]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def on_catalog_swap(self, snapshot: CatalogSnapshot) -> None:
+        """카탈로그가 바뀌면 유사문제별 개념 집합을 다시 만들고 후보 캐시를 비웁니다."""
+        sim_concepts: Dict[int, Set[int]] = {}
+        for p_id, sim_ids in snapshot.sim_by_problem.items():
+            con_ids = snapshot.concepts_by_problem.get(p_id, ())
+            for sim_p_id in sim_ids:
+                sim_concepts.setdefault(sim_p_id, set()).update(con_ids)
+        with self._lock:
+            self._sim_concepts = sim_concepts
+            self._candidates = {}
+            self._version = snapshot.version
+
+    def _build_candidates(self, snapshot: CatalogSnapshot, p_id: int) -> List[Candidate]:
+        problem = snapshot.problems.get(p_id)
+        if problem is None:
+            return []
+        concepts = set(snapshot.concepts_by_problem.get(p_id, ()))
+        direct = set(snapshot.sim_by_problem.get(p_id, ()))
+
+        # 직접 매핑된 유사문제 + 같은 개념을 가진 문제들에 매핑된 유사문제
+        pool: Set[int] = set(direct)
+        for con_id in concepts:
+            for other_p_id in snapshot.problems_by_concept.get(con_id, ()):
+                pool.update(snapshot.sim_by_problem.get(other_p_id, ()))
+
+        candidates = []
+        for sim_p_id in pool:
+            sim = snapshot.sim_problems[sim_p_id]
+            sim_concepts = self._sim_concepts.get(sim_p_id, set())
+            union = concepts | sim_concepts
+            overlap = len(concepts & sim_concepts) / len(union) if union else 0.0
+            candidates.append(Candidate(
+                sim_p_id,
+                overlap,
+                level_proximity(problem.get('p_level'), sim.get('p_level')),
+                sim_p_id in direct,
+                tuple(area for area in (sim.get('sub_chapt'), sim.get('con_type')) if area)
+            ))
+
+        # 요청과 무관한 기본 점수로 상위 후보만 남김
+        candidates.sort(key=lambda c: (-self._base_score(c), c.sim_p_id))
+        return candidates[:CANDIDATE_LIMIT]
+
+    @staticmethod
+    def _base_score(candidate: Candidate) -> float:
+        return (W_CONCEPT * candidate.concept_overlap
+                + W_LEVEL * candidate.level_proximity
+                + W_DIRECT * (1.0 if candidate.direct else 0.0))
+
+    def get_candidates(self, p_id: int) -> List[Candidate]:
+        """문제별 후보 목록을 반환합니다 (캐시)."""
+        snapshot = catalog.snapshot
+        if snapshot is None:
+            return []
+        if self._version != snapshot.version:
+            self.on_catalog_swap(snapshot)
+
+        candidates = self._candidates.get(p_id)
+        record_cache("similar_candidates", candidates is not None)
+        if candidates is not None:
+            self.hits += 1
+            return candidates
+        self.misses += 1
+        candidates = self._build_candidates(snapshot, p_id)
+        self._candidates[p_id] = candidates
+        return candidates
+
+    def _get_user_profile(self, user_id: int) -> Tuple[Set[int], Counter]:
+        """사용자의 풀이 완료 문제와 최근 오답 영역을 조회합니다 (TTL 캐시)."""
+        # 순환 import 방지
+        from .services import ChatService, ReportService
+
+        cached = self._user_profiles.get(user_id)
+        fresh = cached is not None and time.monotonic() - cached[0] < USER_PROFILE_TTL
+        record_cache("recommend_user_profile", fresh)
+        if fresh:
+            return cached[1], cached[2]
+
+        solved = set(ChatService.get_solved_problem_ids(user_id))
+        error_areas: Counter = Counter()
+        for row in ReportService.get_recent_error_areas(user_id):
+            weight = len(row['error_patterns'])
+            if not weight:
+                continue
+            for area in (row.get('sub_chapt'), row.get('con_type')):
+                if area:
+                    error_areas[area] += weight
+        if len(self._user_profiles) >= USER_PROFILE_MAX:
+            self._user_profiles.clear()
+        self._user_profiles[user_id] = (time.monotonic(), solved, error_areas)
+        return solved, error_areas
+
+    def invalidate_user(self, user_id: int) -> None:
+        """사용자 프로필 캐시를 비웁니다 (새 리포트 저장 시 호출)."""
+        self._user_profiles.pop(user_id, None)
+
+    def recommend(self, p_id: int, k: int = 5, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """p_id와 유사한 문제를 점수 순으로 최대 k개 반환합니다."""
+        snapshot = catalog.snapshot
+        if snapshot is None:
+            return []
+        candidates = self.get_candidates(p_id)
+        if not candidates:
+            return []
+
+        solved: Set[int] = set()
+        error_areas: Counter = Counter()
+        if user_id:
+            solved, error_areas = self._get_user_profile(user_id)
+        max_error = max(error_areas.values()) if error_areas else 0
+
+        # 풀이 이력은 problems의 p_id이므로 problem_sim_map으로 유사문제 id로 바꿔서 제외
+        # (지금 문제의 유사문제는 제외하지 않음. 후보가 모두 제외되면 제외 없이 추천)
+        excluded: Set[int] = set()
+        for solved_p_id in solved:
+            if solved_p_id != p_id:
+                excluded.update(snapshot.sim_by_problem.get(solved_p_id, ()))
+        if all(candidate.sim_p_id in excluded for candidate in candidates):
+            excluded = set()
+
+        ranked = []
+        for candidate in candidates:
+            if candidate.sim_p_id in excluded:
+                continue
+            error_match = 0.0
+            if max_error:
+                error_match = max((error_areas.get(area, 0) for area in candidate.areas), default=0) / max_error
+            score = self._base_score(candidate) + W_ERROR * error_match
+            ranked.append((score, error_match, candidate))
+
+        ranked.sort(key=lambda item: (-item[0], item[2].sim_p_id))
+        results = []
+        for score, error_match, candidate in ranked[:k]:
+            sim = dict(snapshot.sim_problems[candidate.sim_p_id])
+            sim['score'] = round(score, 4)
+            sim['reasons'] = {
+                'concept_overlap': round(candidate.concept_overlap, 4),
+                'level_proximity': round(candidate.level_proximity, 4),
+                'direct_mapping': candidate.direct,
+                'error_pattern_match': round(error_match, 4)
+            }
+            results.append(sim)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "cached_problems": len(self._candidates),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+# 전역 추천 엔진 인스턴스
+recommender = SimilarProblemRecommender()
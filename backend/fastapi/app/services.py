@@ -1,7 +1,21 @@
 from typing import List, Dict, Optional, Any
-from .database import db_manager, logger
+from .database import db_manager
+from .fast_json import RawJSON
+from .logging_config import SAMPLED
+from .problem_sampler import problem_sampler
+from .catalog import catalog, SEARCH_FIELDS
+from .metrics import record_cache
+import logging
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+def _catalog_snapshot():
+    """카탈로그 스냅샷을 반환하고 메모리 조회 여부를 캐시 메트릭으로 기록합니다."""
+    snapshot = catalog.snapshot
+    record_cache("catalog", snapshot is not None)
+    return snapshot
 
 class ChatService:
     """채팅 메시지 및 대화 세션 관리 서비스 클래스"""
@@ -29,26 +43,50 @@ class ChatService:
     @staticmethod
     def save_chat_message(conversation_id: str, user_id: int, p_id: int, 
                          sender_role: str, message: str, message_type: str = "text") -> int:
-        """채팅 메시지를 저장하고 full_chat_log를 업데이트합니다."""
+        """채팅 메시지를 별도 연결에서 저장하고 full_chat_log를 업데이트합니다."""
+        conn = db_manager.new_connection()
+        try:
+            return ChatService.save_chat_batch(conn, [{
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "p_id": p_id,
+                "sender_role": sender_role,
+                "message": message,
+                "message_type": message_type
+            }])[0]
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def save_chat_batch(conn, rows: List[Dict[str, Any]]) -> List[int]:
+        """여러 대화의 채팅 메시지를 한 번의 다중 행 INSERT와 한 번의 커밋으로 저장합니다.
+
+        rows의 각 항목은 conversation_id, user_id, p_id, sender_role, message, message_type, created_at을 가지며,
+        반환하는 chat_id 목록은 rows와 같은 순서입니다. full_chat_log는 대화마다 한 번만 갱신합니다.
+        conn은 요청 처리용 공유 연결이 아닌 전용 연결이어야 합니다 (실패 시 이 연결을 롤백함).
+        """
+        if not rows:
+            return []
         try:
-            conn = db_manager.get_connection()
             with conn.cursor() as cursor:
-                # 1. 채팅 메시지 저장 (chat_id는 데이터베이스가 자동 할당)
-                query = """
+                now = datetime.now()
+                # full_chat_log가 created_at 순이므로 시각이 없는 메시지는 순서대로 1마이크로초씩 차이를 둠
+                values = [
+                    (row["conversation_id"], row["user_id"], row["p_id"], row["sender_role"], row["message"],
+                     row.get("message_type") or "text", row.get("created_at") or now + timedelta(microseconds=i))
+                    for i, row in enumerate(rows)
+                ]
+                placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(values))
+                query = f"""
                 INSERT INTO chat_messages (conversation_id, user_id, p_id, sender_role, message, message_type, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                VALUES {placeholders}
                 RETURNING chat_id
                 """
-                now = datetime.now()
-                cursor.execute(query, (conversation_id, user_id, p_id, sender_role, message, message_type, now))
-                result = cursor.fetchone()
-                chat_id = result['chat_id'] if result else None
+                cursor.execute(query, [value for row in values for value in row])
+                chat_ids = [result['chat_id'] for result in cursor.fetchall()]
+                if len(chat_ids) != len(rows):
+                    raise Exception(f"chat_id 개수가 맞지 않습니다: {len(chat_ids)}/{len(rows)}")
                 
-                if not chat_id:
-                    logger.error(f"chat_id를 가져올 수 없음: {result}")
-                    raise Exception("chat_id를 가져올 수 없습니다")
-                
-                # 2. full_chat_log 업데이트
                 update_query = """
                 UPDATE conversations 
                 SET full_chat_log = (
@@ -67,15 +105,63 @@ class ChatService:
                 data = %s
                 WHERE conversation_id = %s
                 """
-                cursor.execute(update_query, (conversation_id, now, conversation_id))
+                # 대화별 마지막 메시지 시각
+                last_times: Dict[str, datetime] = {}
+                for row in values:
+                    last_times[row[0]] = max(last_times.get(row[0], row[6]), row[6])
+                for conversation_id, last_time in last_times.items():
+                    cursor.execute(update_query, (conversation_id, last_time, conversation_id))
                 
                 conn.commit()
-                logger.info(f"채팅 메시지 저장 및 full_chat_log 업데이트: chat_id={chat_id}, role={sender_role}")
-                return chat_id
+                logger.debug("채팅 메시지 일괄 저장: %d건, 대화 %d개", len(chat_ids), len(last_times))
+                return chat_ids
         except Exception as e:
             logger.error(f"채팅 메시지 저장 오류: {e}")
+            # 실패한 트랜잭션이 연결에 남지 않도록 롤백 (연결이 끊긴 경우는 무시)
+            try:
+                conn.rollback()
+            except Exception:
+                pass
             raise Exception(f"채팅 메시지 저장 실패: {e}")
     
+    @staticmethod
+    def get_recent_messages(conversation_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """대화 세션의 최근 메시지 limit개를 오래된 순으로 조회합니다."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT chat_id, sender_role, message, message_type, created_at
+                FROM chat_messages 
+                WHERE conversation_id = %s
+                ORDER BY created_at DESC
+                LIMIT %s
+                """
+                cursor.execute(query, (conversation_id, limit))
+                results = cursor.fetchall()
+                return [dict(row) for row in reversed(results)]
+        except Exception as e:
+            logger.error(f"최근 대화 메시지 조회 오류: {e}")
+            return []
+    
+    @staticmethod
+    def get_conversation_meta(conversation_id: str) -> Optional[Dict[str, Any]]:
+        """대화 세션의 소유자, 문제 ID, 완료 시각만 조회합니다."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT conversation_id, user_id, p_id, completed_at
+                FROM conversations
+                WHERE conversation_id = %s
+                """
+                cursor.execute(query, (conversation_id,))
+                result = cursor.fetchone()
+                return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"대화 세션 정보 조회 오류: {e}")
+            return None
+    
     @staticmethod
     def get_conversation_messages(conversation_id: str) -> List[Dict[str, Any]]:
         """대화 세션의 모든 메시지를 조회합니다."""
@@ -124,6 +210,60 @@ class ChatService:
             logger.error(f"사용자 대화 세션 조회 오류: {e}")
             return []
     
+    @staticmethod
+    def get_attempted_problem_ids(user_id: int) -> List[int]:
+        """사용자가 이미 풀어본(대화 세션이 있는) 문제 ID 목록을 조회합니다."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT DISTINCT p_id
+                FROM conversations
+                WHERE user_id = %s
+                """
+                cursor.execute(query, (user_id,))
+                return [row['p_id'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"풀어본 문제 조회 오류: {e}")
+            return []
+    
+    @staticmethod
+    def get_solved_problem_ids(user_id: int) -> List[int]:
+        """사용자가 풀이를 완료한 문제 ID 목록을 조회합니다."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT DISTINCT p_id
+                FROM conversations
+                WHERE user_id = %s AND completed_at IS NOT NULL
+                """
+                cursor.execute(query, (user_id,))
+                return [row['p_id'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"풀이 완료 문제 조회 오류: {e}")
+            return []
+
+    @staticmethod
+    def get_popular_problem_ids(limit: int = 100, days: int = 30) -> List[int]:
+        """최근 days일 동안 대화 세션이 많이 시작된 문제 ID를 많은 순으로 조회합니다."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT p_id, COUNT(*) AS sessions
+                FROM conversations
+                WHERE started_at >= NOW() - make_interval(days => %s)
+                GROUP BY p_id
+                ORDER BY sessions DESC
+                LIMIT %s
+                """
+                cursor.execute(query, (days, limit))
+                return [row['p_id'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"인기 문제 조회 오류: {e}")
+            return []
+
     @staticmethod
     def complete_conversation(conversation_id: str) -> bool:
         """대화 세션을 완료 상태로 변경합니다."""
@@ -165,8 +305,11 @@ class ChatService:
             return False
     
     @staticmethod
-    def get_conversation_report(conversation_id: str) -> Optional[Dict[str, Any]]:
-        """대화 세션의 상세 정보를 조회합니다."""
+    def get_conversation_report(conversation_id: str, raw_chat_log: bool = False) -> Optional[Dict[str, Any]]:
+        """대화 세션의 상세 정보를 조회합니다.
+
+        raw_chat_log=True면 full_chat_log를 파싱하지 않고 RawJSON(JSON 텍스트)으로 반환합니다.
+        """
         try:
             conn = db_manager.get_connection()
             with conn.cursor() as cursor:
@@ -189,32 +332,53 @@ class ChatService:
                   p.main_chapt,
                   p.sub_chapt,
                   p.p_type,
-                  c.full_chat_log,
+                  c.full_chat_log{cast},
                   c.data AS message_time
                 FROM conversations c
                 JOIN users u ON c.user_id = u.user_id
                 JOIN problems p ON c.p_id = p.p_id
                 WHERE c.conversation_id = %s
                 ORDER BY c.started_at DESC
+                """.format(cast="::text AS full_chat_log" if raw_chat_log else "")
+                cursor.execute(query, (conversation_id,))
+                result = cursor.fetchone()
+                if not result:
+                    return None
+                result = dict(result)
+                if raw_chat_log and result.get('full_chat_log') is not None:
+                    result['full_chat_log'] = RawJSON(result['full_chat_log'])
+                return result
+        except Exception as e:
+            logger.error(f"대화 세션 상세 정보 조회 오류: {e}")
+            return None
+
+    @staticmethod
+    def get_conversation_version(conversation_id: str) -> Optional[Dict[str, Any]]:
+        """대화 세션의 변경 여부를 판단할 시각(마지막 메시지 시각, 완료 시각)만 조회합니다."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT started_at, data AS message_time, completed_at
+                FROM conversations
+                WHERE conversation_id = %s
                 """
                 cursor.execute(query, (conversation_id,))
                 result = cursor.fetchone()
                 return dict(result) if result else None
         except Exception as e:
-            logger.error(f"대화 세션 상세 정보 조회 오류: {e}")
+            logger.error(f"대화 세션 버전 조회 오류: {e}")
             return None
 
     @staticmethod
     def get_basic_conversation_data(conversation_id: str) -> Optional[Dict[str, Any]]:
         """오답 리포트 생성을 위한 기본 데이터를 조회합니다 (학생 답안 분석 제외)."""
         try:
-            logger.info(f"=== get_basic_conversation_data 시작 ===")
-            logger.info(f"conversation_id: {conversation_id}")
+            logger.debug("get_basic_conversation_data 시작: conversation_id=%s", conversation_id)
             
             conn = db_manager.get_connection()
             with conn.cursor() as cursor:
                 # 1. 대화 세션 기본 정보 조회
-                logger.info("1. 대화 세션 기본 정보 조회...")
                 query = """
                 SELECT
                   c.conversation_id,
@@ -250,16 +414,10 @@ class ChatService:
                     return None
                 
                 conversation_data = dict(result)
-                logger.info(f"대화 세션 조회 성공:")
-                logger.info(f"  - user_id: {conversation_data.get('user_id')}")
-                logger.info(f"  - p_id: {conversation_data.get('p_id')}")
-                logger.info(f"  - user_name: {conversation_data.get('user_name')}")
-                logger.info(f"  - p_name: {conversation_data.get('p_name')}")
-                logger.info(f"  - p_page: {conversation_data.get('p_page')}")
-                logger.info(f"  - num_in_page: {conversation_data.get('num_in_page')}")
+                logger.debug("대화 세션 조회 성공: user_id=%s, p_id=%s",
+                             conversation_data.get('user_id'), conversation_data.get('p_id'))
                 
                 # 2. 교과서 개념 정보 조회 (n:n 매핑 테이블 활용)
-                logger.info("2. 교과서 개념 정보 조회...")
                 textbook_concepts_query = """
                 SELECT
                   tc.con_id,
@@ -274,13 +432,9 @@ class ChatService:
                 cursor.execute(textbook_concepts_query, (conversation_data['p_id'],))
                 textbook_concepts = [dict(row) for row in cursor.fetchall()]
                 
-                logger.info(f"교과서 개념 정보 조회 성공:")
-                logger.info(f"  - 개념 개수: {len(textbook_concepts)}")
-                for i, concept in enumerate(textbook_concepts[:3]):  # 처음 3개만 로그
-                    logger.info(f"  - 개념 {i+1}: {concept.get('con_type')} - {concept.get('tb_con')} - {concept.get('tb_sub_con')}")
+                logger.debug("교과서 개념 %d개 조회, 예시: %s", len(textbook_concepts), textbook_concepts[:3], extra=SAMPLED)
                 
                 # 3. 채팅 메시지 조회
-                logger.info("3. 채팅 메시지 조회...")
                 chat_messages_query = """
                 SELECT
                   cm.chat_id,
@@ -297,13 +451,9 @@ class ChatService:
                 cursor.execute(chat_messages_query, (conversation_id,))
                 chat_messages = [dict(row) for row in cursor.fetchall()]
                 
-                logger.info(f"채팅 메시지 조회 성공:")
-                logger.info(f"  - 메시지 개수: {len(chat_messages)}")
-                for i, msg in enumerate(chat_messages[:3]):  # 처음 3개만 로그
-                    logger.info(f"  - 메시지 {i+1}: {msg.get('sender_role')} - {msg.get('message', '')[:50]}...")
+                logger.debug("채팅 메시지 %d개 조회, 예시: %s", len(chat_messages), chat_messages[:3], extra=SAMPLED)
                 
                 # 4. 결과 데이터 구성
-                logger.info("4. 결과 데이터 구성...")
                 basic_data = {
                     'conversation_info': {
                         'conversation_id': conversation_data['conversation_id'],
@@ -330,7 +480,6 @@ class ChatService:
                     'chat_messages': chat_messages
                 }
                 
-                logger.info(f"=== get_basic_conversation_data 완료 ===")
                 return basic_data
                 
         except Exception as e:
@@ -510,6 +659,9 @@ class ProblemService:
     @staticmethod
     def get_problem_by_id(p_id: int) -> Optional[Dict[str, Any]]:
         """문제 ID로 문제 정보를 조회합니다."""
+        snapshot = _catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.get_problem(p_id)
         try:
             conn = db_manager.get_connection()
             with conn.cursor() as cursor:
@@ -531,6 +683,9 @@ class ProblemService:
     @staticmethod
     def get_problem_by_page_and_number(p_page: int, num_in_page: str) -> Optional[Dict[str, Any]]:
         """페이지와 문제번호로 문제 정보를 조회합니다."""
+        snapshot = _catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.get_problem_by_page_and_number(p_page, num_in_page)
         try:
             conn = db_manager.get_connection()
             with conn.cursor() as cursor:
@@ -556,6 +711,9 @@ class ProblemService:
     @staticmethod
     def get_problems_by_chapter(main_chapt: str, sub_chapt: Optional[str] = None) -> List[Dict[str, Any]]:
         """단원별 문제 목록을 조회합니다."""
+        snapshot = _catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.get_problems_by_chapter(main_chapt, sub_chapt)
         try:
             conn = db_manager.get_connection()
             with conn.cursor() as cursor:
@@ -585,8 +743,16 @@ class ProblemService:
             return []
     
     @staticmethod
-    def get_problems_by_difficulty(p_level: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """난이도별 문제 목록을 조회합니다."""
+    def get_problems_by_ids(p_ids: List[int]) -> List[Dict[str, Any]]:
+        """문제 ID 목록으로 문제 정보를 조회합니다 (입력 순서 유지)."""
+        if not p_ids:
+            return []
+        snapshot = _catalog_snapshot()
+        if snapshot is not None:
+            return [
+                {field: snapshot.problems[p_id].get(field) for field in SEARCH_FIELDS}
+                for p_id in p_ids if p_id in snapshot.problems
+            ]
         try:
             conn = db_manager.get_connection()
             with conn.cursor() as cursor:
@@ -594,25 +760,107 @@ class ProblemService:
                 SELECT p_id, p_code, p_name, p_page, num_in_page, 
                        main_chapt, sub_chapt, p_type, p_level, p_text, answer, solution
                 FROM problems 
-                WHERE p_level = %s
-                ORDER BY RANDOM()
-                LIMIT %s
+                WHERE p_id = ANY(%s)
                 """
-                cursor.execute(query, (p_level, limit))
-                results = cursor.fetchall()
-                return [dict(row) for row in results]
+                cursor.execute(query, (list(p_ids),))
+                rows = {row['p_id']: dict(row) for row in cursor.fetchall()}
+                return [rows[p_id] for p_id in p_ids if p_id in rows]
         except Exception as e:
-            logger.error(f"난이도별 문제 조회 오류: {e}")
+            logger.error(f"문제 목록 조회 오류: {e}")
+            return []
+    
+    @staticmethod
+    def get_problems_by_difficulty(p_level: str, limit: int = 10, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """난이도별 문제 목록을 무작위로 조회합니다.
+
+        user_id가 주어지면 해당 사용자가 이미 풀어본 문제는 제외합니다.
+        """
+        exclude = ChatService.get_attempted_problem_ids(user_id) if user_id else None
+        p_ids = problem_sampler.sample(limit=limit, p_level=p_level, exclude=exclude)
+        return ProblemService.get_problems_by_ids(p_ids)
+
+    @staticmethod
+    def get_practice_set(limit: int = 10, main_chapt: Optional[str] = None, sub_chapt: Optional[str] = None,
+                         p_level: Optional[str] = None, user_id: Optional[int] = None,
+                         stratified: bool = True) -> List[Dict[str, Any]]:
+        """연습 문제 세트를 구성합니다.
+
+        p_level이 없고 stratified가 참이면 난이도별로 고르게 뽑습니다.
+        """
+        exclude = ChatService.get_attempted_problem_ids(user_id) if user_id else None
+        if stratified and not p_level:
+            p_ids = problem_sampler.stratified_sample(
+                limit=limit, main_chapt=main_chapt, sub_chapt=sub_chapt, exclude=exclude
+            )
+        else:
+            p_ids = problem_sampler.sample(
+                limit=limit, p_level=p_level, main_chapt=main_chapt, sub_chapt=sub_chapt, exclude=exclude
+            )
+        return ProblemService.get_problems_by_ids(p_ids)
+
+    @staticmethod
+    def get_similar_problems(p_id: int) -> List[Dict[str, Any]]:
+        """problem_sim_map에 등록된 유사문제 목록을 조회합니다."""
+        snapshot = _catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.get_similar_problems(p_id)
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT 
+                    s.sim_p_id,
+                    s.p_name,
+                    s.p_page,
+                    s.num_in_page,
+                    s.p_img_url,
+                    s.main_chapt,
+                    s.sub_chapt,
+                    s.con_type,
+                    s.p_type,
+                    s.p_level,
+                    s.p_text,
+                    s.answer,
+                    s.solution
+                FROM problem_sim_map m
+                JOIN sim_problems s ON s.sim_p_id = m.sim_p_id
+                WHERE m.p_id = %s
+                ORDER BY s.sim_p_id
+                """
+                cursor.execute(query, (p_id,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"유사문제 조회 오류: {e}")
             return []
 
 class ReportService:
     """리포트 관련 서비스 클래스"""
     
+    @staticmethod
+    def get_latest_report_version(conversation_id: str) -> Optional[Dict[str, Any]]:
+        """대화 세션의 최신 리포트 id와 생성 시각만 조회합니다 (본문은 읽지 않음)."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT report_id, created_at
+                FROM reports
+                WHERE conversation_id = %s
+                ORDER BY created_at DESC
+                LIMIT 1
+                """
+                cursor.execute(query, (conversation_id,))
+                result = cursor.fetchone()
+                return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"리포트 버전 조회 오류: {e}")
+            return None
+    
     @staticmethod
     def extract_error_patterns_from_report(report_content: str) -> List[str]:
         """리포트 내용에서 오답 패턴을 추출합니다."""
         if not report_content:
-            logger.info("리포트 내용이 비어있음")
+            logger.debug("리포트 내용이 비어있음")
             return []
         
         # 오답 패턴 매핑
@@ -631,31 +879,54 @@ class ReportService:
         
         if pattern_match:
             patterns_text = pattern_match.group(1).strip()
-            logger.info(f"패턴 텍스트 추출: '{patterns_text}'")
             
             # 쉼표로 구분된 패턴들을 분리
             patterns = [p.strip() for p in patterns_text.split(',')]
-            logger.info(f"분리된 패턴들: {patterns}")
             
             # 매핑된 UI 이름으로 변환
             ui_patterns = []
             for pattern in patterns:
                 if pattern in pattern_mapping:
                     ui_patterns.append(pattern_mapping[pattern])
-                    logger.info(f"패턴 매핑: '{pattern}' -> '{pattern_mapping[pattern]}'")
                 else:
                     # 매핑되지 않은 패턴은 그대로 사용
                     ui_patterns.append(pattern)
-                    logger.info(f"매핑되지 않은 패턴: '{pattern}' (그대로 사용)")
             
-            logger.info(f"최종 UI 패턴들: {ui_patterns}")
+            logger.debug("오답 패턴 추출: %s -> %s", patterns, ui_patterns)
             return ui_patterns
         else:
-            logger.info("'**오답 패턴**:' 패턴을 찾을 수 없음")
-            logger.info(f"리포트 내용 미리보기: {report_content[:300]}...")
+            logger.debug("'**오답 패턴**:' 패턴을 찾을 수 없음: %.300s", report_content, extra=SAMPLED)
         
         return []
 
+    @staticmethod
+    def get_recent_error_areas(user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        """사용자의 최근 리포트에서 단원/개념 유형별 오답 패턴을 조회합니다."""
+        try:
+            conn = db_manager.get_connection()
+            with conn.cursor() as cursor:
+                query = """
+                SELECT r.p_id, p.sub_chapt, p.con_type, r.full_report_content
+                FROM reports r
+                JOIN problems p ON r.p_id = p.p_id
+                WHERE r.user_id = %s
+                ORDER BY r.created_at DESC
+                LIMIT %s
+                """
+                cursor.execute(query, (user_id, limit))
+                rows = []
+                for row in cursor.fetchall():
+                    rows.append({
+                        'p_id': row['p_id'],
+                        'sub_chapt': row['sub_chapt'],
+                        'con_type': row['con_type'],
+                        'error_patterns': ReportService.extract_error_patterns_from_report(row['full_report_content'])
+                    })
+                return rows
+        except Exception as e:
+            logger.error(f"최근 오답 영역 조회 오류: {e}")
+            return []
+
     @staticmethod
     def get_user_conversations_with_error_patterns(user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """사용자의 대화 목록을 오답 패턴과 함께 조회합니다."""
@@ -688,17 +959,16 @@ class ReportService:
                     
                     # 리포트에서 오답 패턴 추출
                     if conversation.get('full_report_content'):
-                        logger.info(f"리포트 데이터 발견: conversation_id={conversation['conversation_id']}")
-                        logger.info(f"리포트 내용 미리보기: {conversation['full_report_content'][:200]}...")
+                        logger.debug("리포트 데이터 발견: conversation_id=%s", conversation['conversation_id'])
                         
                         error_patterns = ReportService.extract_error_patterns_from_report(
                             conversation['full_report_content']
                         )
                         conversation['error_patterns'] = error_patterns
                         
-                        logger.info(f"추출된 오답 패턴: {error_patterns}")
+                        logger.debug("추출된 오답 패턴: %s", error_patterns)
                     else:
-                        logger.info(f"리포트 데이터 없음: conversation_id={conversation['conversation_id']}")
+                        logger.debug("리포트 데이터 없음: conversation_id=%s", conversation['conversation_id'])
                         conversation['error_patterns'] = []
                     
                     conversations.append(conversation)
@@ -712,6 +982,9 @@ class ReportService:
     @staticmethod
     def search_problems(keyword: str, limit: int = 10) -> List[Dict[str, Any]]:
         """키워드로 문제를 검색합니다."""
+        snapshot = _catalog_snapshot()
+        if snapshot is not None:
+            return snapshot.search(keyword, limit)
         try:
             conn = db_manager.get_connection()
             with conn.cursor() as cursor:
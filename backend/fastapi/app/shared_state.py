@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import re
+import select
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import sql
+
+from .database import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+
+logger = logging.getLogger(__name__)
+
+# memory (프로세스 내부) | postgres (여러 워커/컨테이너가 공유)
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory").lower()
+# 만료된 키를 정리하는 간격(초)
+SHARED_STATE_PURGE_INTERVAL = 60
+
+# 이 프로세스를 구분하는 id (자기가 보낸 메시지를 걸러낼 때 사용)
+INSTANCE_ID = uuid.uuid4().hex
+
+_CHANNEL_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+Subscriber = Callable[[Any], None]
+
+class SharedState(ABC):
+    """카운터, 캐시 항목, 세션 상태를 저장하고 pub/sub으로 무효화 메시지를 주고받는 인터페이스
+
+    postgres 백엔드의 메서드는 DB 왕복을 하는 블로킹 호출이므로 이벤트 루프에서는 asyncio.to_thread로 호출한다.
+    """
+
+    # 여러 프로세스가 같은 상태를 보는지 여부
+    shared = False
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Tuple[Subscriber, bool]]] = {}
+        self._subscribers_lock = threading.Lock()
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1) -> int:
+        """key의 정수 값을 원자적으로 amount만큼 늘리고 늘린 값을 반환합니다."""
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Any:
+        """만료되지 않은 값을 반환합니다. 없으면 default."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """값을 저장합니다. ttl(초)이 있으면 그 뒤에 만료됩니다."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """값을 지웁니다."""
+
+    @abstractmethod
+    def publish(self, channel: str, message: Any) -> None:
+        """channel 구독자에게 message를 보냅니다."""
+
+    def subscribe(self, channel: str, callback: Subscriber, include_self: bool = False) -> None:
+        """channel에 메시지가 오면 callback(message)를 호출합니다. 기본적으로 자기 프로세스가 보낸 메시지는 무시합니다."""
+        if not _CHANNEL_PATTERN.match(channel):
+            raise ValueError(f"잘못된 채널 이름: {channel}")
+        with self._subscribers_lock:
+            self._subscribers.setdefault(channel, []).append((callback, include_self))
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        try:
+            envelope = json.loads(payload)
+        except (TypeError, ValueError):
+            logger.warning(f"공유 상태 메시지 파싱 실패: channel={channel}")
+            return
+        from_self = envelope.get("origin") == INSTANCE_ID
+        for callback, include_self in list(self._subscribers.get(channel, ())):
+            if from_self and not include_self:
+                continue
+            try:
+                callback(envelope.get("data"))
+            except Exception as e:
+                logger.error(f"공유 상태 구독 콜백 오류: channel={channel}, {e}")
+
+    @staticmethod
+    def _envelope(message: Any) -> str:
+        return json.dumps({"origin": INSTANCE_ID, "data": message}, ensure_ascii=False, default=str)
+
+class MemoryBackend(SharedState):
+    """단일 프로세스용 백엔드 (기본값)"""
+
+    def __init__(self):
+        super().__init__()
+        self._values: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _get_live(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            self._values.pop(key, None)
+            return None
+        return entry
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            entry = self._get_live(key)
+            value = (int(entry[0]) if entry else 0) + amount
+            self._values[key] = (value, entry[1] if entry else None)
+            return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._get_live(key)
+        return entry[0] if entry is not None else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def publish(self, channel: str, message: Any) -> None:
+        self._dispatch(channel, self._envelope(message))
+
+class PostgresBackend(SharedState):
+    """PostgreSQL을 이용해 여러 워커/컨테이너가 상태를 공유하는 백엔드
+
+    값은 UNLOGGED 테이블에 JSONB로 저장하고, 증가는 INSERT ... ON CONFLICT 한 문장으로 처리한다.
+    pub/sub은 LISTEN/NOTIFY를 사용하며 전용 연결을 가진 백그라운드 스레드가 메시지를 받는다.
+    """
+
+    shared = True
+
+    SCHEMA = """
+    CREATE UNLOGGED TABLE IF NOT EXISTS shared_state (
+        key TEXT PRIMARY KEY,
+        value JSONB NOT NULL,
+        expires_at TIMESTAMPTZ
+    )
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self._listen_channels: set = set()
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _connect():
+        conn = psycopg2.connect(host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+        conn.autocommit = True
+        return conn
+
+    def _execute(self, query: str, params: Tuple = (), fetch: bool = False):
+        with self._lock:
+            if self._conn is None or self._conn.closed:
+                self._conn = self._connect()
+                with self._conn.cursor() as cursor:
+                    cursor.execute(self.SCHEMA)
+            try:
+                with self._conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    return cursor.fetchone() if fetch else None
+            except psycopg2.OperationalError:
+                self._conn.close()
+                raise
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        row = self._execute(
+            """
+            INSERT INTO shared_state (key, value) VALUES (%s, to_jsonb(%s::bigint))
+            ON CONFLICT (key) DO UPDATE
+            SET value = to_jsonb((shared_state.value #>> '{}')::bigint + EXCLUDED.value::text::bigint)
+            RETURNING (value #>> '{}')::bigint
+            """,
+            (key, amount), fetch=True
+        )
+        return int(row[0])
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._execute(
+            "SELECT value FROM shared_state WHERE key = %s AND (expires_at IS NULL OR expires_at > now())",
+            (key,), fetch=True
+        )
+        return row[0] if row is not None else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._execute(
+            """
+            INSERT INTO shared_state (key, value, expires_at)
+            VALUES (%s, %s::jsonb, CASE WHEN %s::float8 IS NULL THEN NULL ELSE now() + make_interval(secs => %s::float8) END)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at
+            """,
+            (key, json.dumps(value, ensure_ascii=False, default=str), ttl, ttl)
+        )
+        now = time.monotonic()
+        if now - self._last_purge > SHARED_STATE_PURGE_INTERVAL:
+            self._last_purge = now
+            self._execute("DELETE FROM shared_state WHERE expires_at <= now()")
+
+    def delete(self, key: str) -> None:
+        self._execute("DELETE FROM shared_state WHERE key = %s", (key,))
+
+    def publish(self, channel: str, message: Any) -> None:
+        self._execute("SELECT pg_notify(%s, %s)", (channel, self._envelope(message)))
+
+    def subscribe(self, channel: str, callback: Subscriber, include_self: bool = False) -> None:
+        super().subscribe(channel, callback, include_self)
+        with self._subscribers_lock:
+            self._listen_channels.add(channel)
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="shared-state-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self) -> None:
+        conn = None
+        listening: set = set()
+        while True:
+            try:
+                if conn is None or conn.closed:
+                    conn = self._connect()
+                    listening = set()
+                for channel in self._listen_channels - listening:
+                    with conn.cursor() as cursor:
+                        cursor.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+                    listening.add(channel)
+                if select.select([conn], [], [], 5)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except Exception as e:
+                logger.warning(f"공유 상태 LISTEN 연결 오류 (재연결 시도): {e}")
+                if conn is not None:
+                    conn.close()
+                conn = None
+                time.sleep(5)
+
+def create_shared_state() -> SharedState:
+    """SHARED_STATE_BACKEND 설정에 맞는 백엔드를 생성합니다."""
+    if SHARED_STATE_BACKEND == "postgres":
+        return PostgresBackend()
+    if SHARED_STATE_BACKEND != "memory":
+        logger.warning(f"알 수 없는 SHARED_STATE_BACKEND: {SHARED_STATE_BACKEND} (memory 사용)")
+    return MemoryBackend()
+
+# 전역 공유 상태 인스턴스
+shared_state = create_shared_state()
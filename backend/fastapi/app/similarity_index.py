@@ -0,0 +1,300 @@
+"""problems → sim_problems 유사도 인덱스 배치 빌더
+
+문제 본문(p_text)의 문자 n-gram TF-IDF와 단원/개념 메타데이터를 합쳐 벡터화하고,
+청크 단위 희소 행렬 곱으로 문제별 top-k 유사문제를 구해 problem_sim_map에 일괄 저장한다.
+
+사용법:
+    python -m app.similarity_index               # 매핑이 없는 문제만 계산 (증분)
+    python -m app.similarity_index --full        # 전체 문제 재계산
+    python -m app.similarity_index --p-ids 1002001 1002002
+"""
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from psycopg2.extras import execute_values
+
+from .database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 문제별로 저장할 유사문제 수
+SIM_TOP_K = int(os.getenv("SIM_TOP_K", "5"))
+# 이 점수 미만의 후보는 저장하지 않음
+SIM_MIN_SCORE = float(os.getenv("SIM_MIN_SCORE", "0.1"))
+# 한 번에 곱하는 문제 행 수 (청크 크기 × sim_problems 수 만큼의 float32 메모리 사용)
+SIM_CHUNK_SIZE = int(os.getenv("SIM_CHUNK_SIZE", "256"))
+# 청크 곱셈을 나눠 처리할 프로세스 수
+SIM_WORKERS = int(os.getenv("SIM_WORKERS", str(os.cpu_count() or 1)))
+
+NGRAM_RANGE = (2, 3)
+# 너무 흔한 n-gram(조사, 공백 등)은 변별력이 없고 곱셈 결과만 조밀하게 만듦
+MAX_DF_RATIO = 0.05
+MIN_DF = 2
+
+# 본문/메타데이터 블록 가중치 (합 1.0 → 코사인 유사도가 두 블록 유사도의 가중합이 됨)
+W_TEXT = 0.7
+W_META = 0.3
+META_WEIGHTS = {'M': 1.0, 'S': 2.0, 'T': 2.0, 'C': 3.0}
+
+_WHITESPACE = re.compile(r"\s+")
+
+def _normalize_text(text: Optional[str]) -> str:
+    return _WHITESPACE.sub(" ", (text or "").lower()).strip()
+
+def char_ngrams(text: Optional[str]) -> Counter:
+    """정규화된 본문의 문자 n-gram 빈도를 반환합니다."""
+    text = _normalize_text(text)
+    grams: Counter = Counter()
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+def meta_tokens(doc: Dict[str, Any]) -> Dict[str, float]:
+    """단원/유형/개념 메타데이터를 가중치가 있는 토큰으로 변환합니다."""
+    tokens: Dict[str, float] = {}
+    for prefix, field in (('M', 'main_chapt'), ('S', 'sub_chapt'), ('T', 'con_type')):
+        if doc.get(field):
+            tokens[f"{prefix}:{doc[field]}"] = META_WEIGHTS[prefix]
+    for con_id in doc.get('concept_ids', ()):
+        tokens[f"C:{con_id}"] = META_WEIGHTS['C']
+    return tokens
+
+def _l2_normalize(matrix: sp.csr_matrix) -> sp.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.csr_matrix(sp.diags(1.0 / norms) @ matrix)
+
+class ProblemVectorizer:
+    """문제/유사문제 문서를 L2 정규화된 희소 벡터로 변환하는 클래스"""
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self.idf: Optional[np.ndarray] = None
+        self.meta_vocab: Dict[str, int] = {}
+
+    def fit(self, docs: Sequence[Dict[str, Any]]) -> "ProblemVectorizer":
+        """전체 문서로 어휘와 IDF를 계산합니다."""
+        df: Counter = Counter()
+        for doc in docs:
+            df.update(char_ngrams(doc.get('p_text')).keys())
+        n_docs = max(len(docs), 1)
+        # 문서가 적으면(40개 미만) 비율 기준이 MIN_DF보다 작아져 어휘가 비므로 최소 MIN_DF + 1로 맞춤
+        max_df = max(MAX_DF_RATIO * n_docs, MIN_DF + 1)
+        kept = sorted(gram for gram, count in df.items() if MIN_DF <= count <= max_df)
+        if not kept:
+            logger.warning(f"본문 n-gram 어휘가 비어 있습니다 (문서 {n_docs}개): 메타데이터로만 유사도를 계산합니다.")
+        self.vocab = {gram: i for i, gram in enumerate(kept)}
+        self.idf = np.array(
+            [math.log((1 + n_docs) / (1 + df[gram])) + 1.0 for gram in kept], dtype=np.float32
+        )
+
+        meta = set()
+        for doc in docs:
+            meta.update(meta_tokens(doc).keys())
+        self.meta_vocab = {token: i for i, token in enumerate(sorted(meta))}
+        return self
+
+    def transform(self, docs: Sequence[Dict[str, Any]]) -> sp.csr_matrix:
+        """문서 목록을 [본문 TF-IDF | 메타데이터] 결합 벡터로 변환합니다."""
+        text_rows = self._build_rows(
+            ((char_ngrams(doc.get('p_text')), self.vocab) for doc in docs), len(self.vocab)
+        )
+        # 부분선형 TF: 1 + log(tf)
+        np.log(text_rows.data, out=text_rows.data)
+        text_rows.data += 1.0
+        if self.idf is not None and len(self.vocab):
+            text_rows = sp.csr_matrix(text_rows @ sp.diags(self.idf))
+        meta_rows = self._build_rows(
+            ((meta_tokens(doc), self.meta_vocab) for doc in docs), len(self.meta_vocab)
+        )
+        combined = sp.hstack([
+            _l2_normalize(text_rows) * math.sqrt(W_TEXT),
+            _l2_normalize(meta_rows) * math.sqrt(W_META)
+        ], format='csr', dtype=np.float32)
+        return combined
+
+    @staticmethod
+    def _build_rows(rows: Iterable[Tuple[Dict[str, float], Dict[str, int]]], n_features: int) -> sp.csr_matrix:
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for weights, vocab in rows:
+            for token, value in weights.items():
+                col = vocab.get(token)
+                if col is None:
+                    continue
+                indices.append(col)
+                data.append(value)
+            indptr.append(len(indices))
+        return sp.csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, max(n_features, 1))
+        )
+
+# 작업 프로세스에서 공유하는 대상 행렬 (fork 시 복사 없이 상속됨)
+_worker_targets_t: Optional[sp.csr_matrix] = None
+
+def _init_worker(targets_t: sp.csr_matrix) -> None:
+    global _worker_targets_t
+    _worker_targets_t = targets_t
+
+def _chunk_top_k(queries: sp.csr_matrix, targets_t: sp.csr_matrix, k: int,
+                 min_score: float) -> List[List[Tuple[int, float]]]:
+    """한 청크의 유사도를 계산하고 행별 상위 k개만 남깁니다."""
+    scores = (queries @ targets_t).toarray()
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [
+        [(int(c), float(v)) for c, v in zip(cols, vals) if v >= min_score]
+        for cols, vals in zip(top, top_scores)
+    ]
+
+def _worker_chunk_top_k(args: Tuple[sp.csr_matrix, int, float]) -> List[List[Tuple[int, float]]]:
+    queries, k, min_score = args
+    return _chunk_top_k(queries, _worker_targets_t, k, min_score)
+
+def top_k_neighbors(queries: sp.csr_matrix, targets: sp.csr_matrix, k: int = SIM_TOP_K,
+                    chunk_size: int = SIM_CHUNK_SIZE, min_score: float = SIM_MIN_SCORE,
+                    workers: int = 1) -> List[List[Tuple[int, float]]]:
+    """queries의 각 행에 대해 targets에서 코사인 유사도 상위 k개의 (행 번호, 점수)를 반환합니다.
+
+    전체 유사도 행렬을 만들지 않도록 chunk_size 행씩 곱하고 argpartition으로 상위 k개만 남긴다.
+    workers가 2 이상이면 청크를 여러 프로세스에 나눠 계산한다.
+    """
+    n_targets = targets.shape[0]
+    if n_targets == 0:
+        return [[] for _ in range(queries.shape[0])]
+    k = min(k, n_targets)
+    targets_t = sp.csr_matrix(targets.T)
+    chunks = [queries[start:start + chunk_size] for start in range(0, queries.shape[0], chunk_size)]
+
+    results: List[List[Tuple[int, float]]] = []
+    if workers > 1 and len(chunks) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(targets_t,)
+        ) as executor:
+            for chunk_result in executor.map(_worker_chunk_top_k, ((c, k, min_score) for c in chunks)):
+                results.extend(chunk_result)
+    else:
+        for chunk in chunks:
+            results.extend(_chunk_top_k(chunk, targets_t, k, min_score))
+    return results
+
+def load_documents(cursor) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """problems와 sim_problems를 개념 ID와 함께 읽어옵니다."""
+    cursor.execute("SELECT p_id, p_text, main_chapt, sub_chapt, con_type FROM problems ORDER BY p_id")
+    problems = [dict(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT sim_p_id, p_text, main_chapt, sub_chapt, con_type FROM sim_problems ORDER BY sim_p_id")
+    sim_problems = [dict(row) for row in cursor.fetchall()]
+
+    cursor.execute("SELECT p_id, con_id FROM problem_concept_map")
+    concepts: Dict[int, List[int]] = {}
+    for row in cursor.fetchall():
+        concepts.setdefault(row['p_id'], []).append(row['con_id'])
+    for problem in problems:
+        problem['concept_ids'] = concepts.get(problem['p_id'], [])
+
+    # 유사문제의 개념은 단원/유형이 같은 문제들의 개념으로 추정
+    # (다시 만들 problem_sim_map을 근거로 쓰면 기존 매핑이 결과를 결정하므로 사용하지 않음)
+    section_concepts: Dict[Tuple[Any, Any, Any], set] = {}
+    for problem in problems:
+        key = (problem.get('main_chapt'), problem.get('sub_chapt'), problem.get('con_type'))
+        section_concepts.setdefault(key, set()).update(problem['concept_ids'])
+    for sim in sim_problems:
+        key = (sim.get('main_chapt'), sim.get('sub_chapt'), sim.get('con_type'))
+        sim['concept_ids'] = sorted(section_concepts.get(key, ()))
+    return problems, sim_problems
+
+def unmapped_problem_ids(cursor) -> List[int]:
+    """problem_sim_map에 아직 매핑이 없는 문제 ID 목록을 조회합니다."""
+    cursor.execute("""
+    SELECT p.p_id
+    FROM problems p
+    WHERE NOT EXISTS (SELECT 1 FROM problem_sim_map m WHERE m.p_id = p.p_id)
+    """)
+    return [row['p_id'] for row in cursor.fetchall()]
+
+def write_sim_map(conn, rows: List[Tuple[int, int]], p_ids: List[int], page_size: int = 5000) -> None:
+    """대상 문제의 기존 매핑을 지우고 새 매핑을 한 트랜잭션으로 일괄 저장합니다."""
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM problem_sim_map WHERE p_id = ANY(%s)", (p_ids,))
+        execute_values(
+            cursor,
+            "INSERT INTO problem_sim_map (p_id, sim_p_id) VALUES %s",
+            rows,
+            page_size=page_size
+        )
+    conn.commit()
+
+def build_index(full: bool = False, p_ids: Optional[List[int]] = None, k: int = SIM_TOP_K,
+                dry_run: bool = False, workers: int = SIM_WORKERS) -> Dict[str, Any]:
+    """유사도 인덱스를 계산하고 problem_sim_map에 저장합니다."""
+    start_time = time.time()
+    conn = db_manager.get_connection()
+    with conn.cursor() as cursor:
+        problems, sim_problems = load_documents(cursor)
+        if p_ids:
+            targets = set(p_ids)
+        elif full:
+            targets = {p['p_id'] for p in problems}
+        else:
+            targets = set(unmapped_problem_ids(cursor))
+    conn.commit()
+
+    query_docs = [p for p in problems if p['p_id'] in targets]
+    logger.info(f"유사도 인덱스 계산 시작: 대상 문제 {len(query_docs)}개, 유사문제 {len(sim_problems)}개")
+    if not query_docs or not sim_problems:
+        return {"targets": len(query_docs), "rows": 0, "seconds": round(time.time() - start_time, 2)}
+
+    # IDF는 증분 모드에서도 전체 코퍼스 기준으로 계산
+    vectorizer = ProblemVectorizer().fit(problems + sim_problems)
+    sim_matrix = vectorizer.transform(sim_problems)
+    query_matrix = vectorizer.transform(query_docs)
+    logger.info(f"벡터화 완료: 특성 {sim_matrix.shape[1]}개 ({time.time() - start_time:.1f}초)")
+
+    neighbors = top_k_neighbors(query_matrix, sim_matrix, k=k, workers=workers)
+    rows = [
+        (doc['p_id'], sim_problems[col]['sim_p_id'])
+        for doc, doc_neighbors in zip(query_docs, neighbors)
+        for col, _score in doc_neighbors
+    ]
+    if not dry_run:
+        write_sim_map(conn, rows, [doc['p_id'] for doc in query_docs])
+
+    elapsed = time.time() - start_time
+    logger.info(f"유사도 인덱스 저장 완료: 매핑 {len(rows)}건 ({elapsed:.1f}초)")
+    return {"targets": len(query_docs), "rows": len(rows), "seconds": round(elapsed, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description="problems → sim_problems 유사도 인덱스 빌더")
+    parser.add_argument("--full", action="store_true", help="모든 문제의 매핑을 다시 계산합니다")
+    parser.add_argument("--p-ids", type=int, nargs="*", help="지정한 문제만 다시 계산합니다")
+    parser.add_argument("--k", type=int, default=SIM_TOP_K, help="문제별 저장할 유사문제 수")
+    parser.add_argument("--workers", type=int, default=SIM_WORKERS, help="유사도 계산 프로세스 수")
+    parser.add_argument("--dry-run", action="store_true", help="계산만 하고 저장하지 않습니다")
+    args = parser.parse_args()
+    try:
+        result = build_index(full=args.full, p_ids=args.p_ids, k=args.k, dry_run=args.dry_run,
+                             workers=args.workers)
+        print(result)
+    finally:
+        db_manager.close_connection()
+
+if __name__ == "__main__":
+    main()
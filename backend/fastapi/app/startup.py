@@ -0,0 +1,107 @@
+"""콜드 스타트 지원: 시작 준비 상태(/ready)와 import 시간 예산 검사
+
+사용법:
+    python -m app.startup                        # app.main import 시간을 측정하고 예산을 넘으면 종료 코드 1
+    python -m app.startup --runs 5 --budget 600  # 5회 측정한 중앙값을 600ms 예산과 비교
+    python -m app.startup --top 20               # 자체 import 시간이 큰 모듈 20개 출력
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# app.main import 시간 예산(ms). 무거운 SDK는 첫 사용 시점으로 미뤄 이 안에 들어와야 함
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "800"))
+
+class StartupState:
+    """시작 시 예열 작업(문제 카탈로그, LLM SDK 등)의 결과를 기록하는 클래스
+
+    의존성의 현재 상태는 health.HealthMonitor가 주기적으로 검사하고, 여기서는 예열이 끝났는지만 판단한다.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.checks: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, name: str, ok: bool, elapsed: float, detail: Optional[str] = None) -> None:
+        self.checks[name] = {"ok": ok, "seconds": round(elapsed, 3), **({"detail": detail} if detail else {})}
+
+    def finish(self) -> None:
+        self.finished_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "warming": self.finished_at is None,
+            "warmup_seconds": round(self.finished_at - self.started_at, 3) if self.finished_at else None,
+            "checks": self.checks
+        }
+
+# 전역 시작 상태
+startup_state = StartupState()
+
+def _parse_importtime(stderr: str) -> Tuple[Optional[float], List[Tuple[float, str]]]:
+    """-X importtime 출력에서 app.main 누적 시간(ms)과 모듈별 자체 시간(ms)을 뽑습니다."""
+    total = None
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        name = parts[2].strip()
+        modules.append((self_us / 1000.0, name))
+        if name == "app.main":
+            total = cumulative_us / 1000.0
+    return total, modules
+
+def measure_import(module: str = "app.main", runs: int = 3) -> Dict[str, Any]:
+    """새 인터프리터에서 module을 runs번 import해 누적 시간(ms)의 중앙값과 무거운 모듈 목록을 반환합니다."""
+    totals = []
+    heaviest: Dict[str, float] = {}
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for _ in range(max(1, runs)):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=cwd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{module} import 실패: {result.stderr.strip().splitlines()[-1:]}")
+        total, modules = _parse_importtime(result.stderr)
+        if total is not None:
+            totals.append(total)
+        for self_ms, name in modules:
+            heaviest[name] = max(heaviest.get(name, 0.0), self_ms)
+    top = sorted(heaviest.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "module": module,
+        "runs": len(totals),
+        "median_ms": round(statistics.median(totals), 1) if totals else None,
+        "max_ms": round(max(totals), 1) if totals else None,
+        "heaviest": [{"module": name, "self_ms": round(ms, 1)} for name, ms in top]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="app.main import 시간 예산 검사")
+    parser.add_argument("--runs", type=int, default=3, help="측정 횟수 (중앙값으로 판정)")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_MS, help="허용 import 시간(ms)")
+    parser.add_argument("--top", type=int, default=10, help="출력할 무거운 모듈 수")
+    args = parser.parse_args()
+    result = measure_import(runs=args.runs)
+    result["heaviest"] = result["heaviest"][:args.top]
+    result["budget_ms"] = args.budget
+    result["within_budget"] = result["median_ms"] is not None and result["median_ms"] <= args.budget
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(0 if result["within_budget"] else 1)
+
+if __name__ == "__main__":
+    main()
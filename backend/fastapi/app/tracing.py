@@ -0,0 +1,253 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 내보내기 방식: "" (끔) | jsonl | otlp
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", "app/traces.jsonl")
+# OTLP/HTTP(JSON) 수집기 주소
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "dasida-fastapi")
+# 내보낼 요청 비율 (Server-Timing 헤더는 항상 붙임)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "true").lower() == "true"
+TRACE_QUEUE_SIZE = 1000
+TRACE_BATCH_SIZE = 50
+
+class Span:
+    """한 구간의 이름, 시작/종료 시각, 속성"""
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name: str, parent_id: Optional[str], start_ns: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = start_ns
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class Trace:
+    """요청 하나에서 수집된 span 목록"""
+
+    __slots__ = ('trace_id', 'request_id', 'spans')
+
+    def __init__(self, request_id: str):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.spans: List[Span] = []
+
+    def server_timing(self) -> str:
+        """같은 이름의 span을 합산해 Server-Timing 헤더 값을 만듭니다."""
+        totals: Dict[str, List[float]] = {}
+        for s in self.spans:
+            entry = totals.setdefault(s.name, [0.0, 0])
+            entry[0] += s.duration_ms
+            entry[1] += 1
+        parts = []
+        for name, (duration, count) in totals.items():
+            part = f"{name};dur={duration:.1f}"
+            if count > 1:
+                part += f';desc="{count}x"'
+            parts.append(part)
+        return ", ".join(parts)
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_current_span_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span_id", default=None)
+
+def current_request_id() -> Optional[str]:
+    """현재 요청의 request id를 반환합니다 (요청 밖이면 None)."""
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """with 블록 실행 구간을 현재 요청의 span으로 기록합니다. 요청 밖에서는 아무 일도 하지 않습니다."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    s = Span(name, _current_span_id.get(), time.time_ns(), attributes)
+    token = _current_span_id.set(s.span_id)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span_id.reset(token)
+        trace.spans.append(s)
+
+def record_span(name: str, elapsed: float, **attributes: Any) -> None:
+    """이미 측정된 구간(초)을 방금 끝난 span으로 기록합니다."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    end_ns = time.time_ns()
+    s = Span(name, _current_span_id.get(), end_ns - int(elapsed * 1e9), attributes)
+    s.end_ns = end_ns
+    trace.spans.append(s)
+
+class _Exporter:
+    """완료된 trace를 백그라운드 스레드에서 JSON lines 파일 또는 OTLP 수집기로 내보내는 클래스"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self._queue: queue.Queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace: Trace) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < TRACE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if self.mode == "otlp":
+                    self._export_otlp(batch)
+                else:
+                    self._export_jsonl(batch)
+            except Exception as e:
+                logger.warning(f"trace 내보내기 오류: {e}")
+
+    @staticmethod
+    def _export_jsonl(batch: List[Trace]) -> None:
+        with open(TRACE_JSONL_PATH, 'a', encoding='utf-8') as f:
+            for trace in batch:
+                f.write(json.dumps({
+                    "trace_id": trace.trace_id,
+                    "request_id": trace.request_id,
+                    "spans": [s.to_dict() for s in trace.spans]
+                }, ensure_ascii=False, default=str) + "\n")
+
+    @staticmethod
+    def _otlp_value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _export_otlp(self, batch: List[Trace]) -> None:
+        spans = []
+        for trace in batch:
+            for s in trace.spans:
+                attributes = dict(s.attributes, request_id=trace.request_id)
+                spans.append({
+                    "traceId": trace.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": 2 if s.parent_id is None else 1,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": self._otlp_value(v)} for k, v in attributes.items()],
+                    "status": {"code": 2, "message": s.error} if s.error else {"code": 0}
+                })
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "dasida.tracing"}, "spans": spans}]
+            }]
+        }
+        request = urllib.request.Request(
+            TRACE_OTLP_ENDPOINT,
+            data=json.dumps(body, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=2) as response:
+            response.read()
+
+exporter: Optional[_Exporter] = _Exporter(TRACE_EXPORTER) if TRACE_EXPORTER in ("jsonl", "otlp") else None
+
+class TracingMiddleware:
+    """요청마다 trace를 만들고 Server-Timing / X-Request-ID 헤더를 붙이는 ASGI 미들웨어"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for key, value in scope.get("headers", ()):
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        trace = Trace(request_id or uuid.uuid4().hex)
+        root = Span("http.request", None, time.time_ns(), {"method": scope["method"]})
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span_id.set(root.span_id)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", ()))
+                headers.append((b"x-request-id", trace.request_id.encode("latin-1")))
+                if TRACE_SERVER_TIMING:
+                    total = (time.time_ns() - root.start_ns) / 1e6
+                    timing = trace.server_timing()
+                    value = f"total;dur={total:.1f}" + (f", {timing}" if timing else "")
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            root.end_ns = time.time_ns()
+            route = scope.get("route")
+            root.attributes["route"] = getattr(route, "path", None) or "unmatched"
+            root.attributes["status"] = status["code"]
+            trace.spans.append(root)
+            _current_span_id.reset(span_token)
+            _current_trace.reset(trace_token)
+            if exporter is not None and random.random() < TRACE_SAMPLE_RATE:
+                exporter.submit(trace)
@@ -0,0 +1,92 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from .shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+# 대화별로 보관하는 최근 메시지 수 (재연결 시 이보다 오래된 메시지가 필요하면 전체 로그를 다시 받아야 함)
+TUTOR_LOG_SIZE = int(os.getenv("TUTOR_LOG_SIZE", "50"))
+TUTOR_LOG_TTL = int(os.getenv("TUTOR_LOG_TTL", "7200"))
+
+# 같은 대화의 로그 갱신(조회 → 수정 → 저장)을 직렬화하는 잠금. 대화 수와 무관하게 고정 개수를 나눠 씀
+_LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+def _lock_for(conversation_id: str) -> threading.Lock:
+    return _locks[hash(conversation_id) % _LOCK_STRIPES]
+
+class TutorLog:
+    """웹소켓 튜터 세션의 최근 메시지를 일련번호(id)와 함께 공유 상태에 보관하는 클래스
+
+    메시지 id는 대화 안에서 1씩 증가하며, 재연결한 클라이언트는 마지막으로 받은 id 이후만 다시 받는다.
+    로그가 만료되어 새로 만들어지면 epoch가 바뀌므로 클라이언트는 이전 id로 이어받을 수 없음을 알 수 있다.
+    append와 ack는 학생 메시지 수신 루프와 응답 생성 태스크(서로 다른 스레드)에서 동시에 호출되므로 대화별 잠금 안에서 갱신한다.
+    """
+
+    @staticmethod
+    def key(conversation_id: str) -> str:
+        return f"tutor_log:{conversation_id}"
+
+    @staticmethod
+    def load(conversation_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return shared_state.get(TutorLog.key(conversation_id))
+        except Exception as e:
+            logger.error(f"튜터 메시지 로그 조회 오류: {e}")
+            return None
+
+    @staticmethod
+    def _save(conversation_id: str, log: Dict[str, Any]) -> None:
+        try:
+            shared_state.set(TutorLog.key(conversation_id), log, ttl=TUTOR_LOG_TTL)
+        except Exception as e:
+            logger.error(f"튜터 메시지 로그 저장 오류: {e}")
+
+    @staticmethod
+    def create(conversation_id: str, history: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """DB에 저장된 최근 메시지(sender_role, message)로 새 로그를 만듭니다."""
+        messages = [
+            {"id": i, "role": msg.get("sender_role", "user"), "text": msg.get("message", "")}
+            for i, msg in enumerate(history[-TUTOR_LOG_SIZE:], start=1)
+        ]
+        log = {"epoch": uuid.uuid4().hex[:8], "seq": len(messages), "acked": 0, "messages": messages}
+        TutorLog._save(conversation_id, log)
+        return log
+
+    @staticmethod
+    def append(conversation_id: str, role: str, text: str) -> Dict[str, Any]:
+        """메시지를 로그에 추가하고 id가 붙은 메시지를 반환합니다."""
+        with _lock_for(conversation_id):
+            log = TutorLog.load(conversation_id) or TutorLog.create(conversation_id, [])
+            entry = {"id": log["seq"] + 1, "role": role, "text": text, "created_at": time.time()}
+            log["seq"] = entry["id"]
+            log["messages"] = (log["messages"] + [entry])[-TUTOR_LOG_SIZE:]
+            TutorLog._save(conversation_id, log)
+            return entry
+
+    @staticmethod
+    def ack(conversation_id: str, message_id: int) -> None:
+        """클라이언트가 받았다고 확인한 마지막 메시지 id를 기록합니다."""
+        with _lock_for(conversation_id):
+            log = TutorLog.load(conversation_id)
+            if log and log.get("acked", 0) < message_id <= log["seq"]:
+                log["acked"] = message_id
+                TutorLog._save(conversation_id, log)
+
+    @staticmethod
+    def since(log: Dict[str, Any], last_id: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """last_id 이후 메시지와, 빠진 메시지 없이 이어받을 수 있는지 여부를 반환합니다."""
+        messages = log["messages"]
+        oldest = messages[0]["id"] if messages else log["seq"] + 1
+        complete = last_id >= oldest - 1 and last_id <= log["seq"]
+        return [m for m in messages if m["id"] > last_id], complete
+
+    @staticmethod
+    def history(log: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """프롬프트의 대화 히스토리 형식(sender_role, message)으로 변환합니다."""
+        return [{"sender_role": m["role"], "message": m["text"]} for m in log["messages"]]
@@ -0,0 +1,199 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import metrics
+from .quiz_checker import QUIZ_TYPES
+
+logger = logging.getLogger(__name__)
+
+# 숨김 메타데이터 형식 (여는 표시, 닫는 표시, 메트릭 레이블)
+STATE_MARKERS = (
+    ("<!--", "-->", "comment"),
+    ("<STATE>", "</STATE>", "state_tag"),
+)
+# 닫는 표시 없이 너무 길어지면 메타데이터가 아니라고 보고 버림
+MAX_STATE_LENGTH = 4096
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+def _validate_attempts(value: Any) -> Optional[Dict[str, int]]:
+    if not isinstance(value, dict):
+        return None
+    attempts = {}
+    for step, count in value.items():
+        count = _as_int(count)
+        if count is None or count < 0 or _as_int(step) is None:
+            return None
+        attempts[str(step)] = count
+    return attempts
+
+def _validate_str_list(value: Any) -> Optional[List[str]]:
+    if isinstance(value, list) and all(isinstance(v, (str, int, float)) for v in value):
+        return [str(v) for v in value]
+    return None
+
+# 필드별 검증 함수 (검증 실패 시 None)
+STATE_SCHEMA = {
+    "current_step": lambda v: v if (v := _as_int(v)) is not None and v >= 1 else None,
+    "steps_total": lambda v: v if (v := _as_int(v)) is not None and 1 <= v <= 10 else None,
+    "max_attempts_per_step": lambda v: v if (v := _as_int(v)) is not None and v >= 1 else None,
+    "attempts": _validate_attempts,
+    "followup_mode": lambda v: v if isinstance(v, bool) else None,
+    "problem_brief": lambda v: v if isinstance(v, str) else None,
+    "key_points": _validate_str_list,
+    "quiz_type": lambda v: v.lower() if isinstance(v, str) and v.lower() in QUIZ_TYPES + ("none",) else None,
+    "expected_answer": lambda v: str(v) if isinstance(v, (str, int, float)) and not isinstance(v, bool) else _validate_str_list(v),
+    "hint": lambda v: v if isinstance(v, str) else None,
+}
+
+def validate_state(data: Any) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """스키마에 맞는 필드만 남긴 상태와 잘못된 필드 이름 목록을 반환합니다. 객체가 아니면 (None, [])."""
+    if not isinstance(data, dict):
+        return None, []
+    state = {}
+    invalid = []
+    for key, value in data.items():
+        validator = STATE_SCHEMA.get(key)
+        if validator is None:
+            continue
+        checked = validator(value)
+        if checked is None:
+            invalid.append(key)
+        else:
+            state[key] = checked
+    return state, invalid
+
+def _load_payload(payload: str) -> Any:
+    payload = payload.strip()
+    try:
+        return json.loads(payload)
+    except ValueError:
+        # 프롬프트 예시의 이스케이프가 그대로 나온 {{...}} 형태 허용
+        if payload.startswith("{{") and payload.endswith("}}"):
+            return json.loads(payload.replace("{{", "{").replace("}}", "}"))
+        raise
+
+class TutorStateExtractor:
+    """튜터 응답에서 숨김 상태 메타데이터(<!-- {...} --> 또는 <STATE>{...}</STATE>)를 떼어 내는 파서
+
+    스트리밍 청크를 feed()로 넣으면 학생에게 보여줄 텍스트만 돌려주고, 메타데이터는 한 번만 훑어 모은다.
+    청크 경계에 걸친 표시는 다음 청크까지 버퍼에 남겨 두며, 여러 블록이 있으면 마지막으로 검증된 상태를 사용한다.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside: Optional[Tuple[str, str, str]] = None
+        self._payload: List[str] = []
+        self._payload_length = 0
+        self._blocks = 0
+        self.state: Optional[Dict[str, Any]] = None
+        self.format: Optional[str] = None
+
+    def feed(self, chunk: str) -> str:
+        """청크를 처리하고 지금까지 확정된 화면 표시용 텍스트를 반환합니다."""
+        self._buffer += chunk
+        visible = []
+        while self._buffer:
+            if self._inside is None:
+                found = None
+                for marker in STATE_MARKERS:
+                    index = self._buffer.find(marker[0])
+                    if index != -1 and (found is None or index < found[0]):
+                        found = (index, marker)
+                if found is None:
+                    # 여는 표시의 앞부분일 수 있는 끝부분만 남기고 내보냄
+                    keep = self._partial_suffix(self._buffer, [m[0] for m in STATE_MARKERS])
+                    visible.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                index, marker = found
+                visible.append(self._buffer[:index])
+                self._buffer = self._buffer[index + len(marker[0]):]
+                self._inside = marker
+                self._payload = []
+                self._payload_length = 0
+            else:
+                close_marker = self._inside[1]
+                index = self._buffer.find(close_marker)
+                if index == -1:
+                    keep = self._partial_suffix(self._buffer, [close_marker])
+                    self._append_payload(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                self._append_payload(self._buffer[:index])
+                self._buffer = self._buffer[index + len(close_marker):]
+                self._close_block()
+        return "".join(visible)
+
+    def finish(self) -> str:
+        """남은 버퍼를 내보내고 파싱을 마칩니다. 닫히지 않은 메타데이터는 화면에 보이지 않게 버립니다."""
+        if self._inside is not None:
+            self._append_payload(self._buffer)
+            self._buffer = ""
+            self._close_block(terminated=False)
+        rest, self._buffer = self._buffer, ""
+        if self._blocks == 0:
+            metrics.TUTOR_STATE_PARSES.inc(1.0, "none", "missing")
+        return rest
+
+    @classmethod
+    def extract(cls, text: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """전체 응답에서 (화면 표시용 텍스트, 검증된 상태)를 반환합니다."""
+        extractor = cls()
+        visible = extractor.feed(text) + extractor.finish()
+        return visible.strip(), extractor.state
+
+    @staticmethod
+    def _partial_suffix(text: str, markers: List[str]) -> int:
+        """text 끝부분이 markers 중 하나의 앞부분과 겹치는 최대 길이를 반환합니다."""
+        longest = 0
+        for marker in markers:
+            for length in range(min(len(marker) - 1, len(text)), longest, -1):
+                if marker.startswith(text[-length:]):
+                    longest = length
+                    break
+        return longest
+
+    def _append_payload(self, text: str) -> None:
+        if self._payload_length <= MAX_STATE_LENGTH:
+            self._payload.append(text)
+            self._payload_length += len(text)
+
+    def _close_block(self, terminated: bool = True) -> None:
+        marker_format = self._inside[2]
+        payload = "".join(self._payload)
+        self._inside = None
+        self._payload = []
+        self._blocks += 1
+        if not terminated:
+            metrics.TUTOR_STATE_PARSES.inc(1.0, marker_format, "unterminated")
+            logger.debug("닫히지 않은 튜터 상태 메타데이터: %.200s", payload)
+            return
+        if self._payload_length > MAX_STATE_LENGTH:
+            metrics.TUTOR_STATE_PARSES.inc(1.0, marker_format, "too_large")
+            return
+        try:
+            data = _load_payload(payload)
+        except ValueError:
+            metrics.TUTOR_STATE_PARSES.inc(1.0, marker_format, "invalid_json")
+            logger.debug("튜터 상태 메타데이터 JSON 파싱 실패: %.200s", payload)
+            return
+        state, invalid = validate_state(data)
+        if state is None:
+            metrics.TUTOR_STATE_PARSES.inc(1.0, marker_format, "invalid_json")
+            return
+        if invalid:
+            metrics.TUTOR_STATE_PARSES.inc(1.0, marker_format, "invalid_fields")
+            logger.debug("튜터 상태 메타데이터 필드 검증 실패: %s", invalid)
+        else:
+            metrics.TUTOR_STATE_PARSES.inc(1.0, marker_format, "ok")
+        self.state = state
+        self.format = marker_format
@@ -0,0 +1,429 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 사용량 파일 (여러 워커가 함께 쓰므로 잠금 파일로 보호)
+USAGE_FILE = os.getenv("USAGE_FILE", "app/api_tot_usage.json")
+USAGE_LOCK_FILE = USAGE_FILE + ".lock"
+# 워커의 누적분을 파일에 합치는 간격(초). 다른 워커의 사용량은 이 간격만큼 늦게 보임
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+# 해상도별 보관 기간. 분 단위는 짧게 두고 시간/일 단위 집계만 오래 보관 (다운샘플링)
+USAGE_MINUTE_RETENTION_HOURS = int(os.getenv("USAGE_MINUTE_RETENTION_HOURS", "24"))
+USAGE_HOUR_RETENTION_DAYS = int(os.getenv("USAGE_HOUR_RETENTION_DAYS", "30"))
+USAGE_DAY_RETENTION_DAYS = int(os.getenv("USAGE_DAY_RETENTION_DAYS", "730"))
+# 시간/일 버킷 경계 기준 시간대 (기본: KST)
+USAGE_UTC_OFFSET_HOURS = int(os.getenv("USAGE_UTC_OFFSET_HOURS", "9"))
+# 시계열 조회 시 한 번에 반환하는 최대 버킷 수
+USAGE_MAX_POINTS = int(os.getenv("USAGE_MAX_POINTS", "1500"))
+# /usage에 함께 보여주는 최근 요청 수
+USAGE_RECENT_SIZE = 10
+# 시간/일 버킷 하나에 두는 최대 태그 조합 수. 넘치면 새 사용자는 USER_OTHER로 합쳐 파일 크기를 제한
+USAGE_MAX_ROWS_PER_BUCKET = int(os.getenv("USAGE_MAX_ROWS_PER_BUCKET", "500"))
+
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+TAGS = ("request_type", "model", "user", "cache")
+_USER_INDEX = TAGS.index("user")
+# 사용자 태그를 보관하는 해상도. 분 버킷에는 사용자 구분 없이 USER_UNTRACKED로 기록
+USER_RESOLUTIONS = ("hour", "day")
+USER_UNTRACKED = "*"
+USER_OTHER = "other"
+# 버킷 값: 요청 수, 프롬프트 토큰, 응답 토큰, 총 토큰
+FIELDS = ("requests", "prompt_tokens", "response_tokens", "total_tokens")
+
+_TZ = timezone(timedelta(hours=USAGE_UTC_OFFSET_HOURS))
+_OFFSET = USAGE_UTC_OFFSET_HOURS * 3600
+
+# {해상도: {버킷 시작(epoch 초): {(request_type, model, user, cache): [requests, prompt, response, total]}}}
+Buckets = Dict[str, Dict[int, Dict[Tuple[str, ...], List[int]]]]
+
+def _empty_buckets() -> Buckets:
+    return {resolution: {} for resolution in RESOLUTIONS}
+
+def bucket_start(ts: float, resolution: str) -> int:
+    """ts가 속한 버킷의 시작 시각을 반환합니다 (시간/일 경계는 USAGE_UTC_OFFSET_HOURS 기준)."""
+    size = RESOLUTIONS[resolution]
+    return int((ts + _OFFSET) // size * size - _OFFSET)
+
+def format_ts(ts: float) -> str:
+    return datetime.fromtimestamp(ts, _TZ).isoformat()
+
+def parse_ts(value: str) -> float:
+    """ISO 8601 문자열 또는 epoch 초를 epoch 초로 변환합니다. 시간대가 없으면 USAGE_UTC_OFFSET_HOURS로 봅니다."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=_TZ)
+    return parsed.timestamp()
+
+def _add(target: Buckets, source: Buckets) -> None:
+    for resolution, buckets in source.items():
+        target_buckets = target.setdefault(resolution, {})
+        for start, rows in buckets.items():
+            target_rows = target_buckets.setdefault(start, {})
+            for tags, values in rows.items():
+                current = target_rows.get(tags)
+                if current is None:
+                    target_rows[tags] = list(values)
+                else:
+                    for i, value in enumerate(values):
+                        current[i] += value
+
+@contextmanager
+def usage_file_lock(exclusive: bool = True):
+    """사용량 파일을 읽고 쓰는 동안 다른 워커 프로세스와의 경합을 막습니다."""
+    with open(USAGE_LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class UsageStore:
+    """LLM 토큰 사용량을 분/시간/일 버킷으로 미리 집계해 보관하는 시계열 저장소
+
+    - record()는 요청 하나를 세 해상도의 버킷에 동시에 더합니다 (request_type, model, user, cache 태그별).
+      사용자 태그는 시간/일 버킷에만 남기고, 버킷당 태그 조합이 USAGE_MAX_ROWS_PER_BUCKET을 넘으면 USER_OTHER로 합칩니다.
+    - 보관 기간이 지난 분/시간 버킷은 지우고 더 큰 버킷만 남깁니다. 원본 요청 목록은 저장하지 않습니다.
+    - 기록은 메모리에만 하고 USAGE_FLUSH_INTERVAL마다 파일에 합치므로, 요청 경로에서 파일 I/O가 없습니다.
+    - 구간 조회는 구간을 덮는 가장 큰 버킷들(일 → 시간 → 분)로 나눠 읽으므로 요청 수와 무관한 비용으로 응답합니다.
+    """
+
+    def __init__(self, path: str = USAGE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # 파일에 합쳐진 전체 상태 + 아직 합치지 않은 이 워커의 누적분 (조회용)
+        self._view = self._empty_state()
+        # 아직 파일에 합치지 않은 이 워커의 누적분
+        self._pending = self._empty_state()
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _empty_state() -> Dict[str, Any]:
+        return {"total_requests": 0, "total_tokens": 0, "recent": [], "buckets": _empty_buckets()}
+
+    def record(self, prompt_tokens: int, response_tokens: int, total_tokens: int, model_name: str,
+               request_type: str = "chat", user: Optional[object] = None, cache_hit: bool = False,
+               ts: Optional[float] = None) -> Dict[str, Any]:
+        """요청 하나의 사용량을 분/시간/일 버킷에 더하고 기록한 요청 정보를 반환합니다."""
+        ts = time.time() if ts is None else ts
+        tags = (request_type, str(model_name), "anonymous" if user is None else str(user), "hit" if cache_hit else "miss")
+        values = [1, int(prompt_tokens), int(response_tokens), int(total_tokens)]
+        request_info = {
+            "timestamp": format_ts(ts),
+            "request_type": request_type,
+            "model": model_name,
+            "cache_hit": cache_hit,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "total_tokens": total_tokens
+        }
+        with self._lock:
+            bucket_tags = {resolution: self._bucket_tags(resolution, bucket_start(ts, resolution), tags)
+                           for resolution in RESOLUTIONS}
+            for state in (self._view, self._pending):
+                for resolution in RESOLUTIONS:
+                    rows = state["buckets"][resolution].setdefault(bucket_start(ts, resolution), {})
+                    tags = bucket_tags[resolution]
+                    current = rows.get(tags)
+                    if current is None:
+                        rows[tags] = list(values)
+                    else:
+                        for i, value in enumerate(values):
+                            current[i] += value
+                if not cache_hit:
+                    state["total_requests"] += 1
+                    state["total_tokens"] += int(total_tokens)
+                state["recent"] = (state["recent"] + [request_info])[-USAGE_RECENT_SIZE:]
+        return request_info
+
+    def _bucket_tags(self, resolution: str, start: int, tags: Tuple[str, ...]) -> Tuple[str, ...]:
+        """버킷에 기록할 태그를 반환합니다. 사용자 태그는 클라이언트마다 달라지므로 보관 해상도와 개수를 제한합니다."""
+        if resolution not in USER_RESOLUTIONS:
+            user = USER_UNTRACKED
+        else:
+            rows = self._view["buckets"][resolution].get(start, {})
+            if tags in rows or len(rows) < USAGE_MAX_ROWS_PER_BUCKET:
+                return tags
+            user = USER_OTHER
+        return tags[:_USER_INDEX] + (user,) + tags[_USER_INDEX + 1:]
+
+    def totals(self) -> Dict[str, int]:
+        """누적 LLM 호출 수와 토큰 수 (캐시 응답 제외)"""
+        self._ensure_loaded()
+        with self._lock:
+            return {"total_requests": self._view["total_requests"], "total_tokens": self._view["total_tokens"]}
+
+    def recent(self) -> List[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._view["recent"])
+
+    def _read_file(self) -> Dict[str, Any]:
+        """사용량 파일을 읽습니다. 원본 요청 목록만 있던 이전 형식이면 버킷으로 변환합니다."""
+        state = self._empty_state()
+        if not os.path.exists(self.path):
+            return state
+        # 읽지 못하면 예외를 그대로 올려 기존 파일을 덮어쓰지 않음
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        state["total_requests"] = int(data.get("total_requests", 0))
+        state["total_tokens"] = int(data.get("total_tokens", 0))
+        state["recent"] = data.get("recent", [])
+        for resolution, rows in data.get("buckets", {}).items():
+            if resolution not in RESOLUTIONS:
+                continue
+            target = state["buckets"][resolution]
+            for row in rows:
+                start, tags, values = int(row[0]), tuple(row[1:1 + len(TAGS)]), row[1 + len(TAGS):]
+                target.setdefault(start, {})[tags] = [int(v) for v in values]
+        if data.get("requests"):
+            migrated = self._migrate_requests(data["requests"])
+            _add(state["buckets"], migrated)
+            state["recent"] = data["requests"][-USAGE_RECENT_SIZE:]
+        return state
+
+    @staticmethod
+    def _migrate_requests(requests: Iterable[Dict[str, Any]]) -> Buckets:
+        """이전 형식의 요청 목록을 버킷으로 집계합니다."""
+        buckets = _empty_buckets()
+        for request in requests:
+            try:
+                ts = parse_ts(request["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            values = [1, int(request.get("prompt_tokens", 0)), int(request.get("response_tokens", 0)),
+                      int(request.get("total_tokens", 0))]
+            for resolution in RESOLUTIONS:
+                user = "anonymous" if resolution in USER_RESOLUTIONS else USER_UNTRACKED
+                tags = (request.get("request_type", "chat"), str(request.get("model")), user, "miss")
+                _add(buckets, {resolution: {bucket_start(ts, resolution): {tags: values}}})
+        return buckets
+
+    def _write_file(self, state: Dict[str, Any]) -> None:
+        data = {
+            "version": 2,
+            "total_requests": state["total_requests"],
+            "total_tokens": state["total_tokens"],
+            "recent": state["recent"],
+            "buckets": {
+                resolution: [[start, *tags, *values] for start, rows in sorted(buckets.items())
+                             for tags, values in rows.items()]
+                for resolution, buckets in state["buckets"].items()
+            }
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _prune(buckets: Buckets, now: float) -> None:
+        """보관 기간이 지난 버킷을 지웁니다 (분 → 시간 → 일 순으로 짧게 보관)."""
+        cutoffs = {
+            "minute": now - USAGE_MINUTE_RETENTION_HOURS * 3600,
+            "hour": now - USAGE_HOUR_RETENTION_DAYS * 86400,
+            "day": now - USAGE_DAY_RETENTION_DAYS * 86400
+        }
+        for resolution, cutoff in cutoffs.items():
+            expired = [start for start in buckets[resolution] if start + RESOLUTIONS[resolution] <= cutoff]
+            for start in expired:
+                del buckets[resolution][start]
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.flush()
+
+    def flush(self) -> None:
+        """이 워커의 누적분을 파일에 합치고, 다른 워커의 기록이 포함된 파일 내용으로 조회용 상태를 갱신합니다."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, self._empty_state()
+            try:
+                with usage_file_lock():
+                    state = self._read_file()
+                    state["total_requests"] += pending["total_requests"]
+                    state["total_tokens"] += pending["total_tokens"]
+                    state["recent"] = (state["recent"] + pending["recent"])[-USAGE_RECENT_SIZE:]
+                    _add(state["buckets"], pending["buckets"])
+                    self._prune(state["buckets"], time.time())
+                    if pending["total_requests"] or pending["recent"] or not self._loaded:
+                        self._write_file(state)
+            except Exception as e:
+                logger.error(f"사용량 데이터 저장 오류: {e}")
+                # 다음 저장 때 다시 합치도록 누적분을 되돌림
+                with self._lock:
+                    _add(pending["buckets"], self._pending["buckets"])
+                    pending["total_requests"] += self._pending["total_requests"]
+                    pending["total_tokens"] += self._pending["total_tokens"]
+                    pending["recent"] = (pending["recent"] + self._pending["recent"])[-USAGE_RECENT_SIZE:]
+                    self._pending = pending
+                return
+            with self._lock:
+                # 저장하는 동안 들어온 기록은 아직 파일에 없으므로 조회용 상태에 다시 더함
+                _add(state["buckets"], self._pending["buckets"])
+                state["total_requests"] += self._pending["total_requests"]
+                state["total_tokens"] += self._pending["total_tokens"]
+                state["recent"] = (state["recent"] + self._pending["recent"])[-USAGE_RECENT_SIZE:]
+                self._view = state
+                self._loaded = True
+
+    def start(self) -> None:
+        """주기적 저장 루프를 시작합니다 (이미 실행 중이면 무시)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"사용량 저장 루프 오류: {e}")
+            await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+
+    async def close(self) -> None:
+        """저장 루프를 멈추고 남은 누적분을 저장합니다 (종료 시 호출)."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def _cover(self, start: int, end: int, buckets: Buckets,
+               finest: str = "minute") -> Tuple[List[Tuple[str, int]], bool]:
+        """[start, end) 구간을 덮는 가장 큰 버킷 목록과, 보관 기간 때문에 구간을 벗어난 버킷을 썼는지 여부를 반환합니다.
+
+        분 단위로 맞춘 구간은 양 끝의 분/시간 버킷(최대 59 + 23개씩)과 가운데 일 버킷으로 나뉘므로,
+        읽는 버킷 수는 구간 길이(일 수)에만 비례하고 요청 수와는 무관합니다. finest보다 작은 버킷은 쓰지 않습니다.
+        """
+        resolutions = ("day", "hour", "minute")[:("day", "hour", "minute").index(finest) + 1]
+        cover = []
+        approximate = False
+        cursor = start
+        now = time.time()
+        # 이 시각 이후의 분/시간 버킷은 지워지지 않았음이 보장됨
+        minute_from = now - USAGE_MINUTE_RETENTION_HOURS * 3600
+        hour_from = now - USAGE_HOUR_RETENTION_DAYS * 86400
+        while cursor < end:
+            for resolution in resolutions:
+                size = RESOLUTIONS[resolution]
+                if bucket_start(cursor, resolution) == cursor and cursor + size <= end:
+                    break
+            else:
+                resolution = finest
+            # 분/시간 버킷이 보관 기간으로 지워졌으면 한 단계 큰 버킷으로 대신함 (구간보다 넓게 집계됨)
+            if resolution == "minute" and cursor < minute_from:
+                resolution = "hour"
+            if resolution == "hour" and cursor < hour_from:
+                resolution = "day"
+            bucket = bucket_start(cursor, resolution)
+            if bucket != cursor or bucket + RESOLUTIONS[resolution] > end:
+                approximate = approximate or bucket in buckets[resolution]
+            cover.append((resolution, bucket))
+            cursor = bucket + RESOLUTIONS[resolution]
+        return cover, approximate
+
+    @staticmethod
+    def _matches(tags: Tuple[str, ...], filters: Dict[str, str]) -> bool:
+        return all(tags[TAGS.index(name)] == value for name, value in filters.items())
+
+    @staticmethod
+    def _group(rows: Iterable[Tuple[Tuple[str, ...], List[int]]], group_by: List[str],
+               filters: Dict[str, str]) -> Dict[Tuple[str, ...], List[int]]:
+        grouped: Dict[Tuple[str, ...], List[int]] = {}
+        indexes = [TAGS.index(name) for name in group_by]
+        for tags, values in rows:
+            if not UsageStore._matches(tags, filters):
+                continue
+            key = tuple(tags[i] for i in indexes)
+            current = grouped.setdefault(key, [0] * len(FIELDS))
+            for i, value in enumerate(values):
+                current[i] += value
+        return grouped
+
+    @staticmethod
+    def _format_groups(grouped: Dict[Tuple[str, ...], List[int]], group_by: List[str]) -> List[Dict[str, Any]]:
+        result = [
+            {**dict(zip(group_by, key)), **dict(zip(FIELDS, values))}
+            for key, values in grouped.items()
+        ]
+        return sorted(result, key=lambda row: row["total_tokens"], reverse=True)
+
+    def query(self, start: float, end: float, resolution: Optional[str] = None,
+              group_by: Optional[List[str]] = None, filters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """[start, end) 구간의 사용량을 집계합니다.
+
+        resolution을 주면 해당 해상도의 버킷별 시계열을 함께 반환합니다.
+        group_by는 TAGS 중 일부, filters는 {태그: 값} 형식입니다. 잘못된 인자는 ValueError.
+        user로 묶거나 거르면 사용자 태그가 있는 시간/일 버킷만 읽으므로 구간을 시간 단위로 맞춥니다.
+        """
+        group_by = group_by or []
+        filters = filters or {}
+        for name in [*group_by, *filters]:
+            if name not in TAGS:
+                raise ValueError(f"알 수 없는 태그: {name} (가능: {', '.join(TAGS)})")
+        if resolution is not None and resolution not in RESOLUTIONS:
+            raise ValueError(f"알 수 없는 해상도: {resolution} (가능: {', '.join(RESOLUTIONS)})")
+        finest = "hour" if "user" in group_by or "user" in filters else "minute"
+        if resolution is not None and RESOLUTIONS[resolution] < RESOLUTIONS[finest]:
+            raise ValueError(f"user 태그는 {', '.join(USER_RESOLUTIONS)} 해상도에서만 집계합니다.")
+        # 분(사용자 태그는 시간) 단위로 맞춤 (끝 시각이 걸친 버킷은 포함)
+        range_start = bucket_start(start, finest)
+        range_end = bucket_start(end, finest)
+        if range_end < end:
+            range_end += RESOLUTIONS[finest]
+        if range_end <= range_start:
+            raise ValueError("end는 start보다 뒤여야 합니다.")
+        if resolution is not None:
+            size = RESOLUTIONS[resolution]
+            points = (bucket_start(range_end - 1, resolution) - bucket_start(range_start, resolution)) // size + 1
+            if points > USAGE_MAX_POINTS:
+                raise ValueError(f"버킷이 너무 많습니다: {points}개 (최대 {USAGE_MAX_POINTS}개). 더 큰 해상도를 사용하세요.")
+
+        self._ensure_loaded()
+        with self._lock:
+            buckets = self._view["buckets"]
+            cover, approximate = self._cover(range_start, range_end, buckets, finest)
+            rows = [item for resolution_name, bucket in cover
+                    for item in buckets[resolution_name].get(bucket, {}).items()]
+            summary = self._group(rows, group_by, filters)
+            series = None
+            if resolution is not None:
+                series = []
+                retained = buckets[resolution]
+                bucket = bucket_start(range_start, resolution)
+                while bucket < range_end:
+                    grouped = self._group(retained.get(bucket, {}).items(), group_by, filters)
+                    series.append({"start": format_ts(bucket), "groups": self._format_groups(grouped, group_by)})
+                    bucket += RESOLUTIONS[resolution]
+
+        result = {
+            "start": format_ts(range_start),
+            "end": format_ts(range_end),
+            "group_by": group_by,
+            "filters": filters,
+            "buckets_read": len(cover),
+            # 보관 기간이 지나 구간보다 큰 버킷으로 집계한 경우 true
+            "approximate": approximate,
+            "totals": dict(zip(FIELDS, [sum(values[i] for values in summary.values()) for i in range(len(FIELDS))])),
+            "groups": self._format_groups(summary, group_by) if group_by else []
+        }
+        if series is not None:
+            result["resolution"] = resolution
+            result["series"] = series
+        return result
+
+# 전역 사용량 저장소
+usage_store = UsageStore()
@@ -0,0 +1,68 @@
+"""AdmissionController의 우선순위 대기열, 사용자 버킷, 취소 처리를 검사합니다."""
+import asyncio
+
+import pytest
+
+from app import admission
+from app.admission import (ANONYMOUS_USER_KEY, SYSTEM_USER_KEY, AdmissionController, AdmissionRejected,
+                           TokenBucket)
+
+def _empty_controller(per_minute=6000):
+    controller = AdmissionController()
+    controller._global = TokenBucket(per_minute)
+    controller._global.tokens = 0.0
+    return controller
+
+def test_later_tutoring_request_goes_before_queued_report(monkeypatch):
+    # 여유분 없이 순서만 검사 (여유분이 있으면 리포트는 버킷이 20% 찰 때까지 기다림)
+    monkeypatch.setitem(admission.PRIORITY_RESERVE, admission.PRIORITY_REPORT, 0.0)
+
+    async def scenario():
+        controller = _empty_controller()
+        order = []
+
+        async def request(request_type, name, user_key):
+            try:
+                await controller.admit(request_type, user_key, "", response_tokens=50)
+                order.append(name)
+            except AdmissionRejected:
+                order.append(f"{name}:rejected")
+
+        report = asyncio.create_task(request("incorrect_answer_report", "report", "user:1"))
+        await asyncio.sleep(0.05)
+        tutoring = [asyncio.create_task(request("step_by_step", f"tutor{i}", f"user:{i + 2}")) for i in range(2)]
+        batch = asyncio.create_task(request("chat", "batch", "user:9"))
+        await asyncio.gather(report, batch, *tutoring)
+        return order
+
+    order = asyncio.run(scenario())
+    # batch는 대기하지 않고 바로 거절, 튜터링은 도착 순서대로 리포트보다 먼저
+    assert order == ["batch:rejected", "tutor0", "tutor1", "report"]
+
+def test_missing_user_key_uses_anonymous_bucket():
+    async def scenario():
+        controller = AdmissionController()
+        controller._users[ANONYMOUS_USER_KEY] = TokenBucket(600)
+        controller._users[ANONYMOUS_USER_KEY].tokens = 0.0
+        with pytest.raises(AdmissionRejected):
+            await controller.admit("chat", None, "", response_tokens=50)
+        # 서버 내부 작업은 사용자 버킷 없이 전역 예산만 사용
+        assert await controller.admit("chat", SYSTEM_USER_KEY, "", response_tokens=50) == 50
+        assert SYSTEM_USER_KEY not in controller._users
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_leaves_queue_without_spending_tokens():
+    async def scenario():
+        controller = _empty_controller(600)
+        task = asyncio.create_task(controller.admit("step_by_step", "user:1", "", response_tokens=50))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        tokens_before = controller._global.tokens
+        controller._wake()
+        assert not any(controller._queues.values())
+        assert controller._global.tokens >= tokens_before
+
+    asyncio.run(scenario())
@@ -0,0 +1,187 @@
+"""LLMClient 호출 파이프라인(재시도, 회로 차단기, 헤지, 마감 시간)을 가짜 모델로 검사합니다."""
+import asyncio
+import time
+
+import pytest
+
+from app import llm_client
+from app.llm_client import (CircuitBreaker, FakeModel, FakeProviderError, FakeResponse, LLMClient, LLMError,
+                            deadline_scope)
+
+class ScriptedModel(FakeModel):
+    """호출 순서대로 첫 조각까지의 지연 시간(초) 또는 발생시킬 예외를 정해 둔 가짜 모델"""
+
+    def __init__(self, script, chunks=1, chunk_delay=0.05):
+        super().__init__(latency=0.0, chunks=chunks)
+        self.script = list(script)
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self.responses = []
+
+    def generate_content(self, prompt, stream=False, request_options=None, generation_config=None):
+        step = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        response = FakeResponse("가짜 응답입니다.", len(prompt) // 4, self.chunks, self.chunk_delay)
+        # 호출 순서대로 기록 (응답이 끝나는 순서와 무관)
+        self.responses.append(response)
+        if isinstance(step, Exception):
+            raise step
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and step > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("가짜 모델 응답 시간 초과")
+        time.sleep(step)
+        return response
+
+class ClientError(Exception):
+    code = 400
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(llm_client, "LLM_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_DELAY", 0.0)
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_streams_a_response_from_the_fake_provider():
+    model = FakeModel(latency=0.02, failure_rate=0.0, chunks=4)
+    client = LLMClient(model, "fake")
+
+    response = run(client.generate("문제", "chat"))
+
+    assert response.chunks_served == 4
+    assert response.usage_metadata.total_token_count > 0
+    assert client.hedge_delay("chat") is None
+
+def test_retries_transient_errors_then_succeeds():
+    model = ScriptedModel([FakeProviderError("일시 오류"), FakeProviderError("일시 오류"), 0.01])
+    client = LLMClient(model, "fake")
+
+    response = run(client.generate("문제", "chat"))
+
+    assert model.calls == 3
+    assert response.text.startswith("가짜 응답")
+    assert client.breaker.state == "closed"
+
+def test_backoff_uses_full_jitter_with_exponential_cap(monkeypatch):
+    sleeps = []
+    bounds = []
+    real_sleep = asyncio.sleep
+
+    async def record_sleep(seconds):
+        sleeps.append(seconds)
+        await real_sleep(0)
+
+    def record_uniform(low, high):
+        bounds.append((low, high))
+        return high
+
+    monkeypatch.setattr(llm_client.asyncio, "sleep", record_sleep)
+    monkeypatch.setattr(llm_client.random, "uniform", record_uniform)
+    model = ScriptedModel([FakeProviderError("일시 오류"), FakeProviderError("일시 오류"), 0.0])
+
+    run(LLMClient(model, "fake").generate("문제", "chat"))
+
+    assert bounds[:2] == [(0, 0.01), (0, 0.02)]
+    assert sleeps == [0.01, 0.02]
+
+def test_non_retryable_error_fails_once_with_502():
+    model = ScriptedModel([ClientError("잘못된 요청")])
+    client = LLMClient(model, "fake")
+
+    with pytest.raises(LLMError) as exc_info:
+        run(client.generate("문제", "chat"))
+
+    assert exc_info.value.status_code == 502
+    assert model.calls == 1
+    assert client.breaker.state == "closed"
+
+def test_breaker_opens_then_half_opens_and_closes_on_success(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_ATTEMPTS", 1)
+    model = ScriptedModel([FakeProviderError("일시 오류"), FakeProviderError("일시 오류"), 0.0])
+    client = LLMClient(model, "fake")
+    client.breaker = CircuitBreaker(failure_threshold=2, cooldown=0.2)
+
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            run(client.generate("문제", "chat"))
+    assert client.breaker.state == "open"
+
+    # 열려 있는 동안은 모델을 호출하지 않고 Retry-After와 함께 거절
+    with pytest.raises(LLMError) as exc_info:
+        run(client.generate("문제", "chat"))
+    assert model.calls == 2
+    assert exc_info.value.status_code == 503
+    assert "Retry-After" in exc_info.value.headers
+
+    time.sleep(0.25)
+    assert client.breaker.state == "half_open"
+    run(client.generate("문제", "chat"))
+    assert model.calls == 3
+    assert client.breaker.state == "closed"
+
+def test_failed_probe_reopens_breaker(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_ATTEMPTS", 1)
+    model = ScriptedModel([FakeProviderError("일시 오류")])
+    client = LLMClient(model, "fake")
+    client.breaker = CircuitBreaker(failure_threshold=1, cooldown=0.1)
+
+    with pytest.raises(LLMError):
+        run(client.generate("문제", "chat"))
+    time.sleep(0.15)
+    assert client.breaker.state == "half_open"
+    with pytest.raises(LLMError):
+        run(client.generate("문제", "chat"))
+    assert client.breaker.state == "open"
+
+def test_hedge_returns_faster_backup_and_stops_the_slow_stream(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_HEDGE_DELAY", 0.05)
+    # 첫 요청은 첫 조각이 늦고 이후 여러 조각을 스트리밍, 헤지 요청은 바로 응답
+    model = ScriptedModel([0.3, 0.0], chunks=20, chunk_delay=0.0)
+    client = LLMClient(model, "fake")
+
+    start = time.monotonic()
+    run(client.generate("문제", "chat", hedge=True))
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.3
+    assert model.calls == 2
+    # 진 쪽 스레드는 취소 플래그를 보고 스트림을 끝까지 읽지 않음 (조각 간격을 두어 확인)
+    slow = model.responses[0]
+    slow.chunk_delay = 0.02
+    time.sleep(0.6)
+    assert slow.chunks_served <= 1
+
+def test_deadline_expiry_raises_without_waiting_for_the_model():
+    # 첫 조각은 바로 오지만 스트림 전체는 마감 시간보다 오래 걸리는 응답
+    model = ScriptedModel([0.0], chunks=50, chunk_delay=0.05)
+    client = LLMClient(model, "fake")
+
+    start = time.monotonic()
+    with pytest.raises(LLMError) as exc_info:
+        run(client.generate("문제", "chat", deadline=0.2))
+    elapsed = time.monotonic() - start
+
+    assert exc_info.value.status_code == 503
+    assert elapsed < 1.0
+    # 시간이 초과된 호출은 스트림 읽기를 멈추고 모델 스레드를 놓아 줌
+    time.sleep(0.3)
+    served = [response.chunks_served for response in model.responses]
+    time.sleep(0.3)
+    assert [response.chunks_served for response in model.responses] == served
+    assert all(count < 50 for count in served)
+
+def test_deadline_scope_caps_calls_inside_it():
+    model = ScriptedModel([2.0])
+    client = LLMClient(model, "fake")
+
+    async def scoped():
+        with deadline_scope(0.1):
+            return await client.generate("문제", "chat", deadline=30)
+
+    start = time.monotonic()
+    with pytest.raises(LLMError):
+        run(scoped())
+    assert time.monotonic() - start < 1.0
@@ -0,0 +1,59 @@
+"""QuizChecker가 미니퀴즈 답을 정규화해 채점하고, 판단할 수 없는 답은 LLM에 넘기는지(None) 검사합니다."""
+import pytest
+
+from app.quiz_checker import MAX_ATTEMPTS_PER_STEP, QuizChecker
+
+CHOICE = {"type": "choice", "expected": ["②"], "hint": "부호를 먼저 봐.", "choices": "① 3  ② 5  ③ 7  ④ 9"}
+OX = {"type": "ox", "expected": ["O"]}
+BLANK = {"type": "blank", "expected": ["x+7"]}
+NUMBER = {"type": "blank", "expected": ["\\frac{1}{2}"]}
+
+@pytest.mark.parametrize("quiz, answer, expected", [
+    (CHOICE, "②", True),
+    (CHOICE, "2번", True),
+    (CHOICE, "(2)", True),
+    (CHOICE, "3번이요", False),
+    (OX, "맞아요", True),
+    (OX, "o", True),
+    (OX, "X", False),
+    (OX, "아니야!", False),
+    (BLANK, "$x + 7$", True),
+    (BLANK, "x+8", None),
+    (NUMBER, "0.5", True),
+    (NUMBER, "1/2", True),
+    (NUMBER, "1/3", False),
+])
+def test_grade_normalizes_answers(quiz, answer, expected):
+    assert QuizChecker.grade(quiz, answer) is expected
+
+@pytest.mark.parametrize("quiz, answer", [
+    (CHOICE, "잘 모르겠어"),
+    (OX, "음 글쎄"),
+    # 식의 동치 판단은 서버에서 하지 않음
+    (BLANK, "7+x"),
+    (BLANK, "   "),
+    (None, "2"),
+    ({"type": "essay", "expected": ["2"]}, "2"),
+])
+def test_grade_defers_to_llm(quiz, answer):
+    assert QuizChecker.grade(quiz, answer) is None
+
+def test_quiz_from_state_keeps_choice_lines():
+    state = {"quiz_type": "Choice", "expected_answer": "②", "hint": "부호를 먼저 봐."}
+    quiz = QuizChecker.quiz_from_state(state, "다음 중 알맞은 것은?\n① 3  ② 5\n③ 7  ④ 9")
+    assert quiz == {"type": "choice", "expected": ["②"], "hint": "부호를 먼저 봐.", "choices": "① 3  ② 5\n③ 7  ④ 9"}
+    assert QuizChecker.quiz_from_state({"quiz_type": "blank", "expected_answer": ""}) is None
+
+def test_wrong_answer_feedback_follows_attempt_rules():
+    first = QuizChecker.wrong_answer_feedback(CHOICE, 1)
+    assert "힌트" not in first
+    assert CHOICE["choices"] in first
+
+    second = QuizChecker.wrong_answer_feedback(CHOICE, 2)
+    assert "힌트: 부호를 먼저 봐." in second
+
+    assert "O 또는 X" in QuizChecker.wrong_answer_feedback(OX, 1)
+
+    last = QuizChecker.wrong_answer_feedback(CHOICE, MAX_ATTEMPTS_PER_STEP)
+    assert "정답은 ②이야." in last
+    assert "정답은 x+7이야." in QuizChecker.wrong_answer_feedback(BLANK, MAX_ATTEMPTS_PER_STEP)
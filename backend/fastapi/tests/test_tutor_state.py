@@ -0,0 +1,39 @@
+"""튜터 응답의 숨김 메타데이터(미니퀴즈 정답 포함)가 화면 표시용 텍스트에 남지 않는지 검사합니다."""
+import pytest
+
+from app.tutor_state import TutorStateExtractor
+
+BODY = "좋아! 이번에는 퀴즈야.\n어떤 수보다 7 큰 수를 식으로 써 볼래?"
+STATE = '{"current_step":2, "attempts":{"2":0}, "steps_total":4, "quiz_type":"blank", "expected_answer":"x+7", "hint":"상수는 7이야."}'
+
+def _assert_hidden(visible):
+    assert visible == BODY
+    assert "expected_answer" not in visible
+    assert "x+7" not in visible
+
+@pytest.mark.parametrize("text", [
+    f"{BODY}\n<!-- {STATE} -->",
+    f"{BODY}\n<STATE>{STATE}</STATE>",
+    f"{BODY}\n<!-- {{{STATE}}} -->",
+])
+def test_extract_strips_state_and_keeps_quiz(text):
+    visible, state = TutorStateExtractor.extract(text)
+    _assert_hidden(visible)
+    assert state["expected_answer"] == "x+7"
+    assert state["current_step"] == 2
+
+def test_feed_strips_marker_split_across_chunks():
+    text = f"{BODY}\n<!-- {STATE} -->"
+    extractor = TutorStateExtractor()
+    visible = "".join(extractor.feed(text[i:i + 3]) for i in range(0, len(text), 3)) + extractor.finish()
+    _assert_hidden(visible.strip())
+    assert extractor.state["quiz_type"] == "blank"
+
+@pytest.mark.parametrize("text", [
+    f"{BODY}\n<!-- {STATE}",
+    f"{BODY}\n<!-- {STATE[:-1]}, -->",
+])
+def test_broken_state_is_still_hidden(text):
+    visible, state = TutorStateExtractor.extract(text)
+    _assert_hidden(visible)
+    assert state is None
@@ -0,0 +1,46 @@
+"""UsageStore가 클라이언트마다 달라지는 사용자 태그를 제한된 해상도와 개수로만 보관하는지 검사합니다."""
+import pytest
+
+from app import usage_store as usage_module
+from app.usage_store import USER_OTHER, USER_UNTRACKED, UsageStore, bucket_start
+
+NOW = 1_760_000_000
+
+def _store(tmp_path):
+    store = UsageStore(str(tmp_path / "usage.json"))
+    store._loaded = True
+    return store
+
+def _users(store, resolution):
+    rows = store._view["buckets"][resolution][bucket_start(NOW, resolution)]
+    return {tags[2] for tags in rows}
+
+def test_user_tag_is_kept_only_at_hour_and_day(tmp_path):
+    store = _store(tmp_path)
+    store.record(10, 5, 15, "m", "chat", user="user:1", ts=NOW)
+    store.record(10, 5, 15, "m", "chat", user="ip:10.0.0.1", ts=NOW)
+    assert _users(store, "minute") == {USER_UNTRACKED}
+    assert _users(store, "hour") == {"user:1", "ip:10.0.0.1"}
+    assert _users(store, "day") == {"user:1", "ip:10.0.0.1"}
+
+def test_new_users_fold_into_other_when_bucket_is_full(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_module, "USAGE_MAX_ROWS_PER_BUCKET", 2)
+    store = _store(tmp_path)
+    for i in range(5):
+        store.record(1, 1, 2, "m", "chat", user=f"ip:10.0.0.{i}", ts=NOW)
+    store.record(1, 1, 2, "m", "chat", user="ip:10.0.0.0", ts=NOW)
+    assert _users(store, "hour") == {"ip:10.0.0.0", "ip:10.0.0.1", USER_OTHER}
+    rows = store._view["buckets"]["hour"][bucket_start(NOW, "hour")]
+    assert rows[("chat", "m", "ip:10.0.0.0", "miss")][0] == 2
+    assert rows[("chat", "m", USER_OTHER, "miss")][0] == 3
+
+def test_user_query_reads_hour_buckets_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_module.time, "time", lambda: NOW + 60)
+    store = _store(tmp_path)
+    store.record(10, 5, 15, "m", "chat", user="user:1", ts=NOW)
+    result = store.query(NOW - 120, NOW + 60, group_by=["user"])
+    assert [row["user"] for row in result["groups"]] == ["user:1"]
+    assert result["groups"][0]["total_tokens"] == 15
+    assert result["start"] == usage_module.format_ts(bucket_start(NOW - 120, "hour"))
+    with pytest.raises(ValueError):
+        store.query(NOW - 120, NOW + 60, resolution="minute", group_by=["user"])
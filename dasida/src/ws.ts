@@ -1,12 +1,31 @@
 import { ENV } from "./env";
 
+// 재연결 시 이어받을 위치 (conversation_id별 마지막으로 받은 메시지 id와 로그 epoch)
+const resumePoints: Record<string, { epoch: string; lastId: number }> = {};
+
 export function connectTutor(sessionId: string, accessToken: string) {
   // 쿼리파라미터 토큰 전달(nginx → FastAPI)
-  const ws = new WebSocket(`${ENV.WS}/ws/tutor/${sessionId}?token=${accessToken}`);
+  const resume = resumePoints[sessionId];
+  const query = resume ? `&last_id=${resume.lastId}&epoch=${resume.epoch}` : "";
+  const ws = new WebSocket(`${ENV.WS}/ws/tutor/${sessionId}?token=${accessToken}${query}`);
   ws.onopen = () => console.log("WS open");
-  ws.onmessage = e => console.log("WS:", e.data);
+  ws.onmessage = e => {
+    const frame = JSON.parse(e.data);
+    if (frame.type === "hello" || frame.type === "resync") {
+      // epoch가 바뀌면 이전 로그의 id는 의미가 없으므로 처음부터 이어받음
+      const previous = resumePoints[sessionId];
+      const lastId = previous && previous.epoch === frame.epoch ? previous.lastId : 0;
+      resumePoints[sessionId] = { epoch: frame.epoch, lastId };
+    } else if (frame.type === "ping") {
+      ws.send(JSON.stringify({ type: "pong" }));
+      return;
+    } else if (frame.type === "message") {
+      resumePoints[sessionId] = { ...resumePoints[sessionId], lastId: frame.id };
+      ws.send(JSON.stringify({ type: "ack", id: frame.id }));
+    }
+    console.log("WS:", frame);
+  };
   ws.onerror = e => console.log("WS error", e);
   ws.onclose = () => console.log("WS close");
   return ws;
 }
-